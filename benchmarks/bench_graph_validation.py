@@ -0,0 +1,71 @@
+# Compares marshmallow `Graph`/`WrappedGraph` loading against the compiled
+# checkers of `fast_schema`. Run it from the repo root:
+#
+#     $ python -m benchmarks.bench_graph_validation --sizes 10000 100000
+import argparse
+import time
+
+from mystery_graph_bot.fast_schema import compile_checker
+from mystery_graph_bot.serializers import WrappedGraph
+
+
+DEFAULT_SIZES = [10000, 100000, 1000000]
+
+
+def make_wrapped_graph(link_count):
+    node_count = max(2, link_count // 10)
+    return {
+        'etag': 'deadbeef',
+        'graph': {
+            'links': [
+                {
+                    'source': i % node_count,
+                    'target': (i * 7 + 1) % node_count,
+                    'value': 'lik' if i % 3 else 'nom',
+                }
+                for i in range(link_count)
+            ],
+            'nodes': [
+                {'index': i, 'name': 'node{}'.format(i)}
+                for i in range(node_count)
+            ],
+        },
+    }
+
+
+def best_of(repeat, function, *args):
+    timings = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        function(*args)
+        timings.append(time.perf_counter() - start_time)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    check_wrapped_graph = compile_checker(WrappedGraph)
+    print('{:>10} {:>16} {:>16} {:>9}'.format(
+        'links', 'marshmallow (s)', 'compiled (s)', 'speedup'
+    ))
+    for size in args.sizes:
+        wrapped_graph = make_wrapped_graph(size)
+        assert check_wrapped_graph(wrapped_graph)
+        marshmallow_time = best_of(
+            args.repeat, WrappedGraph(strict=True).load, wrapped_graph
+        )
+        compiled_time = best_of(
+            args.repeat, check_wrapped_graph, wrapped_graph
+        )
+        print('{:>10} {:>16.4f} {:>16.4f} {:>8.1f}x'.format(
+            size, marshmallow_time, compiled_time,
+            marshmallow_time / compiled_time
+        ))
+
+
+if __name__ == '__main__':
+    main()
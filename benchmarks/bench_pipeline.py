@@ -0,0 +1,206 @@
+# Times every stage of a polling cycle (fetch, crunch, notify, save) on
+# synthetic graphs served from a local HTTP server, with a fake Telegram
+# bot, and reports the peak memory allocated by each stage. Every size runs
+# three cycles: the first poll (`cold`), a poll answered with 304
+# (`unchanged`) and a poll of a slightly changed graph (`changed`). Run it
+# from the repo root:
+#
+#     $ python -m benchmarks.bench_pipeline --sizes 1000 10000 100000
+from tempfile import TemporaryDirectory
+import argparse
+import logging
+import os
+import resource
+import time
+import tracemalloc
+
+from mystery_graph_bot.clique_tracker import CliqueTracker
+from mystery_graph_bot.graph_cruncher import GraphCruncher
+from mystery_graph_bot.graph_data import GraphData, make_data_pair
+from mystery_graph_bot.graph_diff import GraphDiffer
+from mystery_graph_bot.graph_fetcher import GraphFetcher
+from mystery_graph_bot.graph_notifier import GraphNotifier
+from mystery_graph_bot.graph_saver import GraphSaver
+from mystery_graph_bot.http_client import GraphHttpClient
+from mystery_graph_bot.mystery_graph_bot import MysteryGraphBot
+from mystery_graph_bot.serializers import Graph
+from mystery_graph_bot.snapshot_file import SnapshotStore
+from mystery_graph_bot.telegram_sender import TelegramSender
+from mystery_graph_bot.util import load_data_with_schema_from_string
+
+from .stand_ins import FakeBot, GraphServer
+from .synthetic_graph import encode_graph, make_graph, mutate_graph
+
+
+DEFAULT_SIZES = [1000, 10000, 100000, 1000000]
+CYCLES = ['cold', 'unchanged', 'changed']
+STAGES = ['fetch', 'crunch', 'notify', 'save']
+MIB = 1024 * 1024
+
+
+class Timings:
+    def __init__(self):
+        self.results = {}
+
+    def measure(self, cycle, stage, function, *args):
+        start_time = time.perf_counter()
+        result = function(*args)
+        self.results[cycle, stage] = time.perf_counter() - start_time
+        return result
+
+
+class PeakMemory:
+    # Peak of the memory allocated by every stage, on top of what was
+    # allocated before it started.
+
+    def __init__(self):
+        self.results = {}
+
+    def measure(self, cycle, stage, function, *args):
+        tracemalloc.start()
+        try:
+            result = function(*args)
+            self.results[cycle, stage] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        return result
+
+
+class LegacyGraphData(dict):
+    def save(self):
+        pass
+
+
+def run_cycles(args, server, bodies, measure):
+    # Returns the end-to-end seconds of every cycle.
+    totals = {}
+    with TemporaryDirectory() as directory:
+        data_file = os.path.join(directory, 'graph.dat')
+        graph_data = GraphData(data_file)
+        http_client = GraphHttpClient(max_body_size=None)
+        fetcher = GraphFetcher(
+            graph_data, server.url, 60, stream=args.stream,
+            http_client=http_client
+        )
+        cruncher = GraphCruncher(
+            differ=GraphDiffer(), clique_tracker=CliqueTracker(),
+            snapshot_store=SnapshotStore(data_file + '.snapshot'),
+        )
+        bot = FakeBot(args.bot_latency)
+        # Only the cost of sending is measured, not Telegram's rate limits.
+        sender = TelegramSender(bot, global_rate=1e9, chat_rate=1e9)
+        notifier = GraphNotifier(
+            bot, list(range(args.chats)), 'http://graph.invalid/',
+            sender=sender
+        )
+        saver = GraphSaver(graph_data)
+        try:
+            for cycle, body in zip(CYCLES, bodies):
+                server.publish(body)
+                start_time = time.perf_counter()
+                wrapped_graph = measure(
+                    cycle, 'fetch', fetcher.poll_graph
+                )
+                if wrapped_graph is not None:
+                    new_data = measure(
+                        cycle, 'crunch', cruncher, wrapped_graph
+                    )
+                    data_pair = make_data_pair(graph_data, new_data)
+                    measure(cycle, 'notify', notifier.on_next, data_pair)
+                    measure(cycle, 'save', saver.on_next, data_pair)
+                totals[cycle] = time.perf_counter() - start_time
+        finally:
+            sender.shutdown()
+            http_client.close()
+            graph_data.close()
+    return totals
+
+
+def time_legacy_update_data(body):
+    # `MysteryGraphBot.update_data`, which only counts links, for reference.
+    bot = MysteryGraphBot(LegacyGraphData(), {
+        'token': '123:benchmark', 'data_file': 'unused',
+        'graph_url': 'http://graph.invalid/',
+        'graph_visualization_url': 'http://graph.invalid/',
+        'refresh_time': 60, 'chat_whitelist': [],
+    })
+    graph = load_data_with_schema_from_string(Graph(), body)
+    start_time = time.perf_counter()
+    bot.update_data('etag', graph)
+    return time.perf_counter() - start_time
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument('--nom-ratio', type=float, default=0.3)
+    parser.add_argument('--clique-size', type=int, default=8)
+    parser.add_argument(
+        '--changes', type=float, default=0.001,
+        help='fraction of links replaced in the changed cycle'
+    )
+    parser.add_argument('--chats', type=int, default=10)
+    parser.add_argument('--bot-latency', type=float, default=0.0)
+    parser.add_argument('--stream', action='store_true')
+    parser.add_argument(
+        '--no-memory', dest='memory', action='store_false',
+        help='skip the (slower) peak memory pass'
+    )
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    server = GraphServer()
+    server.start()
+    print('{:>8} {:>11} {}  {:>9}  {:>9}'.format(
+        'edges', 'cycle', ' '.join('{:>9}'.format(s) for s in STAGES),
+        'total', 'peak MiB'
+    ))
+    try:
+        for size in args.sizes:
+            graph = make_graph(
+                size, nom_ratio=args.nom_ratio, clique_size=args.clique_size
+            )
+            changed_graph = mutate_graph(
+                graph, max(1, int(size * args.changes)), args.nom_ratio
+            )
+            body = encode_graph(graph)
+            bodies = [body, body, encode_graph(changed_graph)]
+            del graph, changed_graph
+
+            timings = Timings()
+            totals = run_cycles(args, server, bodies, timings.measure)
+            peak_memory = PeakMemory()
+            if args.memory:
+                run_cycles(args, server, bodies, peak_memory.measure)
+            for cycle in CYCLES:
+                print_cycle(
+                    size, cycle, timings, totals[cycle], peak_memory
+                )
+            print('{:>8} {:>11} {:>9.4f}'.format(
+                size, 'update_data', time_legacy_update_data(body)
+            ))
+    finally:
+        server.close()
+    print('Max RSS: {:.1f} MiB'.format(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    ))
+
+
+def print_cycle(size, cycle, timings, total, peak_memory):
+    cells = []
+    for stage in STAGES:
+        seconds = timings.results.get((cycle, stage))
+        cells.append('-' if seconds is None else '{:.4f}'.format(seconds))
+    peaks = [
+        peak_memory.results[cycle, stage] for stage in STAGES
+        if (cycle, stage) in peak_memory.results
+    ]
+    peak = '{:.1f}'.format(max(peaks) / MIB) if peaks else '-'
+    print('{:>8} {:>11} {}  {:>9.4f}  {:>9}'.format(
+        size, cycle, ' '.join('{:>9}'.format(cell) for cell in cells), total,
+        peak
+    ))
+
+
+if __name__ == '__main__':
+    main()
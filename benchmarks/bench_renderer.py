@@ -0,0 +1,88 @@
+# Times the layout and SVG rendering of `GraphRenderer` on synthetic graphs
+# of growing size: the first layout (`cold`), the update after a poll of a
+# slightly changed graph (`changed`), the updates needed to finish the first
+# layout (`settle`), the first render of an ETag and a cached one. Run it
+# from the repo root:
+#
+#     $ python -m benchmarks.bench_renderer --sizes 1000 10000 100000
+import argparse
+import logging
+import time
+
+from mystery_graph_bot.graph_diff import GraphDiffer
+from mystery_graph_bot.graph_renderer import (
+    LAYOUT_ITERATIONS, MAX_LAYOUT_NODES, MAX_SVG_EDGES, GraphLayout,
+    GraphRenderer
+)
+from mystery_graph_bot.graph_snapshot import GraphSnapshot
+
+from .synthetic_graph import make_graph, mutate_graph
+
+
+DEFAULT_SIZES = [1000, 10000, 100000, 1000000]
+KIB = 1024
+
+
+def timed(function, *args):
+    start_time = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start_time
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument('--nom-ratio', type=float, default=0.3)
+    parser.add_argument(
+        '--changes', type=float, default=0.001,
+        help='fraction of links replaced in the changed cycle'
+    )
+    parser.add_argument('--iterations', type=int, default=LAYOUT_ITERATIONS)
+    parser.add_argument('--max-nodes', type=int, default=MAX_LAYOUT_NODES)
+    parser.add_argument('--max-edges', type=int, default=MAX_SVG_EDGES)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    print('{:>8} {:>7} {:>9} {:>9} {:>7} {:>9} {:>9} {:>9} {:>8}'.format(
+        'edges', 'nodes', 'cold', 'changed', 'settle', 'settled',
+        'render', 'cached', 'SVG KiB'
+    ))
+    for size in args.sizes:
+        graph = make_graph(size, nom_ratio=args.nom_ratio)
+        changed_graph = mutate_graph(
+            graph, max(1, int(size * args.changes)), args.nom_ratio
+        )
+        snapshot = GraphSnapshot.from_graph(graph)
+        changed_snapshot = GraphSnapshot.from_graph(changed_graph)
+        del graph, changed_graph
+
+        differ = GraphDiffer()
+        renderer = GraphRenderer(
+            GraphLayout(args.iterations, args.max_nodes),
+            max_edges=args.max_edges
+        )
+        _, cold = timed(renderer.update, 'cold', snapshot, differ(snapshot))
+        svg, render = timed(renderer.get_svg, 'cold')
+        _, cached = timed(renderer.get_svg, 'cold')
+        diff = differ(changed_snapshot)
+        _, changed = timed(renderer.update, 'changed', changed_snapshot, diff)
+
+        # Updates without changes, until the first layout is complete.
+        settle_updates = 0
+        start_time = time.perf_counter()
+        while renderer.layout.unsettled:
+            renderer.update('changed', changed_snapshot)
+            settle_updates += 1
+        settled = time.perf_counter() - start_time
+
+        print(
+            '{:>8} {:>7} {:>9.4f} {:>9.4f} {:>7} {:>9.4f} {:>9.4f} {:>9.6f} '
+            '{:>8.1f}'.format(
+                size, snapshot.node_count, cold, changed, settle_updates,
+                settled, render, cached, len(svg) / KIB
+            )
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+# Local stand-ins for the graph server and the Telegram bot, so the
+# benchmarks exercise the real HTTP and notification code paths offline.
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from threading import Lock, Thread
+import gzip
+import hashlib
+import time
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class GraphServer:
+    # Serves the last published body with a strong ETag, answers 304 to
+    # matching `If-None-Match` headers, and gzips the body for clients that
+    # accept it.
+
+    def __init__(self, compress=True):
+        self.compress = compress
+        self.body = b'{}'
+        self.gzipped_body = None
+        self.etag = None
+        self.request_count = 0
+        self.lock = Lock()
+        self.server = ThreadingHTTPServer(
+            ('127.0.0.1', 0), make_graph_handler(self)
+        )
+        self.thread = Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return 'http://127.0.0.1:{}/graph.json'.format(
+            self.server.server_address[1]
+        )
+
+    def publish(self, body: bytes) -> None:
+        gzipped_body = gzip.compress(body, 1) if self.compress else None
+        etag = '"{}"'.format(hashlib.sha1(body).hexdigest())
+        with self.lock:
+            self.body = body
+            self.gzipped_body = gzipped_body
+            self.etag = etag
+
+    def start(self) -> None:
+        self.thread.start()
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def make_graph_handler(graph_server: GraphServer):
+    class GraphHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            with graph_server.lock:
+                graph_server.request_count += 1
+                body = graph_server.body
+                gzipped_body = graph_server.gzipped_body
+                etag = graph_server.etag
+            if etag is not None and self.headers.get('If-None-Match') == etag:
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            if etag is not None:
+                self.send_header('ETag', etag)
+            accepts_gzip = 'gzip' in self.headers.get('Accept-Encoding', '')
+            if gzipped_body is not None and accepts_gzip:
+                body = gzipped_body
+                self.send_header('Content-Encoding', 'gzip')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return GraphHandler
+
+
+class FakeBot:
+    # Stands in for `telegram.Bot`. Every call takes `latency` seconds, like
+    # a round trip to Telegram, and is recorded.
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.sent_messages = []
+        self.lock = Lock()
+
+    def sendMessage(self, chat_id, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            self.sent_messages.append(dict(kwargs, chat_id=chat_id))
+            message_id = len(self.sent_messages)
+        return {'message_id': message_id, 'chat': {'id': chat_id}}
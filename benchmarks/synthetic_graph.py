@@ -0,0 +1,53 @@
+# Reproducible random graphs in the format served at `graph_url`.
+import json
+import random
+
+
+def make_graph(
+    edge_count, node_count=None, nom_ratio=0.3, clique_size=0, seed=0
+):
+    # `edge_count` links between `node_count` nodes (a tenth of the links by
+    # default), a `nom_ratio` of them noms. The first `clique_size` nodes
+    # are all nommed to each other, so the clique number is at least that.
+    rng = random.Random(seed)
+    if node_count is None:
+        node_count = max(2, clique_size, edge_count // 10)
+    links = [
+        {'source': source, 'target': target, 'value': 'nom'}
+        for source in range(clique_size)
+        for target in range(source + 1, clique_size)
+    ][:edge_count]
+    while len(links) < edge_count:
+        links.append(make_link(rng, node_count, nom_ratio))
+    nodes = [
+        {'index': index, 'name': 'node{}'.format(index)}
+        for index in range(node_count)
+    ]
+    return {'links': links, 'nodes': nodes}
+
+
+def mutate_graph(graph, change_count, nom_ratio=0.3, seed=1):
+    # A copy of `graph` with `change_count` random links replaced by new
+    # ones, like consecutive polls of a live graph.
+    rng = random.Random(seed)
+    links = list(graph['links'])
+    node_count = len(graph['nodes'])
+    for _ in range(min(change_count, len(links))):
+        links[rng.randrange(len(links))] = make_link(
+            rng, node_count, nom_ratio
+        )
+    return {'links': links, 'nodes': graph['nodes']}
+
+
+def make_link(rng, node_count, nom_ratio):
+    source = rng.randrange(node_count)
+    target = rng.randrange(node_count - 1)
+    if target >= source:
+        # No self links.
+        target += 1
+    value = 'nom' if rng.random() < nom_ratio else 'lik'
+    return {'source': source, 'target': target, 'value': value}
+
+
+def encode_graph(graph) -> bytes:
+    return json.dumps(graph, separators=(',', ':')).encode()
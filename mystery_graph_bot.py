@@ -1,15 +1,44 @@
+import argparse
 import json
 import sys
 import logging
 
+from mystery_graph_bot.errors import SchemaLoadError
 from mystery_graph_bot.serializers import Config
-from mystery_graph_bot.util import load_data_with_schema_from_json_path
+from mystery_graph_bot.util import (
+    load_data_with_schema_from_json_path, path_to_string
+)
 
 def main():
+    args = parse_args()
     config = load_config()
+    if args.check_config:
+        print("'mystery_graph_bot.conf' is valid.")
+        return
     setup_logger(config)
-    bot = MysteryGraphBot(config)
-    bot.start()
+    # Imported once the config is known to be valid, since it takes a while.
+    from mystery_graph_bot.main import get_graph_sources, run, run_async
+    # Only the asyncio runner can watch several graphs.
+    if args.use_asyncio or len(get_graph_sources(config)) > 1:
+        run_async(config, do_once=args.once)
+    else:
+        run(config, do_once=args.once)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='MysteryGraphBot')
+    parser.add_argument(
+        '--async', dest='use_asyncio', action='store_true',
+        help='run the polling loop on an asyncio event loop'
+    )
+    parser.add_argument(
+        '--once', action='store_true',
+        help='run a single polling cycle and exit'
+    )
+    parser.add_argument(
+        '--check-config', action='store_true',
+        help='only check that the config file is valid'
+    )
+    return parser.parse_args()
 
 def load_config():
     try:
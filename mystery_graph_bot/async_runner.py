@@ -0,0 +1,145 @@
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import logging
+
+from .graph_data import make_data_pair
+from .notification_coalescer import MAX_DELAY, NotificationCoalescer
+
+
+logger = logging.getLogger('mystery_graph_bot')
+
+
+class AsyncGraphRunner:
+    # Event loop based alternative to the Rx pipeline of `main.run`. Polls
+    # start on a fixed-rate clock (a cycle that overruns skips the ticks it
+    # missed instead of shifting all the following ones), blocking HTTP
+    # calls run concurrently in `io_executor`, messages go out through the
+    # sender of the notifier, and crunching runs in `cpu_executor`. The
+    # cruncher keeps state between cycles, so the default CPU executor has
+    # a single thread. With a `scheduler`, every tick comes the scheduler's
+    # delay after the previous one, instead of `refresh_time`.
+    # Every data pair is also passed to `observers`, before the saver. With
+    # a `profiler`, every stage of the cycle is profiled. With a
+    # `coalesce_window`, changes are notified through a
+    # `NotificationCoalescer`; the notifies it fires are profiled as
+    # `coalesced_notify` stages, as they do not belong to the cycle running
+    # at the time.
+
+    def __init__(
+        self, fetcher, cruncher, notifier, saver, graph_data,
+        refresh_time: float, loop=None, io_executor=None, cpu_executor=None,
+        scheduler=None, observers=(), profiler=None,
+        coalesce_window: float = None, coalesce_max_delay: float = MAX_DELAY
+    ):
+        self.fetcher = fetcher
+        self.cruncher = cruncher
+        self.notifier = notifier
+        self.saver = saver
+        self.graph_data = graph_data
+        self.refresh_time = refresh_time
+        self.loop = loop or asyncio.get_event_loop()
+        self.io_executor = io_executor or ThreadPoolExecutor(max_workers=16)
+        self.cpu_executor = cpu_executor or ThreadPoolExecutor(max_workers=1)
+        self.scheduler = scheduler
+        self.observers = list(observers)
+        self.profiler = profiler
+        self.coalescer = None
+        if coalesce_window is not None:
+            self.coalescer = NotificationCoalescer(
+                self.schedule_notify, coalesce_window, coalesce_max_delay
+            )
+
+    async def run(self, cycles: int = None, start_delay: float = 0) -> None:
+        if start_delay:
+            await asyncio.sleep(start_delay)
+        next_tick = self.loop.time()
+        cycle = 0
+        while cycles is None or cycle < cycles:
+            try:
+                await self.run_cycle()
+            except Exception:
+                logger.exception('Unexpected error in polling cycle')
+            cycle += 1
+            if cycles is not None and cycle >= cycles:
+                await self.flush_coalesced()
+                break
+            period = self.refresh_time
+            if self.scheduler is not None:
+                period = self.scheduler.next_delay()
+            next_tick += period
+            now = self.loop.time()
+            if next_tick < now:
+                missed = int((now - next_tick) // period) + 1
+                logger.warning(
+                    'Polling cycle overran, skipping {} tick(s)'.format(missed)
+                )
+                next_tick += missed * period
+            await asyncio.sleep(next_tick - now)
+
+    async def run_cycle(self) -> None:
+        if self.profiler is not None:
+            self.profiler.start_cycle()
+        try:
+            await self.run_stages()
+        finally:
+            if self.profiler is not None:
+                self.profiler.finish_cycle()
+
+    async def run_stages(self) -> None:
+        wrapped_graph = await self.in_io(
+            self.stage('fetch', self.fetcher.poll_graph)
+        )
+        if wrapped_graph is None:
+            return
+        new_data = await self.loop.run_in_executor(
+            self.cpu_executor, self.stage('crunch', self.cruncher),
+            wrapped_graph
+        )
+        if new_data is None:
+            return
+        data_pair = make_data_pair(self.graph_data, new_data)
+        await self.notify(data_pair)
+        for observer in self.observers:
+            await self.in_io(
+                self.stage('observe', observer.on_next), data_pair
+            )
+        await self.in_io(self.stage('save', self.saver.on_next), data_pair)
+
+    async def notify(self, data_pair: dict) -> None:
+        if self.coalescer is not None:
+            self.coalescer.on_next(data_pair)
+            return
+        await self.notify_now(data_pair)
+
+    def schedule_notify(self, data_pair: dict):
+        # Called from the timer thread of the coalescer.
+        return asyncio.run_coroutine_threadsafe(
+            self.notify_now(data_pair, 'coalesced_notify'), self.loop
+        )
+
+    async def flush_coalesced(self) -> None:
+        if self.coalescer is None:
+            return
+        data_pair = self.coalescer.take()
+        if data_pair is not None:
+            await self.notify_now(data_pair, 'coalesced_notify')
+
+    async def notify_now(
+        self, data_pair: dict, stage: str = 'notify'
+    ) -> None:
+        # The notifier fans the messages out on the executor of its sender,
+        # so rate limit waits never hold the IO workers, and both runners
+        # share the same delivery report and pruning.
+        await self.in_io(self.stage(stage, self.notifier.on_next), data_pair)
+
+    def stage(self, name: str, function):
+        if self.profiler is None:
+            return function
+        return self.profiler.wrap(name, function)
+
+    def in_io(self, function, *args):
+        return self.loop.run_in_executor(self.io_executor, function, *args)
+
+    def shutdown(self) -> None:
+        self.io_executor.shutdown(wait=False)
+        self.cpu_executor.shutdown(wait=False)
@@ -0,0 +1,125 @@
+from collections import Counter, defaultdict
+
+
+class CliqueTracker:
+    # Keeps a maximum clique of an undirected graph up to date while edges
+    # come and go. An added edge can only create bigger cliques that contain
+    # both of its endpoints, so only their common neighbourhood is searched.
+    # A removed edge only matters when both endpoints are in the current
+    # maximum clique; then the whole graph is searched again, but knowing
+    # that what is left of the old clique is still a clique prunes most of
+    # the search.
+
+    def __init__(self):
+        self.adjacency = defaultdict(set)
+        self.multiplicity = Counter()
+        self.max_clique = frozenset()
+
+    @property
+    def clique_number(self) -> int:
+        return len(self.max_clique)
+
+    def reset(self, edges) -> None:
+        self.adjacency = defaultdict(set)
+        self.multiplicity = Counter()
+        for u, v in edges:
+            self._add_edge(u, v)
+        self.max_clique = frozenset(
+            self._find_max_clique(set(self.adjacency), 0) or ()
+        )
+
+    def restore(self, edges, max_clique) -> None:
+        # Like `reset`, for a graph whose maximum clique is already known.
+        self.adjacency = defaultdict(set)
+        self.multiplicity = Counter()
+        for u, v in edges:
+            self._add_edge(u, v)
+        self.max_clique = frozenset(max_clique)
+
+    def update(self, added_edges, removed_edges) -> None:
+        remaining = set(self.max_clique)
+        for u, v in removed_edges:
+            if self._remove_edge(u, v) and u in remaining and v in remaining:
+                remaining.discard(u)
+        new_edges = [(u, v) for u, v in added_edges if self._add_edge(u, v)]
+
+        if len(remaining) < len(self.max_clique):
+            clique = self._find_max_clique(
+                set(self.adjacency), len(remaining)
+            )
+            if clique is None and len(remaining) > 1:
+                clique = remaining
+            self.max_clique = frozenset(clique or ())
+            return
+        for u, v in new_edges:
+            candidates = self.adjacency[u] & self.adjacency[v]
+            clique = self._find_max_clique(
+                candidates, self.clique_number - 2
+            )
+            if clique is not None:
+                self.max_clique = frozenset(clique) | {u, v}
+
+    def _add_edge(self, u, v) -> bool:
+        # Returns whether the nodes just became adjacent.
+        if u == v:
+            return False
+        key = (u, v) if u < v else (v, u)
+        self.multiplicity[key] += 1
+        if self.multiplicity[key] > 1:
+            return False
+        self.adjacency[u].add(v)
+        self.adjacency[v].add(u)
+        return True
+
+    def _remove_edge(self, u, v) -> bool:
+        # Returns whether the nodes stopped being adjacent.
+        if u == v:
+            return False
+        key = (u, v) if u < v else (v, u)
+        if not self.multiplicity[key]:
+            return False
+        self.multiplicity[key] -= 1
+        if self.multiplicity[key]:
+            return False
+        del self.multiplicity[key]
+        for node, other in ((u, v), (v, u)):
+            self.adjacency[node].discard(other)
+            if not self.adjacency[node]:
+                del self.adjacency[node]
+        return True
+
+    def _find_max_clique(self, candidates: set, lower_bound: int):
+        # Branch and bound search of a maximum clique among `candidates`.
+        # Returns it if it has more than `lower_bound` nodes, otherwise None.
+        adjacency = self.adjacency
+        best = [None, lower_bound]
+
+        def expand(clique, candidates):
+            if not candidates:
+                if len(clique) > best[1]:
+                    best[0], best[1] = list(clique), len(clique)
+                return
+            while candidates:
+                if len(clique) + len(candidates) <= best[1]:
+                    return
+                node = candidates.pop()
+                clique.append(node)
+                expand(clique, candidates & adjacency[node])
+                clique.pop()
+            if len(clique) > best[1]:
+                best[0], best[1] = list(clique), len(clique)
+
+        # Visiting low degree nodes first keeps the neighbourhoods searched
+        # at the top level small, the same way a degeneracy order would.
+        ordered = sorted(candidates, key=lambda node: len(adjacency[node]))
+        remaining = set(candidates)
+        for node in ordered:
+            if len(remaining) <= best[1]:
+                break
+            remaining.discard(node)
+            if len(adjacency[node]) < best[1]:
+                continue
+            expand([node], remaining & adjacency[node])
+        if best[0] is None and lower_bound < 0:
+            return []
+        return best[0]
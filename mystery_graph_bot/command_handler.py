@@ -0,0 +1,264 @@
+from threading import Event, Lock, Thread
+from html import escape
+import logging
+import sqlite3
+import time
+
+from rx import Observer
+from marshmallow import ValidationError
+
+from .serializers import DataPair
+
+
+logger = logging.getLogger('mystery_graph_bot')
+
+
+POLL_TIMEOUT = 30
+MAX_PENDING_REPLIES = 1000
+MAX_ERROR_DELAY = 60
+
+HELP_TEXT = (
+    '/status - current liks, noms and clique number of the Mystery Graph\n'
+    '/records - most liks received and most noms of a single node'
+)
+SUBSCRIPTION_HELP_TEXT = (
+    '/subscribe - get notified when the Mystery Graph changes\n'
+    '/unsubscribe - stop getting notified\n'
+    '/mindelta N - only get notified of changes of N links or more\n'
+    '/mute lik|nom - do not get notified of changes of liks or noms\n'
+    '/unmute lik|nom - get notified of them again'
+)
+SUBSCRIPTION_COMMANDS = ('subscribe', 'unsubscribe', 'mindelta', 'mute',
+                         'unmute')
+
+
+class ResultCache(Observer):
+    # Latest crunched data of one graph, kept up to date from the data
+    # pairs, with the command replies rendered once per update. Commands
+    # are answered from here, so they never hit the graph server.
+
+    def __init__(self, name: str = None):
+        self.name = name
+        self.replies = {}
+        self.lock = Lock()
+
+    def update(self, data: dict, updated_at: float = None) -> None:
+        if updated_at is None:
+            updated_at = time.time()
+        replies = {
+            'status': self.render_status(data, updated_at),
+            'records': self.render_records(data),
+        }
+        with self.lock:
+            self.replies = replies
+
+    def get_reply(self, command: str):
+        with self.lock:
+            return self.replies.get(command)
+
+    def on_next(self, data):
+        try:
+            data_pair, _ = DataPair(strict=True).load(data)
+        except ValidationError:
+            logger.error('ResultCache got unexpected data')
+            return
+        self.update(data_pair['new'])
+
+    def on_error(self, error):
+        logger.error('ResultCache got an error: {}'.format(error))
+
+    def on_completed(self):
+        pass
+
+    def render_status(self, data: dict, updated_at: float) -> str:
+        return self.with_header(
+            'Liks: {}\nNoms: {}\nClique number: {}\nUpdated: {}'.format(
+                data['liks'], data['noms'],
+                format_count(data.get('clique_number')),
+                time.strftime('%Y-%m-%d %H:%M UTC', time.gmtime(updated_at))
+            )
+        )
+
+    def render_records(self, data: dict) -> str:
+        return self.with_header(
+            'Most liks received by a node: {}\n'
+            'Most noms of a node: {}'.format(
+                format_count(data.get('lik_record')),
+                format_count(data.get('nom_record')),
+            )
+        )
+
+    def with_header(self, text: str) -> str:
+        if self.name is None:
+            return text
+        return '<b>{}</b>\n{}'.format(escape(self.name), text)
+
+
+class CommandHandler:
+    # Answers bot commands of the whitelisted chats. Updates are long
+    # polled with `getUpdates` in a thread of its own, and replies are sent
+    # through `sender` from its executor, so a slow reply never holds the
+    # polling back. While a chat waits for the reply to a command, more of
+    # the same command are dropped, and at most `max_pending` replies wait
+    # at once, which keeps bursts from piling up behind the rate limits.
+    # With subscriber `stores` (one per graph), any chat may use the
+    # commands and manage its subscription to every graph; `chats` is then
+    # None.
+
+    def __init__(
+        self, bot, caches, chats, sender, poll_timeout: int = POLL_TIMEOUT,
+        max_pending: int = MAX_PENDING_REPLIES, stores=()
+    ):
+        self.bot = bot
+        self.caches = caches
+        # Chat ids are compared as strings, they may be configured as both.
+        self.chats = None
+        if chats is not None:
+            self.chats = {str(chat_id) for chat_id in chats}
+        self.stores = stores
+        self.sender = sender
+        self.poll_timeout = poll_timeout
+        self.max_pending = max_pending
+        self.offset = None
+        self.pending = set()
+        self.pending_lock = Lock()
+        self.stopped = Event()
+        self.thread = None
+
+    def start(self) -> None:
+        self.thread = Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.stopped.set()
+
+    def run(self) -> None:
+        errors = 0
+        while not self.stopped.is_set():
+            try:
+                self.poll()
+                errors = 0
+            except Exception as e:
+                errors += 1
+                delay = min(MAX_ERROR_DELAY, 2 ** errors)
+                logger.error(
+                    'Could not get bot updates: {}. Retrying in {} '
+                    'seconds.'.format(e, delay)
+                )
+                self.stopped.wait(delay)
+
+    def poll(self) -> None:
+        updates = self.bot.getUpdates(
+            offset=self.offset, timeout=self.poll_timeout
+        )
+        for update in updates:
+            self.offset = update.update_id + 1
+            self.handle_update(update)
+
+    def handle_update(self, update) -> None:
+        message = getattr(update, 'message', None)
+        text = getattr(message, 'text', None)
+        if not text or not text.startswith('/'):
+            return
+        chat_id = message.chat_id
+        if self.chats is not None and str(chat_id) not in self.chats:
+            logger.debug('Ignoring command of chat {}'.format(chat_id))
+            return
+        # Commands may be addressed to the bot, as in `/status@SomeBot`.
+        words = text.split()
+        command = words[0][1:].split('@')[0].lower()
+        reply_text = None
+        if self.stores and command in SUBSCRIPTION_COMMANDS:
+            # Subscriptions change right away, only replies may be dropped.
+            reply_text = self.update_subscription(chat_id, command, words[1:])
+        elif command not in ('status', 'records', 'help', 'start'):
+            return
+        key = (chat_id, command)
+        with self.pending_lock:
+            if key in self.pending:
+                return
+            if len(self.pending) >= self.max_pending:
+                logger.warning(
+                    'Too many pending command replies. Dropping /{} of '
+                    'chat {}.'.format(command, chat_id)
+                )
+                return
+            self.pending.add(key)
+        self.sender.executor.submit(self.reply, chat_id, command, reply_text)
+
+    def reply(self, chat_id, command: str, text: str = None) -> None:
+        try:
+            self.sender.send_message(
+                chat_id, text=text or self.get_reply_text(command),
+                parse_mode='HTML'
+            )
+        except Exception as e:
+            logger.error('Could not answer /{} of chat {}: {}'.format(
+                command, chat_id, e
+            ))
+        finally:
+            with self.pending_lock:
+                self.pending.discard((chat_id, command))
+
+    def update_subscription(self, chat_id, command: str, args) -> str:
+        try:
+            if command == 'subscribe':
+                # Every store is updated, even if the first one had it.
+                changed = [store.subscribe(chat_id) for store in self.stores]
+                if not any(changed):
+                    return 'You were already subscribed.'
+                return 'Subscribed! Send /unsubscribe to stop.'
+            if command == 'unsubscribe':
+                changed = [
+                    store.unsubscribe(chat_id) for store in self.stores
+                ]
+                if not any(changed):
+                    return 'You were not subscribed.'
+                return 'Unsubscribed. Send /subscribe to come back.'
+            if command == 'mindelta':
+                if len(args) != 1 or not args[0].isdigit():
+                    return 'Usage: /mindelta N'
+                min_delta = int(args[0])
+                for store in self.stores:
+                    store.set_preferences(chat_id, min_delta=min_delta)
+                return (
+                    'Changes of less than {} links will not be '
+                    'notified.'.format(min_delta)
+                )
+            # Relations may be written in plural, as in `/mute liks`.
+            if len(args) != 1:
+                return 'Usage: /{} lik|nom'.format(command)
+            relation = args[0].lower()
+            if relation.endswith('s'):
+                relation = relation[:-1]
+            for store in self.stores:
+                subscriber = store.get(chat_id)
+                muted = subscriber.muted if subscriber else frozenset()
+                if command == 'mute':
+                    muted = muted | {relation}
+                else:
+                    muted = muted - {relation}
+                store.set_preferences(chat_id, muted=muted)
+            return 'Changes of {}s will {}be notified.'.format(
+                escape(relation), 'not ' if command == 'mute' else ''
+            )
+        except sqlite3.Error as e:
+            logger.error('Could not save /{} of chat {}: {}'.format(
+                command, chat_id, e
+            ))
+            return 'Something went wrong. Please try again later.'
+
+    def get_reply_text(self, command: str) -> str:
+        if command in ('help', 'start'):
+            if self.stores:
+                return '{}\n{}'.format(HELP_TEXT, SUBSCRIPTION_HELP_TEXT)
+            return HELP_TEXT
+        replies = [cache.get_reply(command) for cache in self.caches]
+        replies = [reply for reply in replies if reply is not None]
+        if not replies:
+            return 'The Mystery Graph has not been polled yet.'
+        return '\n\n'.join(replies)
+
+
+def format_count(count) -> str:
+    return 'unknown' if count is None else str(count)
@@ -0,0 +1,36 @@
+import hashlib
+import json
+
+from .graph_diff import edge_keys
+from .graph_snapshot import GraphSnapshot
+
+
+def hash_chunks(chunks, hasher):
+    # Passes `chunks` through, feeding them to `hasher` on the way, so the
+    # body is hashed while it downloads.
+    for chunk in chunks:
+        hasher.update(chunk)
+        yield chunk
+
+
+def edge_fingerprint(snapshot: GraphSnapshot) -> str:
+    # Hash of the edge multiset of `snapshot`, by node index and relation.
+    # It does not depend on whitespace, node names or the order of links and
+    # nodes in the document (except for the order in which relations other
+    # than lik and nom first appear). The sorted edge keys are cached in the
+    # snapshot and reused by the diff.
+    hasher = hashlib.sha256()
+    hasher.update(json.dumps(snapshot.relation_names).encode())
+    try:
+        keys = edge_keys(snapshot)
+    except OverflowError:
+        node_ids = snapshot.node_ids
+        edges = sorted(
+            (node_ids[source], node_ids[target], relation)
+            for relation in snapshot.relation_names
+            for source, target in snapshot.edges(relation)
+        )
+        hasher.update(repr(edges).encode())
+    else:
+        hasher.update(keys.tobytes())
+    return hasher.hexdigest()
@@ -5,3 +5,12 @@ class SchemaLoadError(ValueError):
         super().__init__(self, msg)
         self.schema_cls = schema_cls
         self.errors = errors
+
+
+class BodyTooLargeError(ValueError):
+    def __init__(self, url, max_body_size):
+        msg = "Response body of '{}' is bigger than {} bytes."
+        msg = msg.format(url, max_body_size)
+        super().__init__(msg)
+        self.url = url
+        self.max_body_size = max_body_size
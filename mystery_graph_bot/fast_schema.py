@@ -0,0 +1,118 @@
+from marshmallow import Schema, fields
+from marshmallow.utils import missing
+
+from .errors import SchemaLoadError
+
+
+# Only fields that marshmallow loads unchanged when the value already has
+# the right type can be checked by a compiled checker. Schemas using
+# anything else always take the marshmallow path.
+SCALAR_TYPES = {
+    fields.Integer: 'int',
+    fields.String: 'str',
+    fields.Boolean: 'bool',
+}
+
+_checkers = {}
+
+
+def compile_checker(schema_cls):
+    # Builds a function that tells, in a single pass, whether a JSON object
+    # is something `schema_cls().load()` would return unchanged. Returns None
+    # for schemas that cannot be checked that way.
+    if schema_cls not in _checkers:
+        # Placeholder so that self nested schemas are reported as unsupported
+        # instead of recursing forever.
+        _checkers[schema_cls] = None
+        namespace = {}
+        source = _compile_schema(schema_cls, namespace)
+        if source is not None:
+            exec(source, namespace)
+            _checkers[schema_cls] = namespace[_function_name(schema_cls)]
+    return _checkers[schema_cls]
+
+
+def load_data_with_schema(schema: Schema, json_dict):
+    if not (schema.many or schema.only or schema.exclude):
+        checker = compile_checker(type(schema))
+        if checker is not None and checker(json_dict):
+            return json_dict
+    result = schema.load(json_dict)
+    if result.errors:
+        raise SchemaLoadError(type(schema), result.errors)
+    return result.data
+
+
+def _function_name(schema_cls):
+    return 'check_' + schema_cls.__name__
+
+
+def _compile_schema(schema_cls, namespace):
+    if any(schema_cls.__processors__.values()):
+        return None
+    declared_fields = schema_cls._declared_fields
+    all_required = all(field.required for field in declared_fields.values())
+    name = _function_name(schema_cls)
+    lines = [
+        'def {}(obj):'.format(name),
+        '    if type(obj) is not dict:',
+        '        return False',
+    ]
+    if all_required:
+        lines += [
+            '    if len(obj) != {}:'.format(len(declared_fields)),
+            '        return False',
+        ]
+    else:
+        namespace[name + '_keys'] = frozenset(declared_fields)
+        lines += [
+            '    if not obj.keys() <= {}_keys:'.format(name),
+            '        return False',
+        ]
+    for field_name, field in declared_fields.items():
+        condition = _compile_field(field, namespace)
+        if condition is None:
+            return None
+        value = 'obj[{!r}]'.format(field_name)
+        if field.allow_none:
+            condition = '({} is None or {})'.format(value, condition)
+        condition = condition.format(value=value)
+        if field.required:
+            lines.append('    if {!r} not in obj or not {}:'.format(
+                field_name, condition
+            ))
+        else:
+            lines.append('    if {!r} in obj and not {}:'.format(
+                field_name, condition
+            ))
+        lines.append('        return False')
+    lines.append('    return True')
+    return '\n'.join(lines) + '\n'
+
+
+def _compile_field(field, namespace):
+    if (
+        field.validators or field.load_from or field.attribute
+        or field.missing is not missing
+    ):
+        return None
+    if type(field) in SCALAR_TYPES:
+        return 'type({{value}}) is {}'.format(SCALAR_TYPES[type(field)])
+    if type(field) is fields.Nested:
+        nested = field.nested
+        if not (isinstance(nested, type) and issubclass(nested, Schema)):
+            return None
+        if field.only or field.exclude:
+            return None
+        checker = compile_checker(nested)
+        if checker is None:
+            return None
+        name = _function_name(nested)
+        namespace[name] = checker
+        if not field.many:
+            return name + '({value})'
+        return (
+            '(type({{value}}) is list and all(map({}, {{value}})))'
+            .format(name)
+        )
+    return None
@@ -1,74 +1,271 @@
+from array import array
+from concurrent.futures import TimeoutError
+from functools import partial
+from itertools import compress
+import logging
 import time
 
-from igraph import Graph as IGraph, Vertex, Edge
-
-from .serializers import WrappedGraphSerializer
+from .errors import SchemaLoadError
+from .fast_schema import load_data_with_schema
+from .graph_snapshot import GraphSnapshot
+from .metrics import REGISTRY
+from .serializers import WrappedGraph
 
 
 logger = logging.getLogger('mystery_graph_bot')
 
 
+CHANGE_DETECTION_FIELDS = (
+    'content_hash', 'last_modified', 'edge_fingerprint'
+)
+
+CRUNCH_SECONDS = REGISTRY.histogram(
+    'mgb_crunch_seconds', 'Time to crunch a graph.'
+)
+CRUNCH_STEP_SECONDS = REGISTRY.histogram(
+    'mgb_crunch_step_seconds',
+    'Time to compute every crunched value, diff and snapshot save.',
+    ['step']
+)
+
+
 class GraphCruncher:
-    def __init__(self):
-        pass
+    def __init__(
+        self, differ=None, clique_tracker=None, snapshot_store=None,
+        renderer=None
+    ):
+        self.differ = differ
+        self.clique_tracker = clique_tracker
+        self.snapshot_store = snapshot_store
+        self.renderer = renderer
+
+    def restore(self, saved_snapshot) -> None:
+        # Resumes diffing and clique tracking from a snapshot saved by an
+        # earlier run.
+        snapshot = saved_snapshot.snapshot
+        if self.differ is not None:
+            self.differ.last_snapshot = snapshot
+        if self.clique_tracker is not None:
+            nom_edges = self.get_nom_edges(snapshot)
+            if saved_snapshot.max_clique is None:
+                self.clique_tracker.reset(nom_edges)
+            else:
+                self.clique_tracker.restore(
+                    nom_edges, saved_snapshot.max_clique
+                )
 
     def __call__(self, wrapped_graph):
         return self.handle_wrapped_graph(wrapped_graph)
 
     def handle_wrapped_graph(self, wrapped_graph):
-        try:
-            wrapped_graph_serializer = WrappedGraphSerializer(
-                strict=True
+        # Change detection state is saved along with the metrics, and with
+        # the snapshot, which is resumed from when it matches.
+        change_detection = {
+            field: wrapped_graph[field] for field in CHANGE_DETECTION_FIELDS
+            if wrapped_graph.get(field)
+        }
+        if isinstance(wrapped_graph.get('graph'), GraphSnapshot):
+            # Snapshots are only built from already validated graphs.
+            return self.crunch_snapshot(
+                wrapped_graph['etag'], wrapped_graph['graph'],
+                change_detection
             )
-            etag, raw_graph = wrapped_graph_serializer.load(
-                wrapped_graph
+        try:
+            wrapped_graph = load_data_with_schema(
+                WrappedGraph(), wrapped_graph
             )
-        except ValidationError:
+        except SchemaLoadError:
             logger.error('GraphCruncher got unexpected data')
-        else:
-            return self.crunch_graph(etag, raw_graph)
+            return None
+        return self.crunch_graph(
+            wrapped_graph['etag'], wrapped_graph['graph'], change_detection
+        )
 
-    def crunch_graph(etag, raw_graph):
+    def crunch_graph(self, etag, raw_graph, change_detection: dict = None):
+        return self.crunch_snapshot(
+            etag, GraphSnapshot.from_graph(raw_graph), change_detection
+        )
+
+    def crunch_snapshot(
+        self, etag, snapshot: GraphSnapshot, change_detection: dict = None
+    ):
 
         logger.info('Starting graph crunching...')
+        self.current_etag = etag
         start_time = time.time()
 
-        liks = sum(
-            1 for link in graph['links'] if link['value'] == 'lik'
-        )
-        noms = sum(
-            1 for link in graph['links'] if link['value'] == 'nom'
-        )
-
-        lik_igraph, nom_igraph = self.make_igraphs(raw_graph)
+        diff = None
+        if self.differ is not None:
+            diff = self.measure('diff', self.differ, snapshot)
 
         graph_data = {
             'etag': etag,
-            'liks': lik_igraph.ecount(),
-            'noms': nom_igraph.ecount(),
-            'lik_record': max(lik_igraph.indegree()),
-            'nom_record': max(nom_igraph.indegree()),
-            'clique_number': nom_igraph.omega(),
+            'liks': self.measure('liks', snapshot.count, 'lik'),
+            'noms': self.measure('noms', snapshot.count, 'nom'),
+            'lik_record': self.measure(
+                'lik_record', snapshot.max_indegree, 'lik'
+            ),
+            'nom_record': self.measure(
+                'nom_record', snapshot.max_degree, 'nom'
+            ),
+            'clique_number': self.measure(
+                'clique_number', self.get_clique_number, snapshot, diff
+            ),
         }
+        graph_data.update(change_detection or {})
+
+        if self.snapshot_store is not None:
+            self.measure(
+                'save_snapshot', self.save_snapshot, snapshot, graph_data
+            )
+
+        if self.renderer is not None:
+            self.measure('layout', self.renderer.update, etag, snapshot, diff)
+
+        if diff is not None:
+            graph_data['diff'] = diff.to_dict()
 
         end_time = time.time()
+        CRUNCH_SECONDS.observe(end_time - start_time)
         msg = 'Finished graph crunching. Took {} seconds.'
         logger.info(msg.format(end_time-start_time))
 
         return graph_data
 
-    def make_igraphs(raw_graph):
-        lik_igraph = IGraph(directed=True)
-        lik_igraph.add_vertices(node["index"] for node in raw_graph["nodes"])
-        lik_igraph.add_edges(
-            (edge["source"], edge["target"]) for edge in raw_graph
-                if edge["value"] == "lik"
+    def measure(self, step: str, function, *args):
+        with CRUNCH_STEP_SECONDS.labels(step).time():
+            return function(*args)
+
+    def get_clique_number(self, snapshot: GraphSnapshot, diff=None) -> int:
+        if self.clique_tracker is None:
+            return self.make_nom_igraph(snapshot).omega()
+        if diff is None:
+            self.clique_tracker.reset(self.get_nom_edges(snapshot))
+        else:
+            self.clique_tracker.update(
+                [(source, target) for source, target, relation
+                 in diff.added_edges if relation == 'nom'],
+                [(source, target) for source, target, relation
+                 in diff.removed_edges if relation == 'nom'],
+            )
+        # Lone nodes are cliques too, but the tracker only knows about edges.
+        return max(
+            self.clique_tracker.clique_number, min(snapshot.node_count, 1)
+        )
+
+    def get_nom_edges(self, snapshot: GraphSnapshot):
+        node_ids = snapshot.node_ids
+        return (
+            (node_ids[source], node_ids[target])
+            for source, target in snapshot.edges('nom')
         )
+
+    def save_snapshot(self, snapshot: GraphSnapshot, graph_data: dict):
+        max_clique = None
+        if self.clique_tracker is not None:
+            max_clique = self.clique_tracker.max_clique
+        start_time = time.time()
+        try:
+            self.snapshot_store.save(snapshot, graph_data, max_clique)
+        except OSError as e:
+            logger.warning('Not able to save graph snapshot: {}'.format(e))
+            return
+        logger.debug('Saved graph snapshot in {} seconds.'.format(
+            time.time() - start_time
+        ))
+
+    def make_igraphs(self, snapshot: GraphSnapshot):
+        # igraph is only imported when a graph is first built with it; the
+        # clique tracker does not need it.
+        from igraph import Graph as IGraph
+
+        lik_igraph = IGraph(directed=True)
+        lik_igraph.add_vertices(snapshot.node_count)
+        lik_igraph.add_edges(snapshot.edges('lik'))
+        return lik_igraph, self.make_nom_igraph(snapshot)
+
+    def make_nom_igraph(self, snapshot: GraphSnapshot):
+        from igraph import Graph as IGraph
+
         nom_igraph = IGraph(directed=False)
-        nom_igraph.add_vertices(node["index"] for node in raw_graph["nodes"])
-        nom_igraph.add_edges(
-            (edge["source"], edge["target"]) for edge in raw_graph
-                if edge["value"] == "nom"
+        nom_igraph.add_vertices(snapshot.node_count)
+        nom_igraph.add_edges(snapshot.edges('nom'))
+        return nom_igraph
+
+
+def compute_clique_number(node_count: int, nom_sources, nom_targets) -> int:
+    from igraph import Graph as IGraph
+
+    nom_igraph = IGraph(directed=False)
+    nom_igraph.add_vertices(node_count)
+    nom_igraph.add_edges(zip(nom_sources, nom_targets))
+    return nom_igraph.omega()
+
+
+class PooledGraphCruncher(GraphCruncher):
+    # Computes the clique number in a worker process. Crunching waits for it
+    # at most `deadline` seconds; after that the cheap metrics are returned
+    # with a None clique number, and the clique number is published on
+    # `late_results` once it arrives, unless the next cycle abandoned it.
+
+    def __init__(
+        self, executor, deadline: float, differ=None, snapshot_store=None,
+        renderer=None
+    ):
+        from rx.subjects import Subject
+
+        super().__init__(
+            differ=differ, snapshot_store=snapshot_store, renderer=renderer
+        )
+        self.executor = executor
+        self.deadline = deadline
+        self.late_results = Subject()
+        self.pending = None
+
+    def get_clique_number(self, snapshot: GraphSnapshot, diff=None):
+        self.abandon_pending()
+        nom_sources = array(
+            'i', compress(snapshot.sources, snapshot.relation_mask('nom'))
+        )
+        nom_targets = array(
+            'i', compress(snapshot.targets, snapshot.relation_mask('nom'))
         )
-        return lik_igraph, nom_igraph
+        future = self.executor.submit(
+            compute_clique_number, snapshot.node_count, nom_sources,
+            nom_targets
+        )
+        try:
+            return future.result(timeout=self.deadline)
+        except TimeoutError:
+            msg = (
+                'Clique number of graph {} missed the {} seconds deadline. '
+                'It will be published when ready.'
+            )
+            logger.warning(msg.format(self.current_etag, self.deadline))
+            self.pending = future
+            future.add_done_callback(
+                partial(self.on_late_clique_number, self.current_etag)
+            )
+        except Exception as e:
+            logger.error('Clique number computation failed: {}'.format(e))
+        return None
+
+    def abandon_pending(self) -> None:
+        if self.pending is not None and not self.pending.done():
+            self.pending.cancel()
+            logger.warning('Abandoning late clique number of previous graph.')
+        self.pending = None
 
+    def on_late_clique_number(self, etag: str, future) -> None:
+        if future is not self.pending or future.cancelled():
+            return
+        self.pending = None
+        try:
+            clique_number = future.result()
+        except Exception as e:
+            logger.error('Clique number computation failed: {}'.format(e))
+            return
+        logger.info('Got late clique number of graph {}.'.format(etag))
+        self.late_results.on_next({
+            'etag': etag, 'clique_number': clique_number
+        })
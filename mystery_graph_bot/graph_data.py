@@ -1,18 +1,22 @@
 import logging
-import json
 
+from .errors import SchemaLoadError
+from .fast_schema import load_data_with_schema
 from .serializers import Data
-from .util import load_data_with_schema_from_json_path
+from .state_log import FSYNC_INTERVAL, StateLog
 
 
 logger = logging.getLogger('mystery_graph_bot')
 
 
 class GraphData:
+    # The data is kept in a `StateLog` at `filepath`, so a crash while
+    # saving can not lose the previously saved data.
 
-    def __init__(self, filepath):
+    def __init__(self, filepath, fsync: str = FSYNC_INTERVAL):
         self._data = None
         self.filepath = filepath
+        self.state_log = StateLog(filepath, fsync=fsync)
 
     def __getitem__(self, index):
         return self.data[index]
@@ -23,32 +27,53 @@ class GraphData:
     @property
     def data(self):
         if not self._data:
-            try:
-                self._data = load_data_with_schema_from_json_path(
-                    Data(), self.filepath
-                )
-            except:
-                logger.info(
-                    'Not able to load existing data. '
-                    'It must be the first polling cycle. Assuming empty data.'
-                )
-                self._data = {
-                    'etag': None,
-                    'liks': None,
-                    'noms': None,
-                }
+            self._data = self.load()
         return self._data
 
     @data.setter
     def data(self, value) -> None:
         self._data = value
 
+    def load(self) -> dict:
+        try:
+            state = self.state_log.recover()
+        except OSError as e:
+            logger.warning('Not able to read saved data: {}'.format(e))
+            state = None
+        if state is not None:
+            try:
+                return load_data_with_schema(Data(), state)
+            except SchemaLoadError:
+                logger.warning('Saved data has an unexpected format.')
+        logger.info(
+            'No saved data. '
+            'It must be the first polling cycle. Assuming empty data.'
+        )
+        return {
+            'etag': None,
+            'liks': None,
+            'noms': None,
+        }
+
     def save(self):
         try:
-            with open(self.filepath, 'w') as data_file:
-                json.dump(self.data, data_file)
-        except:
+            self.state_log.append(self.data)
+        except OSError:
             logger.warning(
                 'Unable to save current data into a file. '
                 'If program closes there will be data loss.'
             )
+
+    def close(self) -> None:
+        self.state_log.close()
+
+
+def make_data_pair(graph_data, new_data: dict) -> dict:
+    new_data = dict(new_data)
+    diff = new_data.pop('diff', None)
+    data_pair = {'new': new_data}
+    if graph_data['etag'] is not None:
+        data_pair['old'] = graph_data.data
+    if diff is not None:
+        data_pair['diff'] = diff
+    return data_pair
@@ -0,0 +1,200 @@
+from array import array
+from collections import Counter
+
+from .graph_snapshot import GraphSnapshot
+
+
+# Edges are packed in a single unsigned 64 bit integer as
+# (source node index, target node index, relation code), so sorting the keys
+# sorts the edges by source, then target, then relation.
+NODE_BITS = 28
+RELATION_BITS = 8
+MAX_NODE_INDEX = (1 << NODE_BITS) - 1
+NODE_MASK = MAX_NODE_INDEX
+RELATION_MASK = (1 << RELATION_BITS) - 1
+TARGET_SHIFT = RELATION_BITS
+SOURCE_SHIFT = NODE_BITS + RELATION_BITS
+
+MIN_BLOCK = 1
+MAX_BLOCK = 1 << 16
+
+
+def pack_edge(source: int, target: int, relation_code: int) -> int:
+    return (source << SOURCE_SHIFT) | (target << TARGET_SHIFT) | relation_code
+
+
+def unpack_edge(key: int):
+    return (
+        key >> SOURCE_SHIFT,
+        (key >> TARGET_SHIFT) & NODE_MASK,
+        key & RELATION_MASK,
+    )
+
+
+def edge_keys(snapshot: GraphSnapshot) -> array:
+    # Sorted packed keys of all the edges of `snapshot`. They are cached in
+    # the snapshot, so every snapshot only pays for them once even though it
+    # takes part in two diffs.
+    keys = getattr(snapshot, '_edge_keys', None)
+    if keys is None:
+        node_ids = snapshot.node_ids
+        if node_ids and (min(node_ids) < 0 or max(node_ids) > MAX_NODE_INDEX):
+            raise OverflowError('Node index does not fit in a packed edge key')
+        sources = map(node_ids.__getitem__, snapshot.sources)
+        targets = map(node_ids.__getitem__, snapshot.targets)
+        keys = array('Q', sorted(map(
+            pack_edge, sources, targets, snapshot.relations
+        )))
+        snapshot._edge_keys = keys
+    return keys
+
+
+def sorted_difference(old_keys, new_keys):
+    # Multiset difference of two sorted sequences in both directions. Runs of
+    # equal keys are skipped by comparing whole slices, which is done in C,
+    # and the block size grows while the runs keep matching, so unchanged
+    # graphs cost a handful of memcmp calls instead of one step per edge.
+    removed = []
+    added = []
+    i = j = 0
+    old_length = len(old_keys)
+    new_length = len(new_keys)
+    block = MAX_BLOCK
+    while i < old_length and j < new_length:
+        if block > MIN_BLOCK:
+            if old_keys[i:i + block] == new_keys[j:j + block]:
+                i += block
+                j += block
+                block = min(block * 2, MAX_BLOCK)
+            else:
+                block //= 2
+            continue
+        old_key = old_keys[i]
+        new_key = new_keys[j]
+        if old_key == new_key:
+            i += 1
+            j += 1
+            block = 2
+        elif old_key < new_key:
+            removed.append(old_key)
+            i += 1
+        else:
+            added.append(new_key)
+            j += 1
+    removed.extend(old_keys[i:])
+    added.extend(new_keys[j:])
+    return removed, added
+
+
+class GraphDiff:
+    def __init__(self, added_edges, removed_edges, node_names=None):
+        # Edges are (source node index, target node index, relation) tuples.
+        self.added_edges = added_edges
+        self.removed_edges = removed_edges
+        self.node_names = node_names or {}
+
+    @property
+    def added(self) -> dict:
+        return dict(Counter(relation for _, _, relation in self.added_edges))
+
+    @property
+    def removed(self) -> dict:
+        return dict(
+            Counter(relation for _, _, relation in self.removed_edges)
+        )
+
+    @property
+    def affected_nodes(self) -> list:
+        nodes = set()
+        for source, target, _ in self.added_edges + self.removed_edges:
+            nodes.add(source)
+            nodes.add(target)
+        return sorted(nodes)
+
+    def __bool__(self) -> bool:
+        return bool(self.added_edges or self.removed_edges)
+
+    def to_dict(self) -> dict:
+        return {
+            'added': self.added,
+            'removed': self.removed,
+            'affected_nodes': [
+                self.node_names.get(index) or str(index)
+                for index in self.affected_nodes
+            ],
+        }
+
+
+def diff_snapshots(old: GraphSnapshot, new: GraphSnapshot) -> GraphDiff:
+    try:
+        old_keys = edge_keys(old)
+        new_keys = edge_keys(new)
+    except OverflowError:
+        removed, added = _diff_edge_counters(old, new)
+    else:
+        code_map, relation_names = _relation_code_map(old, new)
+        if code_map is not None:
+            old_keys = array('Q', sorted(
+                (key & ~RELATION_MASK) | code_map[key & RELATION_MASK]
+                for key in old_keys
+            ))
+        removed_keys, added_keys = sorted_difference(old_keys, new_keys)
+        removed = [_unpack_named(key, relation_names)
+                   for key in removed_keys]
+        added = [_unpack_named(key, relation_names) for key in added_keys]
+
+    node_names = {}
+    for snapshot in (old, new):
+        node_names.update(zip(snapshot.node_ids, snapshot.node_names))
+    return GraphDiff(added, removed, node_names)
+
+
+class GraphDiffer:
+    # Keeps the last snapshot seen and diffs every new one against it.
+
+    def __init__(self):
+        self.last_snapshot = None
+
+    def __call__(self, snapshot: GraphSnapshot):
+        last_snapshot, self.last_snapshot = self.last_snapshot, snapshot
+        if last_snapshot is None:
+            return None
+        return diff_snapshots(last_snapshot, snapshot)
+
+
+def _relation_code_map(old: GraphSnapshot, new: GraphSnapshot):
+    # Relations beyond lik and nom get their codes in order of appearance,
+    # so old codes only need translating when that order changed. Returns
+    # the translation (or None) and the relation names for the merged codes.
+    if new.relation_names[:len(old.relation_names)] == old.relation_names:
+        return None, new.relation_names
+    relation_names = list(new.relation_names)
+    for relation in old.relation_names:
+        if relation not in relation_names:
+            relation_names.append(relation)
+    code_map = [relation_names.index(relation)
+                for relation in old.relation_names]
+    return code_map, relation_names
+
+
+def _unpack_named(key: int, relation_names):
+    source, target, code = unpack_edge(key)
+    return source, target, relation_names[code]
+
+
+def _diff_edge_counters(old: GraphSnapshot, new: GraphSnapshot):
+    def named_edges(snapshot):
+        edges = Counter()
+        for relation in snapshot.relation_names:
+            edges.update(
+                (snapshot.node_ids[source], snapshot.node_ids[target],
+                 relation)
+                for source, target in snapshot.edges(relation)
+            )
+        return edges
+
+    old_edges = named_edges(old)
+    new_edges = named_edges(new)
+    removed = sorted((old_edges - new_edges).elements())
+    added = sorted((new_edges - old_edges).elements())
+    return removed, added
@@ -1,34 +1,139 @@
+import hashlib
+import json
+import logging
+from time import sleep
+
 from rx import Observable
 import requests
 from requests import Response
 
+from .content_hash import edge_fingerprint, hash_chunks
+from .errors import BodyTooLargeError, SchemaLoadError
+from .graph_snapshot import GraphSnapshot, GraphSnapshotBuilder
+from .graph_stream import StreamingGraphParser
+from .http_client import GraphHttpClient
+from .metrics import REGISTRY
+from .poll_scheduler import (
+    CHANGED, CLOSED, FAILED, UNCHANGED, PollScheduler
+)
+from .serializers import Graph
+from .util import load_data_with_schema_from_string
+
 
 logger = logging.getLogger('mystery_graph_bot')
 
 
+FETCH_SECONDS = REGISTRY.histogram(
+    'mgb_graph_fetch_seconds',
+    'Time to request, download and parse the graph.', ['graph']
+)
+PARSE_SECONDS = REGISTRY.histogram(
+    'mgb_graph_parse_seconds',
+    'Time to parse and validate the graph. When streamed, it downloads '
+    'meanwhile.', ['graph']
+)
+RESPONSES = REGISTRY.counter(
+    'mgb_graph_responses_total', 'Graph responses by HTTP status code.',
+    ['graph', 'status']
+)
+POLLS = REGISTRY.counter(
+    'mgb_graph_polls_total', 'Graph polls by outcome.', ['graph', 'outcome']
+)
+POLL_INTERVAL = REGISTRY.gauge(
+    'mgb_poll_interval_seconds', 'Current polling interval.', ['graph']
+)
+CIRCUIT_OPEN = REGISTRY.gauge(
+    'mgb_poll_circuit_open',
+    'Whether polling is stopped by the circuit breaker (1) or not (0). It '
+    'stays open until a probe poll succeeds.', ['graph']
+)
+CONSECUTIVE_FAILURES = REGISTRY.gauge(
+    'mgb_poll_consecutive_failures', 'Graph polls failed in a row.',
+    ['graph']
+)
+
 class GraphFetcher:
+    # Besides ETags, changes are detected with a hash of the body computed
+    # while it downloads, and optionally with a fingerprint of the edge set.
+    # Graphs that did not change are dropped here, so they are never
+    # crunched nor notified. Without an ETag, the content hash stands in for
+    # it in the saved data.
+
     def __init__(
-        self, graph_data, graph_url, refresh_time, do_once=False
+        self, graph_data, graph_url, refresh_time, do_once=False,
+        stream=False, chunk_size=64 * 1024, http_client=None,
+        fingerprint_edges=False, scheduler=None, profiler=None
     ):
         self.graph_data = graph_data
         self.graph_url = graph_url
         self.refresh_time = refresh_time
-        self.observable = Observable.create(self.on_suscription)
+        self.observable = Observable.create(self.on_subscription)
         self.do_once = do_once
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.http_client = http_client or GraphHttpClient()
+        self.fingerprint_edges = fingerprint_edges
+        self.scheduler = scheduler or PollScheduler(refresh_time)
+        self.outcome = None
+        self.profiler = profiler
+        self.fetch_seconds = FETCH_SECONDS.labels(graph_url)
+        self.parse_seconds = PARSE_SECONDS.labels(graph_url)
+        POLL_INTERVAL.labels(graph_url).set_function(
+            lambda: self.scheduler.interval
+        )
+        CIRCUIT_OPEN.labels(graph_url).set_function(
+            lambda: int(self.scheduler.state != CLOSED)
+        )
+        CONSECUTIVE_FAILURES.labels(graph_url).set_function(
+            lambda: self.scheduler.consecutive_failures
+        )
 
     def on_subscription(self, observer):
         while True:
-            graph = self.poll_graph()
-            observer.on_next(graph)
+            if self.profiler is None:
+                graph = self.poll_graph()
+                if graph is not None:
+                    observer.on_next(graph)
+            else:
+                # The observers run as stages of the same cycle.
+                self.profiler.start_cycle()
+                graph = self.profiler.stage('fetch', self.poll_graph)
+                if graph is not None:
+                    observer.on_next(graph)
+                self.profiler.finish_cycle()
             if self.do_once:
+                observer.on_completed()
                 break
             else:
-                sleep(self.refresh_time)
+                sleep(self.scheduler.next_delay())
 
     def poll_graph(self) -> dict:
+        # The handlers below set `outcome` when the poll did not fail.
+        self.outcome = FAILED
+        with self.fetch_seconds.time():
+            wrapped_graph = self.request_graph()
+        self.scheduler.record(self.outcome)
+        POLLS.labels(self.graph_url, self.outcome).inc()
+        return wrapped_graph
+
+    def request_graph(self) -> dict:
+        headers = {}
+        etag = self.get_stored('etag')
+        if etag and etag != self.get_stored('content_hash'):
+            headers['If-None-Match'] = etag
+        last_modified = self.get_stored('last_modified')
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
         try:
-            response = requests.get(self.graph_url, timeout=5, headers=headers)
-            self.handle_http_graph_response(response)
+            # The body is always read by `parse_graph_from_response`, to hash
+            # it on the way.
+            response = self.http_client.get(
+                self.graph_url, headers=headers, stream=True
+            )
+            try:
+                return self.handle_http_graph_response(response)
+            finally:
+                response.close()
         except requests.ConnectionError:
             msg = 'Could not connect to server containing the graph'
             logger.error(msg)
@@ -38,8 +143,11 @@ class GraphFetcher:
         except requests.TooManyRedirects:
             msg = 'Exceeded redirect limit while retrieving the graph'
             logger.error(msg)
+        except BodyTooLargeError as e:
+            logger.error(str(e))
 
     def handle_http_graph_response(self, response: Response) -> dict:
+        RESPONSES.labels(self.graph_url, response.status_code).inc()
         if response.status_code == 200:
             # Success!!
             msg = 'HTTP Request returned new graph (status_code={})'
@@ -63,6 +171,7 @@ class GraphFetcher:
             msg = 'HTTP Request shows graph is not modified (status_code={})'
             msg.format(response.status_code)
             logger.debug(msg)
+            self.outcome = UNCHANGED
         else:
             msg = (
                 'Got unexpected HTTP status code when requesting graph '
@@ -72,20 +181,107 @@ class GraphFetcher:
             logger.error(msg)
 
     def parse_graph_from_response(self, response: Response) -> dict:
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        hasher = hashlib.sha256()
+        chunks = hash_chunks(
+            self.http_client.iter_content(response, self.chunk_size), hasher
+        )
         try:
-            parsed_graph = load_data_with_schema_from_string(
-                Graph(), response.text
-            )
-            etag = response.headers['ETag']
-            return {'etag': etag, 'graph': parsed_graph}
+            if self.stream:
+                # The hash is only known once the body is parsed: holding
+                # the body back to hash it first would take the memory that
+                # streaming saves. Unchanged graphs are still not crunched.
+                parser = StreamingGraphParser(GraphSnapshotBuilder())
+                with self.parse_seconds.time():
+                    snapshot = parser.parse(chunks).build()
+                content_hash = hasher.hexdigest()
+                if self.is_unchanged('content_hash', content_hash):
+                    return self.skip_unchanged(
+                        etag, last_modified, content_hash
+                    )
+            else:
+                body = b''.join(chunks)
+                content_hash = hasher.hexdigest()
+                # Checked before parsing, so unchanged bodies are not parsed.
+                if self.is_unchanged('content_hash', content_hash):
+                    return self.skip_unchanged(
+                        etag, last_modified, content_hash
+                    )
+                with self.parse_seconds.time():
+                    parsed_graph = load_data_with_schema_from_string(
+                        Graph(), body
+                    )
+                    snapshot = GraphSnapshot.from_graph(parsed_graph)
         except json.JSONDecodeError:
             logger.error("Graph data is not a valid JSON. Ignoring it.")
-        except SchemaLoadError as e:
+            return None
+        except SchemaLoadError:
             logger.error(
                 "Graph JSON object has an unexpected format. Ignoring it."
             )
-        except KeyError:
+            return None
+        except BodyTooLargeError as e:
+            logger.error(str(e))
+            return None
+        except ValueError as e:
+            # Bodies that are not UTF-8, or graphs the snapshot cannot hold.
             logger.error(
-                "Expected ETag header in graph response. "
-                "Not implemented graph diffing without it yet."
+                "Graph data could not be loaded ({}). Ignoring it.".format(e)
+            )
+            return None
+
+        if etag is None:
+            logger.info(
+                "Graph response has no ETag header. Using its content hash."
             )
+        wrapped_graph = {
+            'etag': etag or content_hash,
+            'graph': snapshot,
+            'content_hash': content_hash,
+        }
+        if last_modified:
+            wrapped_graph['last_modified'] = last_modified
+        if self.fingerprint_edges:
+            fingerprint = edge_fingerprint(snapshot)
+            if self.is_unchanged('edge_fingerprint', fingerprint):
+                return self.skip_unchanged(etag, last_modified, content_hash)
+            wrapped_graph['edge_fingerprint'] = fingerprint
+        self.outcome = CHANGED
+        return wrapped_graph
+
+    def is_unchanged(self, key: str, value: str) -> bool:
+        return value == self.get_stored(key)
+
+    def skip_unchanged(
+        self, etag: str, last_modified: str, content_hash: str
+    ) -> None:
+        logger.info('Graph content did not change. Skipping it.')
+        self.outcome = UNCHANGED
+        # Remember the new validators and content hash, so the next request
+        # can get a 304 if the server rotated them without changing the
+        # content, and a body with only the same edges stops at the hash
+        # check next time. They are saved, to survive a restart.
+        if etag is None and self.is_unchanged(
+            'etag', self.get_stored('content_hash')
+        ):
+            # The content hash stands in for the missing ETag.
+            etag = content_hash
+        updated = False
+        for key, value in (
+            ('etag', etag), ('last_modified', last_modified),
+            ('content_hash', content_hash),
+        ):
+            if value and not self.is_unchanged(key, value):
+                self.graph_data[key] = value
+                updated = True
+        if updated:
+            self.graph_data.save()
+        return None
+
+    def get_stored(self, key: str):
+        # Data saved by older versions lacks the change detection fields.
+        try:
+            return self.graph_data[key]
+        except KeyError:
+            return None
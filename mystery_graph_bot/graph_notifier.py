@@ -1,52 +1,222 @@
+from collections import OrderedDict
+from concurrent.futures import Future
+from threading import Lock
 from typing import Union
+from html import escape
 import logging
 
 from rx import Observer
 from marshmallow import ValidationError
 
 from .serializers import DataPair
+from .telegram_sender import TelegramSender, is_chat_gone
 
 
 logger = logging.getLogger('mystery_graph_bot')
 
 
+MAX_LISTED_NODES = 10
+MAX_CACHED_PAYLOADS = 16
+SNAPSHOT_FILE_NAME = 'mystery-graph.svg'
+
+TEMPLATES = {
+    'full': (
+        '<b>mystery</b>\n'
+        '&#160;&#160;&#160;&#160;&#160;&#160;&#160;&#160;'
+        '<b>asbolutely no way</b>\n'
+        'The Mystery Graph has just been updated! '
+        'Overall, now it has {delta}.\n'
+        'Check it out <a href="{url}">here</a>!'
+    ),
+    'short': (
+        'The Mystery Graph has {delta}. <a href="{url}">Check it out</a>!'
+    ),
+}
+DEFAULT_TEMPLATE = 'full'
+
+
 class GraphNotifier(Observer):
-    def __init__(self, bot, chats):
+    # Message payloads only depend on the changes and the template of the
+    # chat, so they are rendered once per update and template, and every
+    # chat gets the same cached keyword arguments for `sendMessage`.
+    # With a `subscriber_store`, only the subscribed chats wanting the
+    # changes are notified, and chats that blocked the bot or are gone are
+    # unsubscribed. With a `renderer`, every message is followed by an SVG
+    # snapshot of the new graph, uploaded once and then sent by file id.
+
+    def __init__(
+        self, bot, chats, graph_visualization_url, sender=None,
+        chat_templates: dict = None, subscriber_store=None, renderer=None
+    ):
         self.bot = bot
         self.chats = chats
+        self.subscriber_store = subscriber_store
+        self.renderer = renderer
+        self.snapshot_etag = None
+        self.snapshot_upload = None
+        self.snapshot_lock = Lock()
+        self.graph_visualization_url = graph_visualization_url
+        self.sender = sender or TelegramSender(bot)
+        # Chat ids are compared as strings, since JSON object keys are.
+        self.chat_templates = {
+            str(chat_id): template
+            for chat_id, template in (chat_templates or {}).items()
+        }
+        for template in self.chat_templates.values():
+            if template not in TEMPLATES:
+                raise ValueError(
+                    "Unknown notification template '{}'".format(template)
+                )
+        self.payloads = OrderedDict()
+        self.payloads_lock = Lock()
 
     def on_next(self, data):
+        changes = self.get_changes(data)
+        if changes is None:
+            return
+        report = self.sender.fan_out(
+            self.get_chats(*changes),
+            lambda chat_id: self.send_changes_to_chat(chat_id, *changes)
+        )
+        self.prune(report.errors, len(report.latencies))
+
+    def get_chats(self, delta_noms: int, delta_liks: int, diff: dict = None):
+        if self.subscriber_store is None:
+            return list(self.chats)
+        deltas = {'lik': delta_liks, 'nom': delta_noms}
+        if diff:
+            for relation in set(diff['added']) | set(diff['removed']):
+                deltas.setdefault(
+                    relation,
+                    diff['added'].get(relation, 0) -
+                    diff['removed'].get(relation, 0)
+                )
+        return self.subscriber_store.get_wanted(deltas)
+
+    def prune(self, errors: dict, delivered: int) -> None:
+        # When no message got through at all, the bot itself may have been
+        # locked out (a revoked token is also `Unauthorized`), so nobody is
+        # unsubscribed.
+        if self.subscriber_store is None or not delivered:
+            return
+        for chat_id, error in errors.items():
+            if is_chat_gone(error):
+                logger.warning('Chat {} is gone: {}'.format(chat_id, error))
+                self.subscriber_store.unsubscribe(chat_id)
+
+    def get_changes(self, data):
+        # Returns the arguments for `send_changes_to_chat` after `chat_id`, or
+        # None if there is nothing to send.
         try:
             data_pair_serializer = DataPair(strict=True)
             data_pair, _ = data_pair_serializer.load(data)
-            new_data, old_data = (data_pair["new"], data_pair["old"])
+            new_data, old_data = (data_pair["new"], data_pair.get("old"))
         except ValidationError:
             logger.error('GraphNotifier got unexpected data')
-        else:
-            if not old_data:
-                return
+            return None
+        if not old_data:
+            return None
+
+        delta_noms = new_data['noms'] - old_data['noms']
+        delta_liks = new_data['liks'] - old_data['liks']
+        if self.renderer is not None:
+            with self.snapshot_lock:
+                if self.snapshot_etag != new_data['etag']:
+                    self.snapshot_etag = new_data['etag']
+                    self.snapshot_upload = None
+        return delta_noms, delta_liks, data_pair.get('diff')
 
-            delta_noms = new_data['noms'] - old_data['noms']
-            delta_liks = new_data['liks'] - old_data['liks']
-            for chat_id in self.chats:
-                self.send_changes_to_chat(chat_id, delta_noms, delta_liks)
+    def on_error(self, error):
+        logger.error('GraphNotifier got an error: {}'.format(error))
+
+    def on_completed(self):
+        pass
+
+    def close(self) -> None:
+        pass
 
     def send_changes_to_chat(
-        self, chat_id: Union[str, int], delta_noms: int, delta_liks: int
+        self, chat_id: Union[str, int], delta_noms: int, delta_liks: int,
+        diff: dict = None
     ):
-        text = (
-            '<b>mystery</b>\n'
-            '&#160;&#160;&#160;&#160;&#160;&#160;&#160;&#160;'
-            '<b>asbolutely no way</b>\n'
-            'The Mystery Graph has just been updated! '
-            'Overall, now it has {}.\n'
-            'Check it out <a href="{}">here</a>!'
-        )
-        text = text.format(
-            self.get_human_delta(delta_noms, delta_liks),
+        template = self.chat_templates.get(str(chat_id), DEFAULT_TEMPLATE)
+        payload = self.get_payload(template, delta_noms, delta_liks, diff)
+        self.sender.send_message(chat_id, **payload)
+        if self.renderer is not None:
+            self.send_snapshot(chat_id)
+
+    def send_snapshot(self, chat_id: Union[str, int]) -> None:
+        # The first chat uploads the file, while the others wait for its id.
+        # The lock is only held to claim the upload, so a slow upload never
+        # holds up a new graph. If the upload fails, every chat waiting for
+        # it uploads a copy of its own.
+        with self.snapshot_lock:
+            etag = self.snapshot_etag
+            upload = self.snapshot_upload
+            uploading = upload is None
+            if uploading:
+                upload = self.snapshot_upload = Future()
+        if not uploading:
+            file_id = upload.result()
+            if file_id is not None:
+                self.sender.send_document(chat_id, file_id)
+                return
+        file_id = None
+        try:
+            svg = self.renderer.get_svg(etag)
+            if svg is None:
+                return
+            message = self.sender.send_document(
+                chat_id, svg, filename=SNAPSHOT_FILE_NAME
+            )
+            file_id = message.document.file_id
+        finally:
+            if uploading:
+                upload.set_result(file_id)
+
+    def get_payload(
+        self, template: str, delta_noms: int, delta_liks: int,
+        diff: dict = None
+    ) -> dict:
+        key = (
+            template, delta_noms, delta_liks, self.get_diff_key(diff),
             self.graph_visualization_url,
         )
-        self.bot.sendMessage(chat_id=chat_id, text=text, parse_mode='HTML')
+        with self.payloads_lock:
+            payload = self.payloads.get(key)
+            if payload is not None:
+                self.payloads.move_to_end(key)
+                return payload
+        payload = {
+            'text': self.render(template, delta_noms, delta_liks, diff),
+            'parse_mode': 'HTML',
+        }
+        with self.payloads_lock:
+            self.payloads[key] = payload
+            if len(self.payloads) > MAX_CACHED_PAYLOADS:
+                self.payloads.popitem(last=False)
+        return payload
+
+    def get_diff_key(self, diff: dict = None):
+        if not diff:
+            return None
+        return (
+            tuple(sorted(diff['added'].items())),
+            tuple(sorted(diff['removed'].items())),
+            tuple(diff['affected_nodes']),
+        )
+
+    def render(
+        self, template: str, delta_noms: int, delta_liks: int,
+        diff: dict = None
+    ) -> str:
+        text = TEMPLATES[template].format(
+            delta=self.get_human_delta(delta_noms, delta_liks),
+            url=self.graph_visualization_url,
+        )
+        if diff and template == DEFAULT_TEMPLATE:
+            text = '{}\n{}'.format(text, self.get_human_diff(diff))
+        return text
 
     def get_human_delta(self, delta_noms: int, delta_liks: int) -> str:
         if delta_noms == 0 and delta_liks == 0:
@@ -68,3 +238,35 @@ class GraphNotifier(Observer):
                 abs_delta_liks, liks_modifier, liks_word,
                 abs_delta_noms, noms_modifier, noms_word
             )
+
+    def get_human_diff(self, diff: dict) -> str:
+        changes = []
+        for counts, verb in ((diff['added'], 'added'),
+                             (diff['removed'], 'removed')):
+            relations = [
+                self.get_human_count(counts[relation], relation)
+                for relation in sorted(counts) if counts[relation]
+            ]
+            if relations:
+                changes.append('{} {}'.format(
+                    ' and '.join(relations), verb
+                ))
+        if not changes:
+            return ''
+        text = 'In detail: {}.'.format(', '.join(changes))
+
+        nodes = diff['affected_nodes']
+        if nodes:
+            listed = ', '.join(
+                escape(node) for node in nodes[:MAX_LISTED_NODES]
+            )
+            if len(nodes) > MAX_LISTED_NODES:
+                listed = '{} and {} more'.format(
+                    listed, len(nodes) - MAX_LISTED_NODES
+                )
+            text = '{}\nWho changed: {}.'.format(text, listed)
+        return text
+
+    def get_human_count(self, count: int, relation: str) -> str:
+        word = relation + 's' if count > 1 else relation
+        return '{} {}'.format(count, escape(word))
@@ -0,0 +1,362 @@
+from array import array
+from collections import OrderedDict
+from math import sqrt
+from threading import Lock
+import logging
+import random
+
+from .graph_snapshot import GraphSnapshot
+
+
+logger = logging.getLogger('mystery_graph_bot')
+
+
+LAYOUT_ITERATIONS = 20
+MAX_LAYOUT_NODES = 250
+MAX_SVG_EDGES = 20000
+MAX_CACHED_SVGS = 4
+
+SVG_SIZE = 1000
+SVG_MARGIN = 10
+RELATION_COLORS = {'lik': '#4a90d9', 'nom': '#d0543c'}
+DEFAULT_COLOR = '#999999'
+NODE_COLOR = '#333333'
+CHANGED_NODE_COLOR = '#f5a623'
+
+
+class GraphLayout:
+    # Force directed (Fruchterman-Reingold) layout kept from one cycle to the
+    # next, by upstream node id. Every update only moves the nodes that
+    # changed, the new ones and those not laid out yet, at most `max_nodes`
+    # of them, for `iterations` steps; the others stay where they were, so
+    # the drawing is stable and the cost of an update does not grow with
+    # the graph. A first layout of a big graph is thus spread over several
+    # cycles. Repulsion only comes from the nodes in the nearby cells of a
+    # grid, as in the grid variant of the algorithm. The grid and the
+    # neighbours of every node are kept too, and follow the edges of the
+    # diff of every snapshot instead of being built from the whole graph.
+    # Every node has a slot in the coordinate arrays for as long as it is in
+    # the graph; the grid and the neighbours hold slots.
+
+    def __init__(
+        self, iterations: int = LAYOUT_ITERATIONS,
+        max_nodes: int = MAX_LAYOUT_NODES, edge_length: float = 1.0, seed=0
+    ):
+        self.iterations = iterations
+        self.max_nodes = max_nodes
+        self.edge_length = edge_length
+        self.cell_size = 2 * edge_length
+        self.rng = random.Random(seed)
+        self.slots = {}
+        self.free_slots = []
+        self.xs = array('d')
+        self.ys = array('d')
+        self.grid = {}
+        self.neighbours = []
+        self.edge_count = None
+        self.snapshot = None
+        self.unsettled = set()
+
+    @property
+    def positions(self) -> dict:
+        return {
+            node_id: (self.xs[slot], self.ys[slot])
+            for node_id, slot in self.slots.items()
+        }
+
+    def update(self, snapshot: GraphSnapshot, changed_ids=(), diff=None):
+        # Returns the x and y coordinates of every node position of
+        # `snapshot`. `diff` is the one from the last snapshot laid out.
+        node_ids = snapshot.node_ids
+        present = set(node_ids)
+        gone = self.slots.keys() - present
+        new = sorted(present.difference(self.slots))
+        placed_before = len(self.slots) > len(gone)
+        for node_id in new:
+            self.allocate(node_id)
+        # Gone nodes keep their slots until their edges are unlinked.
+        self.update_neighbours(snapshot, diff)
+        for node_id in gone:
+            self.release(node_id)
+        self.unsettled &= present
+
+        self.unsettled.update(new)
+        active = OrderedDict.fromkeys(
+            node_id for node_id in changed_ids if node_id in present
+        )
+        for node_id in self.unsettled:
+            if len(active) >= self.max_nodes:
+                break
+            active[node_id] = None
+        active = list(active)[:self.max_nodes]
+
+        self.place(
+            [self.slots[node_id] for node_id in new], len(present),
+            placed_before
+        )
+        self.relax([self.slots[node_id] for node_id in active])
+        self.unsettled.difference_update(active)
+        slots = list(map(self.slots.__getitem__, node_ids))
+        return (
+            array('d', map(self.xs.__getitem__, slots)),
+            array('d', map(self.ys.__getitem__, slots)),
+        )
+
+    def allocate(self, node_id: int) -> None:
+        # The node is only added to the grid when placed.
+        if self.free_slots:
+            slot = self.free_slots.pop()
+            self.neighbours[slot] = []
+        else:
+            slot = len(self.xs)
+            self.xs.append(0.0)
+            self.ys.append(0.0)
+            self.neighbours.append([])
+        self.slots[node_id] = slot
+
+    def release(self, node_id: int) -> None:
+        slot = self.slots.pop(node_id)
+        cell = self.get_cell(slot)
+        nodes = self.grid[cell]
+        nodes.remove(slot)
+        if not nodes:
+            del self.grid[cell]
+        self.neighbours[slot] = []
+        self.free_slots.append(slot)
+
+    def update_neighbours(self, snapshot: GraphSnapshot, diff) -> None:
+        # Edges of the diff are applied to the neighbours of the last
+        # snapshot. They are built from the whole graph the first time, and
+        # whenever they do not match the snapshot.
+        last_snapshot, self.snapshot = self.snapshot, snapshot
+        if self.edge_count is None or (
+            diff is None and snapshot is not last_snapshot
+        ):
+            self.build_neighbours(snapshot)
+            return
+        if diff is not None:
+            try:
+                for source, target, _ in diff.removed_edges:
+                    self.unlink(self.slots[source], self.slots[target])
+                for source, target, _ in diff.added_edges:
+                    self.link(self.slots[source], self.slots[target])
+            except (KeyError, ValueError):
+                self.edge_count = -1
+        if self.edge_count != snapshot.edge_count:
+            logger.debug('Layout neighbours do not match the graph.')
+            self.build_neighbours(snapshot)
+
+    def build_neighbours(self, snapshot: GraphSnapshot) -> None:
+        node_ids = snapshot.node_ids
+        get_slot = self.slots.__getitem__
+        neighbours = [[] for _ in range(len(self.xs))]
+        for source, target in zip(
+            map(get_slot, map(node_ids.__getitem__, snapshot.sources)),
+            map(get_slot, map(node_ids.__getitem__, snapshot.targets))
+        ):
+            neighbours[source].append(target)
+            neighbours[target].append(source)
+        self.neighbours = neighbours
+        self.edge_count = snapshot.edge_count
+
+    def link(self, source: int, target: int) -> None:
+        self.neighbours[source].append(target)
+        self.neighbours[target].append(source)
+        self.edge_count += 1
+
+    def unlink(self, source: int, target: int) -> None:
+        self.neighbours[source].remove(target)
+        self.neighbours[target].remove(source)
+        self.edge_count -= 1
+
+    def get_cell(self, slot: int):
+        return (
+            int(self.xs[slot] // self.cell_size),
+            int(self.ys[slot] // self.cell_size),
+        )
+
+    def place(self, new, node_count: int, placed_before: bool) -> None:
+        # New nodes start next to their neighbours placed in earlier cycles,
+        # or anywhere in the area the whole graph should take. Placing them
+        # next to the ones placed in this same cycle would pile the first
+        # layout up in a few spots.
+        xs = self.xs
+        ys = self.ys
+        radius = sqrt(node_count) * self.edge_length / 2
+        new_slots = set(new)
+        for slot in new:
+            near = []
+            if placed_before:
+                near = [
+                    neighbour for neighbour in self.neighbours[slot]
+                    if neighbour not in new_slots
+                ]
+            if near:
+                xs[slot] = (
+                    sum(xs[neighbour] for neighbour in near) / len(near) +
+                    self.rng.uniform(-1, 1) * self.edge_length
+                )
+                ys[slot] = (
+                    sum(ys[neighbour] for neighbour in near) / len(near) +
+                    self.rng.uniform(-1, 1) * self.edge_length
+                )
+            else:
+                xs[slot] = self.rng.uniform(-radius, radius)
+                ys[slot] = self.rng.uniform(-radius, radius)
+            self.grid.setdefault(self.get_cell(slot), []).append(slot)
+
+    def relax(self, active) -> None:
+        k = self.edge_length
+        k2 = k * k
+        cell = self.cell_size
+        xs = self.xs
+        ys = self.ys
+        grid = self.grid
+        neighbours = self.neighbours
+        for iteration in range(self.iterations):
+            temperature = k * (1 - iteration / self.iterations)
+            for slot in active:
+                x = xs[slot]
+                y = ys[slot]
+                cell_x = int(x // cell)
+                cell_y = int(y // cell)
+                dx = dy = 0.0
+                for grid_x in (cell_x - 1, cell_x, cell_x + 1):
+                    for grid_y in (cell_y - 1, cell_y, cell_y + 1):
+                        for other in grid.get((grid_x, grid_y), ()):
+                            if other == slot:
+                                continue
+                            delta_x = x - xs[other]
+                            delta_y = y - ys[other]
+                            distance2 = delta_x * delta_x + delta_y * delta_y
+                            if distance2 < 1e-9:
+                                delta_x = self.rng.uniform(-0.01, 0.01)
+                                delta_y = self.rng.uniform(-0.01, 0.01)
+                                distance2 = 1e-4
+                            if distance2 < cell * cell:
+                                dx += delta_x * k2 / distance2
+                                dy += delta_y * k2 / distance2
+                for other in neighbours[slot]:
+                    delta_x = xs[other] - x
+                    delta_y = ys[other] - y
+                    distance = sqrt(delta_x * delta_x + delta_y * delta_y)
+                    dx += delta_x * distance / k
+                    dy += delta_y * distance / k
+                length = sqrt(dx * dx + dy * dy)
+                if length > temperature:
+                    dx *= temperature / length
+                    dy *= temperature / length
+                x += dx
+                y += dy
+                new_cell = (int(x // cell), int(y // cell))
+                if new_cell != (cell_x, cell_y):
+                    nodes = grid[cell_x, cell_y]
+                    nodes.remove(slot)
+                    if not nodes:
+                        del grid[cell_x, cell_y]
+                    grid.setdefault(new_cell, []).append(slot)
+                xs[slot] = x
+                ys[slot] = y
+
+
+class GraphRenderer:
+    # Keeps the layout of the graph up to date on every crunch, and renders
+    # it as SVG the first time it is asked for a given ETag. The last
+    # `cache_size` renders are kept. At most `max_edges` edges are drawn, so
+    # the file stays small enough to be sent to chats.
+
+    def __init__(
+        self, layout: GraphLayout = None, max_edges: int = MAX_SVG_EDGES,
+        cache_size: int = MAX_CACHED_SVGS
+    ):
+        self.layout = layout or GraphLayout()
+        self.max_edges = max_edges
+        self.cache_size = cache_size
+        self.current = None
+        self.svgs = OrderedDict()
+        self.lock = Lock()
+
+    def update(self, etag: str, snapshot: GraphSnapshot, diff=None) -> None:
+        changed_ids = diff.affected_nodes if diff else []
+        xs, ys = self.layout.update(snapshot, changed_ids, diff)
+        with self.lock:
+            self.current = (etag, snapshot, xs, ys, changed_ids)
+
+    def get_svg(self, etag: str):
+        # Returns None unless `etag` is the last graph laid out, or one of
+        # the last rendered.
+        with self.lock:
+            svg = self.svgs.get(etag)
+            if svg is not None:
+                self.svgs.move_to_end(etag)
+                return svg
+            if self.current is None or self.current[0] != etag:
+                return None
+            _, snapshot, xs, ys, changed_ids = self.current
+            changed_ids = set(changed_ids)
+            changed = [
+                position for position, node_id in enumerate(snapshot.node_ids)
+                if node_id in changed_ids
+            ]
+            svg = render_svg(
+                snapshot, xs, ys, changed, max_edges=self.max_edges
+            )
+            self.svgs[etag] = svg
+            if len(self.svgs) > self.cache_size:
+                self.svgs.popitem(last=False)
+            return svg
+
+
+def render_svg(
+    snapshot: GraphSnapshot, xs, ys, changed=(),
+    max_edges: int = MAX_SVG_EDGES, size: int = SVG_SIZE
+) -> bytes:
+    # Edges of a relation, and nodes, are single paths, which keeps the file
+    # several times smaller than an element per line or circle.
+    if len(xs):
+        min_x, max_x, min_y, max_y = min(xs), max(xs), min(ys), max(ys)
+    else:
+        min_x = max_x = min_y = max_y = 0.0
+    scale = (size - 2 * SVG_MARGIN) / max(max_x - min_x, max_y - min_y, 1e-9)
+
+    def point(position):
+        return '{:.1f} {:.1f}'.format(
+            SVG_MARGIN + (xs[position] - min_x) * scale,
+            SVG_MARGIN + (ys[position] - min_y) * scale
+        )
+
+    points = [point(position) for position in range(len(xs))]
+    paths = {}
+    edges = zip(snapshot.sources, snapshot.targets, snapshot.relations)
+    for index, (source, target, relation) in enumerate(edges):
+        if index >= max_edges:
+            break
+        paths.setdefault(relation, []).append(
+            'M{}L{}'.format(points[source], points[target])
+        )
+
+    parts = [
+        '<svg xmlns="http://www.w3.org/2000/svg" width="{0}" height="{0}" '
+        'viewBox="0 0 {0} {0}">'.format(size),
+        '<rect width="100%" height="100%" fill="white"/>',
+    ]
+    for relation, segments in sorted(paths.items()):
+        name = snapshot.relation_names[relation]
+        parts.append(
+            '<path fill="none" stroke="{}" stroke-width="0.5" '
+            'stroke-opacity="0.6" d="{}"/>'.format(
+                RELATION_COLORS.get(name, DEFAULT_COLOR), ''.join(segments)
+            )
+        )
+    for positions, color, width in (
+        (range(len(xs)), NODE_COLOR, 3), (changed, CHANGED_NODE_COLOR, 6)
+    ):
+        if len(positions):
+            parts.append(
+                '<path stroke="{}" stroke-width="{}" stroke-linecap="round" '
+                'd="{}"/>'.format(color, width, ''.join(
+                    'M{}h0'.format(points[position]) for position in positions
+                ))
+            )
+    parts.append('</svg>')
+    return '\n'.join(parts).encode()
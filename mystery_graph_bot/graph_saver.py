@@ -1,8 +1,11 @@
 import logging
+import threading
 
 from marshmallow import ValidationError
 from rx import Observer
 
+from .serializers import DataPair
+
 
 logger = logging.getLogger('mystery_graph_bot')
 
@@ -10,15 +13,24 @@ logger = logging.getLogger('mystery_graph_bot')
 class GraphSaver(Observer):
     def __init__(self, graph_data):
         self.graph_data = graph_data
+        # Late results are saved from worker callbacks.
+        self.lock = threading.Lock()
 
     def on_next(self, data):
         try:
             data_pair_serializer = DataPair(strict=True)
             data_pair, _ = data_pair_serializer.load(data)
-            new_data, old_data = (data_pair["new"], data_pair["old"])
+            new_data = data_pair["new"]
         except ValidationError:
             logger.error('GraphSaver got unexpected data')
             return
         else:
-            graph_data.data = new_data
-            graph_data.save()
+            with self.lock:
+                self.graph_data.data = new_data
+                self.graph_data.save()
+
+    def on_error(self, error):
+        logger.error('GraphSaver got an error: {}'.format(error))
+
+    def on_completed(self):
+        pass
@@ -0,0 +1,142 @@
+from array import array
+from collections import Counter
+from itertools import compress
+from operator import countOf
+
+
+RELATIONS = ('lik', 'nom')
+
+
+class GraphSnapshot:
+    # Column oriented copy of a graph. Edge `i` goes from node position
+    # `sources[i]` to node position `targets[i]` and its relation is
+    # `relation_names[relations[i]]`. Node position `p` stands for the node
+    # whose index in the upstream graph is `node_ids[p]`.
+
+    def __init__(
+        self, sources, targets, relations, node_ids, node_names,
+        relation_names=RELATIONS
+    ):
+        self.sources = sources
+        self.targets = targets
+        self.relations = relations
+        self.node_ids = node_ids
+        self.node_names = node_names
+        self.relation_names = tuple(relation_names)
+
+    @classmethod
+    def from_graph(cls, raw_graph: dict) -> 'GraphSnapshot':
+        builder = GraphSnapshotBuilder()
+        for link in raw_graph['links']:
+            builder.add_link(link['source'], link['target'], link['value'])
+        for node in raw_graph['nodes']:
+            builder.add_node(node['index'], node['name'])
+        return builder.build()
+
+    @property
+    def edge_count(self) -> int:
+        return len(self.relations)
+
+    @property
+    def node_count(self) -> int:
+        return len(self.node_ids)
+
+    def relation_code(self, relation: str):
+        try:
+            return self.relation_names.index(relation)
+        except ValueError:
+            return None
+
+    def relation_mask(self, relation: str):
+        code = self.relation_code(relation)
+        if code is None:
+            return iter(())
+        return map(code.__eq__, self.relations)
+
+    def count(self, relation: str) -> int:
+        code = self.relation_code(relation)
+        if code is None:
+            return 0
+        return countOf(self.relations, code)
+
+    def edges(self, relation: str):
+        return compress(
+            zip(self.sources, self.targets), self.relation_mask(relation)
+        )
+
+    def indegree_counts(self, relation: str) -> Counter:
+        return Counter(compress(self.targets, self.relation_mask(relation)))
+
+    def degree_counts(self, relation: str) -> Counter:
+        counts = Counter(compress(self.sources, self.relation_mask(relation)))
+        counts.update(compress(self.targets, self.relation_mask(relation)))
+        return counts
+
+    def indegree(self, relation: str) -> array:
+        return self._counts_to_array(self.indegree_counts(relation))
+
+    def degree(self, relation: str) -> array:
+        return self._counts_to_array(self.degree_counts(relation))
+
+    def max_indegree(self, relation: str) -> int:
+        return max(self.indegree_counts(relation).values(), default=0)
+
+    def max_degree(self, relation: str) -> int:
+        return max(self.degree_counts(relation).values(), default=0)
+
+    def _counts_to_array(self, counts: Counter) -> array:
+        degrees = array('i', bytes(4 * self.node_count))
+        for position, count in counts.items():
+            degrees[position] = count
+        return degrees
+
+
+class GraphSnapshotBuilder:
+    # Sink for `StreamingGraphParser`. Links usually come before nodes in the
+    # upstream document, so node positions are assigned the first time a
+    # node index is seen, wherever that is.
+
+    def __init__(self):
+        self.sources = array('i')
+        self.targets = array('i')
+        self.relations = array('B')
+        self.node_ids = array('q')
+        self.node_names = []
+        self.relation_names = list(RELATIONS)
+        self._positions = {}
+        self._relation_codes = {
+            relation: code for code, relation in enumerate(RELATIONS)
+        }
+
+    def add_link(self, source: int, target: int, value: str) -> None:
+        self.sources.append(self._intern_node(source))
+        self.targets.append(self._intern_node(target))
+        self.relations.append(self._intern_relation(value))
+
+    def add_node(self, index: int, name: str) -> None:
+        self.node_names[self._intern_node(index)] = name
+
+    def build(self) -> GraphSnapshot:
+        return GraphSnapshot(
+            self.sources, self.targets, self.relations,
+            self.node_ids, self.node_names, self.relation_names
+        )
+
+    def _intern_node(self, index: int) -> int:
+        position = self._positions.get(index)
+        if position is None:
+            position = len(self.node_ids)
+            self._positions[index] = position
+            self.node_ids.append(index)
+            self.node_names.append('')
+        return position
+
+    def _intern_relation(self, value: str) -> int:
+        code = self._relation_codes.get(value)
+        if code is None:
+            code = len(self.relation_names)
+            if code > 0xff:
+                raise ValueError('Too many distinct link values')
+            self._relation_codes[value] = code
+            self.relation_names.append(value)
+        return code
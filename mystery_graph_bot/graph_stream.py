@@ -0,0 +1,201 @@
+import codecs
+import json
+from collections import defaultdict
+
+from .errors import SchemaLoadError
+from .fast_schema import compile_checker
+from .serializers import Graph, GraphLink, GraphNode
+
+
+WHITESPACE = ' \t\n\r'
+REQUIRED_FIELD_MSG = 'Missing data for required field.'
+
+
+class LinkCounter:
+    def __init__(self):
+        self.counts = defaultdict(int)
+
+    def add_link(self, source: int, target: int, value: str) -> None:
+        self.counts[value] += 1
+
+    def add_node(self, index: int, name: str) -> None:
+        pass
+
+    def __getitem__(self, value: str) -> int:
+        return self.counts[value]
+
+
+class MultiSink:
+    def __init__(self, *sinks):
+        self.sinks = sinks
+
+    def add_link(self, source: int, target: int, value: str) -> None:
+        for sink in self.sinks:
+            sink.add_link(source, target, value)
+
+    def add_node(self, index: int, name: str) -> None:
+        for sink in self.sinks:
+            sink.add_node(index, name)
+
+
+class StreamingGraphParser:
+    # Parses a `Graph` JSON document from an iterable of byte (or str)
+    # chunks, such as `response.iter_content()`, handing every link and node
+    # to `sink` as soon as it is decoded. Only one array item is held in
+    # memory at a time.
+
+    def __init__(self, sink, encoding: str = 'utf-8'):
+        self.sink = sink
+        self.encoding = encoding
+        self._decoder = json.JSONDecoder()
+        self._check_link = compile_checker(GraphLink)
+        self._check_node = compile_checker(GraphNode)
+
+    def parse(self, chunks):
+        self._chunks = iter(chunks)
+        self._text_decoder = codecs.getincrementaldecoder(self.encoding)()
+        self._buffer = ''
+        self._pos = 0
+        self._eof = False
+        self._errors = {}
+        seen_keys = set()
+
+        self._expect('{')
+        if self._peek() == '}':
+            self._pos += 1
+        else:
+            while True:
+                key = self._read_value()
+                if not isinstance(key, str):
+                    self._fail('Expecting property name enclosed in double '
+                               'quotes')
+                self._expect(':')
+                if key == 'links':
+                    self._read_items(key, self._handle_link)
+                elif key == 'nodes':
+                    self._read_items(key, self._handle_node)
+                else:
+                    self._read_value()
+                seen_keys.add(key)
+                if self._peek() == ',':
+                    self._pos += 1
+                    continue
+                self._expect('}')
+                break
+        if self._peek() is not None:
+            self._fail('Extra data')
+
+        for key in ('links', 'nodes'):
+            if key not in seen_keys:
+                self._errors[key] = [REQUIRED_FIELD_MSG]
+        if self._errors:
+            raise SchemaLoadError(Graph, self._errors)
+        return self.sink
+
+    def _handle_link(self, position: int, link) -> None:
+        if self._check_link(link):
+            self.sink.add_link(link['source'], link['target'], link['value'])
+            return
+        link = self._load_item(GraphLink(), 'links', position, link)
+        if link is not None:
+            self.sink.add_link(link['source'], link['target'], link['value'])
+
+    def _handle_node(self, position: int, node) -> None:
+        if self._check_node(node):
+            self.sink.add_node(node['index'], node['name'])
+            return
+        node = self._load_item(GraphNode(), 'nodes', position, node)
+        if node is not None:
+            self.sink.add_node(node['index'], node['name'])
+
+    def _load_item(self, schema, key: str, position: int, item):
+        # Odd looking items go through marshmallow so that coercion rules and
+        # error messages are exactly the ones of the `Graph` schema.
+        if not isinstance(item, dict):
+            self._errors.setdefault(key, {})[position] = {
+                '_schema': ['Invalid input type.']
+            }
+            return None
+        result = schema.load(item)
+        if result.errors:
+            self._errors.setdefault(key, {})[position] = result.errors
+            return None
+        return result.data
+
+    def _read_items(self, key: str, handle_item) -> None:
+        if self._peek() != '[':
+            self._read_value()
+            self._errors[key] = ['Invalid type.']
+            return
+        self._pos += 1
+        if self._peek() == ']':
+            self._pos += 1
+            return
+        position = 0
+        while True:
+            handle_item(position, self._read_value())
+            position += 1
+            if self._peek() == ',':
+                self._pos += 1
+                continue
+            self._expect(']')
+            return
+
+    def _read_value(self):
+        self._peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError:
+                # Either the value is malformed or it continues in the next
+                # chunk. Read at least as much again as what is pending so
+                # that retries stay linear on big values.
+                if not self._fill(len(self._buffer) - self._pos):
+                    raise
+                continue
+            if end == len(self._buffer) and self._fill(1):
+                # Values such as numbers could continue in the next chunk.
+                continue
+            self._pos = end
+            return value
+
+    def _expect(self, char: str) -> None:
+        if self._peek() != char:
+            self._fail("Expecting '{}' delimiter".format(char))
+        self._pos += 1
+
+    def _peek(self):
+        while True:
+            buffer = self._buffer
+            length = len(buffer)
+            pos = self._pos
+            while pos < length and buffer[pos] in WHITESPACE:
+                pos += 1
+            self._pos = pos
+            if pos < length:
+                return buffer[pos]
+            if not self._fill(1):
+                return None
+
+    def _fill(self, min_size: int) -> bool:
+        if self._pos > 0:
+            self._buffer = self._buffer[self._pos:]
+            self._pos = 0
+        pieces = [self._buffer]
+        read = 0
+        while read < min_size and not self._eof:
+            try:
+                chunk = next(self._chunks)
+            except StopIteration:
+                self._eof = True
+                chunk = self._text_decoder.decode(b'', final=True)
+            else:
+                if isinstance(chunk, bytes):
+                    chunk = self._text_decoder.decode(chunk)
+            pieces.append(chunk)
+            read += len(chunk)
+        self._buffer = ''.join(pieces)
+        return read > 0
+
+    def _fail(self, msg: str):
+        raise json.JSONDecodeError(msg, self._buffer, self._pos)
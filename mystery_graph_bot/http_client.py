@@ -0,0 +1,143 @@
+from threading import Lock
+import logging
+
+import requests
+from requests import Response
+from requests.adapters import HTTPAdapter
+
+from .errors import BodyTooLargeError
+from .metrics import REGISTRY
+
+
+logger = logging.getLogger('mystery_graph_bot')
+
+
+DOWNLOADED_BYTES = REGISTRY.counter(
+    'mgb_http_downloaded_bytes_total',
+    'Bytes of graph responses, as sent and after decompression.',
+    ['encoding']
+)
+CONNECTIONS = REGISTRY.counter(
+    'mgb_http_connections_total', 'Graph requests by connection used.',
+    ['connection']
+)
+
+# Attribute noting on a pooled connection the socket it was last seen with.
+SEEN_SOCKET = '_mgb_seen_socket'
+
+
+class GraphHttpClient:
+    # Shared HTTP layer for graph polling. Keeps connections alive between
+    # polls through a pooled `requests.Session`, asks for compressed bodies,
+    # refuses bodies bigger than `max_body_size` (None for no limit) and
+    # counts how it went in `stats`. A client is shared by the threads of
+    # the IO executor, so `stats` is only updated through `count`.
+
+    def __init__(
+        self, connect_timeout: float = 3.05, read_timeout: float = 5,
+        max_body_size: int = None, pool_maxsize: int = 4,
+        chunk_size: int = 64 * 1024
+    ):
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_body_size = max_body_size
+        self.chunk_size = chunk_size
+        self.adapter = HTTPAdapter(
+            pool_connections=pool_maxsize, pool_maxsize=pool_maxsize
+        )
+        self.session = requests.Session()
+        self.session.mount('http://', self.adapter)
+        self.session.mount('https://', self.adapter)
+        self.session.headers['Accept-Encoding'] = 'gzip, deflate'
+        self.stats = {
+            'requests': 0,
+            'new_connections': 0,
+            'reused_connections': 0,
+            'bytes_on_wire': 0,
+            'bytes_decoded': 0,
+        }
+        self.stats_lock = Lock()
+
+    def get(self, url: str, headers: dict = None, stream: bool = False):
+        # With `stream` the body is left unread, and must be consumed through
+        # `iter_content` for the size guard and the counters to apply.
+        response = self.session.get(
+            url, headers=headers, timeout=self.timeout, stream=True
+        )
+        if self.is_new_connection(response):
+            self.count(requests=1, new_connections=1)
+            CONNECTIONS.labels('new').inc()
+        else:
+            self.count(requests=1, reused_connections=1)
+            CONNECTIONS.labels('reused').inc()
+
+        try:
+            content_length = int(response.headers.get('Content-Length', ''))
+        except ValueError:
+            content_length = None
+        if (
+            self.max_body_size is not None and content_length is not None
+            and content_length > self.max_body_size
+        ):
+            response.close()
+            raise BodyTooLargeError(url, self.max_body_size)
+
+        if not stream:
+            # Same thing `requests` does when not streaming, plus the guard.
+            try:
+                response._content = b''.join(
+                    self.iter_content(response, self.chunk_size)
+                )
+            except BodyTooLargeError:
+                response.close()
+                raise
+        return response
+
+    def iter_content(self, response: Response, chunk_size: int = None):
+        decoded = 0
+        try:
+            for chunk in response.iter_content(
+                chunk_size=chunk_size or self.chunk_size
+            ):
+                decoded += len(chunk)
+                if (
+                    self.max_body_size is not None
+                    and decoded > self.max_body_size
+                ):
+                    raise BodyTooLargeError(response.url, self.max_body_size)
+                yield chunk
+        finally:
+            wire_bytes = self.get_wire_bytes(response)
+            self.count(bytes_decoded=decoded, bytes_on_wire=wire_bytes)
+            DOWNLOADED_BYTES.labels('wire').inc(wire_bytes)
+            DOWNLOADED_BYTES.labels('decoded').inc(decoded)
+            logger.debug(
+                'Graph response: {} bytes on wire, {} bytes decoded'
+                .format(wire_bytes, decoded)
+            )
+
+    def count(self, **increments: int) -> None:
+        with self.stats_lock:
+            for key, increment in increments.items():
+                self.stats[key] += increment
+
+    def is_new_connection(self, response: Response) -> bool:
+        # Decided from the connection of this very response, since other
+        # threads open connections of their own meanwhile. The socket it
+        # last carried is noted on the connection; a connection that gets
+        # reopened after the server dropped it has a new socket.
+        connection = getattr(response.raw, '_connection', None)
+        sock = getattr(connection, 'sock', None)
+        if sock is None:
+            return True
+        new = getattr(connection, SEEN_SOCKET, None) is not sock
+        setattr(connection, SEEN_SOCKET, sock)
+        return new
+
+    def get_wire_bytes(self, response: Response) -> int:
+        try:
+            return int(response.raw.tell())
+        except (AttributeError, TypeError, ValueError):
+            return 0
+
+    def close(self) -> None:
+        self.session.close()
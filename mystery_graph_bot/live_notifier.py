@@ -0,0 +1,207 @@
+from threading import Lock, Timer
+from typing import Union
+import json
+import logging
+import sqlite3
+import time
+
+from telegram.error import BadRequest
+
+from .graph_notifier import GraphNotifier
+from .subscriber_store import normalize_chat_id
+
+
+logger = logging.getLogger('mystery_graph_bot')
+
+
+LIVE_INTERVAL = 60
+
+LIVE_TEMPLATE = (
+    '<b>Mystery Graph</b>\n'
+    'Liks: {liks}\n'
+    'Noms: {noms}\n'
+    'Last change: {delta}\n'
+    'Updated: {updated}\n'
+    '<a href="{url}">Check it out</a>'
+)
+
+# Answers to `editMessageText` for live messages that are gone, or too old
+# to be edited; a new live message is sent instead.
+LOST_MESSAGE_ERRORS = ('message to edit not found', "message can't be edited")
+
+
+class LiveMessageStore:
+    # Id of the live message of every chat, in an SQLite database, so the
+    # same messages are edited after a restart.
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        with self.lock, self.connection:
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS live_messages ('
+                'chat_id TEXT PRIMARY KEY, message_id INTEGER NOT NULL)'
+            )
+            rows = self.connection.execute(
+                'SELECT chat_id, message_id FROM live_messages'
+            ).fetchall()
+        self.message_ids = {
+            json.loads(chat_id): message_id for chat_id, message_id in rows
+        }
+
+    def get(self, chat_id):
+        return self.message_ids.get(normalize_chat_id(chat_id))
+
+    def set(self, chat_id, message_id: int) -> None:
+        chat_id = normalize_chat_id(chat_id)
+        with self.lock:
+            with self.connection:
+                self.connection.execute(
+                    'INSERT OR REPLACE INTO live_messages '
+                    '(chat_id, message_id) VALUES (?, ?)',
+                    (json.dumps(chat_id), message_id)
+                )
+            self.message_ids[chat_id] = message_id
+
+    def delete(self, chat_id) -> None:
+        chat_id = normalize_chat_id(chat_id)
+        with self.lock:
+            if self.message_ids.pop(chat_id, None) is None:
+                return
+            with self.connection:
+                self.connection.execute(
+                    'DELETE FROM live_messages WHERE chat_id = ?',
+                    (json.dumps(chat_id),)
+                )
+
+    def close(self) -> None:
+        with self.lock:
+            self.connection.close()
+
+
+class LiveGraphNotifier(GraphNotifier):
+    # Keeps one live message per chat with the current numbers of the graph
+    # and edits it on every change, instead of sending a new message. Every
+    # chat is edited at most once per `interval` seconds: changes coming
+    # sooner are shown by a later edit, from a timer thread, so the numbers
+    # of a chat are at most `interval` seconds old.
+
+    def __init__(
+        self, bot, chats, graph_visualization_url, message_store, sender=None,
+        subscriber_store=None, interval: float = LIVE_INTERVAL,
+        clock=time.monotonic, timer_factory=Timer
+    ):
+        super().__init__(
+            bot, chats, graph_visualization_url, sender=sender,
+            subscriber_store=subscriber_store
+        )
+        self.message_store = message_store
+        self.interval = interval
+        self.clock = clock
+        self.timer_factory = timer_factory
+        self.text = None
+        self.next_edit_at = {}
+        self.stale_chats = set()
+        self.timer = None
+        self.lock = Lock()
+
+    def get_changes(self, data):
+        changes = super().get_changes(data)
+        if changes is not None:
+            text = self.render_live(data['new'], *changes)
+            with self.lock:
+                self.text = text
+        return changes
+
+    def render_live(
+        self, new_data: dict, delta_noms: int, delta_liks: int,
+        diff: dict = None
+    ) -> str:
+        return LIVE_TEMPLATE.format(
+            liks=new_data['liks'], noms=new_data['noms'],
+            delta=self.get_human_delta(delta_noms, delta_liks),
+            updated=time.strftime('%Y-%m-%d %H:%M UTC', time.gmtime()),
+            url=self.graph_visualization_url,
+        )
+
+    def send_changes_to_chat(self, chat_id: Union[str, int], *changes):
+        # The live message shows the latest numbers, whatever `changes`.
+        with self.lock:
+            now = self.clock()
+            if now < self.next_edit_at.get(chat_id, 0):
+                self.stale_chats.add(chat_id)
+                self.start_timer(now)
+                return
+            self.next_edit_at[chat_id] = now + self.interval
+            self.stale_chats.discard(chat_id)
+            text = self.text
+        if text is not None:
+            self.show(chat_id, text)
+
+    def show(self, chat_id: Union[str, int], text: str) -> None:
+        message_id = self.message_store.get(chat_id)
+        if message_id is not None:
+            try:
+                self.sender.edit_message(
+                    chat_id, message_id, text=text, parse_mode='HTML'
+                )
+                return
+            except BadRequest as e:
+                error = str(e).lower()
+                if 'not modified' in error:
+                    return
+                if not any(lost in error for lost in LOST_MESSAGE_ERRORS):
+                    raise
+                logger.info('Live message of chat {} is lost: {}'.format(
+                    chat_id, e
+                ))
+        message = self.sender.send_message(
+            chat_id, text=text, parse_mode='HTML'
+        )
+        self.message_store.set(chat_id, message.message_id)
+
+    def start_timer(self, now: float) -> None:
+        # Called with the lock held.
+        if self.timer is not None:
+            return
+        delay = min(
+            self.next_edit_at[chat_id] for chat_id in self.stale_chats
+        ) - now
+        self.timer = self.timer_factory(max(0, delay), self.on_timer)
+        self.timer.daemon = True
+        self.timer.start()
+
+    def on_timer(self) -> None:
+        with self.lock:
+            self.timer = None
+            now = self.clock()
+            due_chats = [
+                chat_id for chat_id in self.stale_chats
+                if self.next_edit_at[chat_id] <= now
+            ]
+            self.stale_chats.difference_update(due_chats)
+        try:
+            report = self.sender.fan_out(due_chats, self.send_changes_to_chat)
+            self.prune(report.errors, len(report.latencies))
+        except Exception:
+            logger.exception('Could not update live messages')
+        with self.lock:
+            if self.stale_chats and self.timer is None:
+                self.start_timer(self.clock())
+
+    def prune(self, errors: dict, delivered: int) -> None:
+        super().prune(errors, delivered)
+        if self.subscriber_store is None:
+            return
+        for chat_id in errors:
+            if chat_id not in self.subscriber_store:
+                self.message_store.delete(chat_id)
+
+    def close(self) -> None:
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+        self.message_store.close()
@@ -1,3 +1,481 @@
-import rx
-from rx import Observable, Observer
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import asyncio
+import logging
+import os
 
+# Modules depending on telegram, requests, rx or igraph are imported by the
+# functions that need them, so importing this module (and validating the
+# config) stays cheap.
+from .clique_tracker import CliqueTracker
+from .graph_data import GraphData, make_data_pair
+from .graph_diff import GraphDiffer
+from .poll_scheduler import PollScheduler
+from .snapshot_file import SnapshotStore
+from .state_log import FSYNC_INTERVAL
+
+
+logger = logging.getLogger('mystery_graph_bot')
+
+
+IO_WORKERS = 16
+SENDER_WORKERS = 8
+
+
+def run(config: dict, do_once: bool = False) -> None:
+    from .graph_saver import GraphSaver
+    from .profiling import ProfiledObserver
+
+    sources = get_graph_sources(config)
+    if len(sources) > 1:
+        raise ValueError(
+            'Several graphs can only be watched with the asyncio runner'
+        )
+    config = sources[0]
+    graph_data = make_graph_data(config)
+    bot = make_bot(config)
+    sender = make_sender(config, bot)
+    cruncher = make_cruncher(config)
+    restore_cruncher(cruncher, graph_data)
+    saver = GraphSaver(graph_data)
+    profiler = make_profiler(config)
+    data_pairs = make_pipeline(
+        config, graph_data, do_once, cruncher, profiler
+    )
+    subscriber_store = make_subscriber_store(config)
+    notifier = make_notifier(
+        config, bot, sender, subscriber_store, cruncher.renderer
+    )
+    coalescer = make_coalescer(config, notifier.on_next)
+    observers = [('notify', coalescer or notifier)]
+    recorder = make_recorder(config)
+    if recorder is not None:
+        observers.append(('observe', recorder))
+    result_cache = None
+    if config.get('commands') and not do_once:
+        result_cache = make_result_cache(config, graph_data)
+        observers.append(('observe', result_cache))
+    # The saver must come last, so that the other observers got the data
+    # pair before the old data is replaced.
+    observers.append(('save', saver))
+    for stage, observer in observers:
+        if profiler is not None:
+            observer = ProfiledObserver(observer, profiler, stage)
+        data_pairs.subscribe(observer)
+    subscribe_late_data_pairs(
+        graph_data, cruncher, [recorder, result_cache, saver]
+    )
+    command_handler = None
+    if result_cache is not None:
+        command_handler = make_command_handler(
+            bot, [result_cache], config['chat_whitelist'], sender,
+            [subscriber_store] if subscriber_store is not None else []
+        )
+    metrics_server = start_metrics_server(config)
+    try:
+        data_pairs.connect()
+    finally:
+        if command_handler is not None:
+            command_handler.stop()
+        # Changes held back for coalescing are notified before leaving.
+        if coalescer is not None:
+            coalescer.flush()
+        notifier.close()
+        sender.shutdown()
+        graph_data.close()
+        if subscriber_store is not None:
+            subscriber_store.close()
+        if metrics_server is not None:
+            metrics_server.close()
+
+
+def run_async(config: dict, do_once: bool = False) -> None:
+    # Every graph has its own fetcher, cruncher, notifier and state, but they
+    # all share the event loop, the executors, the HTTP connection pool and
+    # the Telegram sender, so each extra graph costs little.
+    from .async_runner import AsyncGraphRunner
+    from .graph_saver import GraphSaver
+
+    sources = get_graph_sources(config)
+    bot = make_bot(config)
+    sender = make_sender(config, bot)
+    http_client = make_http_client(config, pool_maxsize=IO_WORKERS)
+    loop = asyncio.new_event_loop()
+    io_executor = ThreadPoolExecutor(max_workers=IO_WORKERS)
+    cpu_executor = ThreadPoolExecutor(max_workers=1)
+    process_pool = None
+    if config.get('crunch_workers'):
+        process_pool = ProcessPoolExecutor(
+            max_workers=config['crunch_workers']
+        )
+
+    runners = []
+    graphs_data = []
+    recorders = []
+    result_caches = []
+    subscriber_stores = []
+    for source in sources:
+        graph_data = make_graph_data(source)
+        graphs_data.append(graph_data)
+        cruncher = make_cruncher(source, process_pool)
+        restore_cruncher(cruncher, graph_data)
+        saver = GraphSaver(graph_data)
+        observers = []
+        recorder = make_recorder(source)
+        if recorder is not None:
+            recorders.append(recorder)
+            observers.append(recorder)
+        result_cache = None
+        if config.get('commands') and not do_once:
+            result_cache = make_result_cache(
+                source, graph_data, name=source.get('name')
+            )
+            result_caches.append(result_cache)
+            observers.append(result_cache)
+        subscribe_late_data_pairs(
+            graph_data, cruncher, observers + [saver]
+        )
+        fetcher = make_fetcher(source, graph_data, http_client=http_client)
+        profiler = make_profiler(source, name=source.get('name'))
+        subscriber_store = make_subscriber_store(source)
+        if subscriber_store is not None:
+            subscriber_stores.append(subscriber_store)
+        notifier = make_notifier(
+            source, bot, sender, subscriber_store, cruncher.renderer
+        )
+        runners.append(AsyncGraphRunner(
+            fetcher, cruncher, notifier, saver,
+            graph_data, source['refresh_time'], loop=loop,
+            io_executor=io_executor, cpu_executor=cpu_executor,
+            scheduler=fetcher.scheduler, observers=observers,
+            profiler=profiler,
+            coalesce_window=source.get('coalesce_window'),
+            coalesce_max_delay=source.get('coalesce_max_delay', 300)
+        ))
+
+    command_handler = None
+    if result_caches:
+        chats = [
+            chat_id for source in sources
+            for chat_id in source['chat_whitelist']
+        ]
+        command_handler = make_command_handler(
+            bot, result_caches, chats, sender, subscriber_stores
+        )
+
+    metrics_server = start_metrics_server(config)
+    # Spreads the first polls over the first refresh time, so the graphs do
+    # not all hit the network at once.
+    runs = []
+    for index, runner in enumerate(runners):
+        start_delay = 0
+        if not do_once:
+            start_delay = index * runner.refresh_time / len(runners)
+        runs.append(loop.create_task(runner.run(
+            cycles=1 if do_once else None, start_delay=start_delay
+        )))
+    try:
+        loop.run_until_complete(asyncio.gather(*runs))
+    finally:
+        # Changes held back for coalescing are notified before leaving.
+        for runner in runners:
+            loop.run_until_complete(runner.flush_coalesced())
+        if command_handler is not None:
+            command_handler.stop()
+        io_executor.shutdown(wait=False)
+        cpu_executor.shutdown(wait=False)
+        if process_pool is not None:
+            process_pool.shutdown(wait=False)
+        for runner in runners:
+            runner.notifier.close()
+        sender.shutdown()
+        http_client.close()
+        for graph_data in graphs_data:
+            graph_data.close()
+        for recorder in recorders:
+            recorder.on_completed()
+        for subscriber_store in subscriber_stores:
+            subscriber_store.close()
+        if metrics_server is not None:
+            metrics_server.close()
+        loop.close()
+
+
+def get_graph_sources(config: dict) -> list:
+    # Configs of every watched graph. Each of `graphs` gets the top level
+    # settings it does not override.
+    if not config.get('graphs'):
+        return [config]
+    shared = {
+        key: value for key, value in config.items() if key != 'graphs'
+    }
+    return [dict(shared, **source) for source in config['graphs']]
+
+
+def make_bot(config: dict):
+    # Besides the sender workers, the connection pool is shared by the
+    # getUpdates long-poll and a file upload or command reply; requests
+    # finding it full would open a connection of their own and drop it.
+    from telegram.bot import Bot
+    from telegram.utils.request import Request
+
+    con_pool_size = config.get('sender_workers', SENDER_WORKERS) + 2
+    return Bot(config['token'], request=Request(con_pool_size=con_pool_size))
+
+
+def make_sender(config: dict, bot):
+    from .telegram_sender import TelegramSender
+
+    return TelegramSender(bot, ThreadPoolExecutor(
+        max_workers=config.get('sender_workers', SENDER_WORKERS)
+    ))
+
+
+def make_graph_data(config: dict):
+    return GraphData(
+        config['data_file'], fsync=config.get('state_fsync', FSYNC_INTERVAL)
+    )
+
+
+def make_fetcher(
+    config: dict, graph_data, do_once: bool = False, http_client=None,
+    profiler=None
+):
+    from .graph_fetcher import GraphFetcher
+
+    return GraphFetcher(
+        graph_data, config['graph_url'], config['refresh_time'],
+        do_once=do_once, stream=config.get('stream_graph', False),
+        http_client=http_client or make_http_client(config),
+        fingerprint_edges=config.get('fingerprint_edges', False),
+        scheduler=make_scheduler(config), profiler=profiler
+    )
+
+
+def make_scheduler(config: dict):
+    return PollScheduler(
+        config['refresh_time'],
+        min_interval=config.get('min_refresh_time'),
+        max_interval=config.get('max_refresh_time'),
+        max_backoff=config.get('max_backoff_time', 600),
+        failure_threshold=config.get('failure_threshold', 5),
+    )
+
+
+def make_http_client(config: dict, pool_maxsize: int = 4):
+    from .http_client import GraphHttpClient
+
+    return GraphHttpClient(
+        connect_timeout=config.get('connect_timeout', 3.05),
+        read_timeout=config.get('read_timeout', 5.0),
+        max_body_size=config.get('max_graph_size'),
+        pool_maxsize=pool_maxsize,
+    )
+
+
+def make_notifier(
+    config: dict, bot, sender=None, subscriber_store=None, renderer=None
+):
+    if config.get('live_message', False):
+        from .live_notifier import LiveGraphNotifier, LiveMessageStore
+
+        return LiveGraphNotifier(
+            bot, config['chat_whitelist'], config['graph_visualization_url'],
+            LiveMessageStore(config['data_file'] + '.live'), sender=sender,
+            subscriber_store=subscriber_store,
+            interval=config.get('live_message_interval', 60)
+        )
+    from .graph_notifier import GraphNotifier
+
+    return GraphNotifier(
+        bot, config['chat_whitelist'], config['graph_visualization_url'],
+        sender=sender, chat_templates=config.get('chat_templates'),
+        subscriber_store=subscriber_store, renderer=renderer
+    )
+
+
+def make_coalescer(config: dict, on_flush):
+    if config.get('coalesce_window') is None:
+        return None
+    from .notification_coalescer import NotificationCoalescer
+
+    return NotificationCoalescer(
+        on_flush, config['coalesce_window'],
+        config.get('coalesce_max_delay', 300)
+    )
+
+
+def make_subscriber_store(config: dict):
+    # The whitelisted chats are the first subscribers.
+    if not config.get('subscriber_store', False):
+        return None
+    from .subscriber_store import SubscriberStore
+
+    return SubscriberStore(
+        config['data_file'] + '.subscribers',
+        seed_chats=config['chat_whitelist']
+    )
+
+
+def make_cruncher(config: dict, process_pool=None):
+    from .graph_cruncher import GraphCruncher, PooledGraphCruncher
+
+    snapshot_store = None
+    if config.get('save_snapshot', True):
+        snapshot_store = SnapshotStore(config['data_file'] + '.snapshot')
+    renderer = make_renderer(config)
+    if config.get('crunch_workers'):
+        return PooledGraphCruncher(
+            process_pool or ProcessPoolExecutor(
+                max_workers=config['crunch_workers']
+            ),
+            config.get('crunch_deadline', 10.0),
+            differ=GraphDiffer(),
+            snapshot_store=snapshot_store,
+            renderer=renderer,
+        )
+    return GraphCruncher(
+        differ=GraphDiffer(), clique_tracker=CliqueTracker(),
+        snapshot_store=snapshot_store, renderer=renderer,
+    )
+
+
+def make_renderer(config: dict):
+    if not config.get('attach_snapshot', False):
+        return None
+    from .graph_renderer import GraphLayout, GraphRenderer
+
+    return GraphRenderer(
+        GraphLayout(max_nodes=config.get('layout_max_nodes', 250)),
+        max_edges=config.get('snapshot_max_edges', 20000)
+    )
+
+
+def make_recorder(config: dict):
+    if not config.get('save_history', True):
+        return None
+    from .metrics_history import MetricsHistory, MetricsRecorder
+
+    return MetricsRecorder(MetricsHistory(config['data_file'] + '.history'))
+
+
+def make_result_cache(config: dict, graph_data, name: str = None):
+    from .command_handler import ResultCache
+
+    result_cache = ResultCache(name)
+    if graph_data['etag'] is not None:
+        # The saved data is as old as the data file.
+        try:
+            updated_at = os.path.getmtime(config['data_file'])
+        except OSError:
+            updated_at = None
+        result_cache.update(graph_data.data, updated_at)
+    return result_cache
+
+
+def make_command_handler(bot, result_caches, chats, sender, stores=()):
+    # With subscriber stores, any chat may subscribe.
+    from .command_handler import CommandHandler
+
+    command_handler = CommandHandler(
+        bot, result_caches, None if stores else chats, sender, stores=stores
+    )
+    command_handler.start()
+    return command_handler
+
+
+def make_profiler(config: dict, name: str = None):
+    # Profiles are kept in a `profiles` directory next to the log file.
+    if config.get('profile_threshold') is None:
+        return None
+    from .profiling import CycleProfiler
+
+    log_directory = os.path.dirname(os.path.abspath(config['log_file']))
+    return CycleProfiler(
+        os.path.join(log_directory, 'profiles'),
+        config['profile_threshold'], name=name or 'graph',
+        keep=config.get('profile_keep', 20),
+        top=config.get('profile_top', 15),
+    )
+
+
+def start_metrics_server(config: dict):
+    if config.get('metrics_port') is None:
+        return None
+    from .metrics import MetricsServer
+
+    server = MetricsServer(
+        config['metrics_port'], config.get('metrics_host', '127.0.0.1')
+    )
+    server.start()
+    return server
+
+
+def restore_cruncher(cruncher, graph_data) -> None:
+    # Only a snapshot of the graph in the saved data can be resumed from.
+    if cruncher.snapshot_store is None or graph_data['etag'] is None:
+        return
+    saved_snapshot = cruncher.snapshot_store.load()
+    if saved_snapshot is None:
+        return
+    if not is_same_graph(saved_snapshot.data, graph_data):
+        logger.info('Saved graph snapshot is outdated. Ignoring it.')
+        return
+    cruncher.restore(saved_snapshot)
+    logger.info('Resumed from saved graph snapshot {}.'.format(
+        graph_data['etag']
+    ))
+
+
+def is_same_graph(snapshot_data: dict, graph_data) -> bool:
+    # ETags of unchanged graphs may have been rotated since the snapshot was
+    # saved, so the content is compared instead. Snapshots saved by older
+    # versions only have the ETag.
+    for key in ('edge_fingerprint', 'content_hash', 'etag'):
+        try:
+            value = graph_data[key]
+        except KeyError:
+            continue
+        if value is not None and snapshot_data.get(key) is not None:
+            return snapshot_data[key] == value
+    return False
+
+
+def make_pipeline(
+    config: dict, graph_data, do_once: bool = False, cruncher=None,
+    profiler=None
+):
+    fetcher = make_fetcher(config, graph_data, do_once, profiler=profiler)
+    if cruncher is None:
+        cruncher = make_cruncher(config)
+    if profiler is not None:
+        cruncher = profiler.wrap('crunch', cruncher)
+    return (
+        fetcher.observable
+        .map(cruncher)
+        .filter(lambda new_data: new_data is not None)
+        .map(lambda new_data: make_data_pair(graph_data, new_data))
+        .publish()
+    )
+
+
+def subscribe_late_data_pairs(graph_data, cruncher, observers) -> None:
+    # Clique numbers computed after the deadline of a `PooledGraphCruncher`
+    # go to every observer but the notifier. The saver must come last.
+    from .graph_cruncher import PooledGraphCruncher
+
+    if not isinstance(cruncher, PooledGraphCruncher):
+        return
+    late_data_pairs = make_late_data_pairs(graph_data, cruncher.late_results)
+    for observer in observers:
+        if observer is not None:
+            late_data_pairs.subscribe(observer)
+
+
+def make_late_data_pairs(graph_data, late_results):
+    # Late results only complete the data of the graph they were computed
+    # for; they are dropped if a newer graph was saved in the meantime.
+    return (
+        late_results
+        .filter(lambda late_result: graph_data['etag'] == late_result['etag'])
+        .map(lambda late_result: {'new': dict(graph_data.data, **late_result)})
+    )
@@ -0,0 +1,315 @@
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from threading import Lock, Thread
+import logging
+import math
+import time
+
+
+logger = logging.getLogger('mystery_graph_bot')
+
+
+# Seconds.
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60
+)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Metric:
+    # A family of time series, one per combination of label values. The
+    # series of a combination is created the first time it is asked for
+    # with `labels`; metrics without labels are a series themselves.
+
+    type_name = None
+
+    def __init__(self, name: str, help_text: str, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.series = {}
+        self.lock = Lock()
+        if not self.label_names:
+            self.series[()] = self.make_series()
+
+    def labels(self, *values):
+        values = tuple(str(value) for value in values)
+        if len(values) != len(self.label_names):
+            raise ValueError('Metric {} has labels {}'.format(
+                self.name, self.label_names
+            ))
+        series = self.series.get(values)
+        if series is None:
+            with self.lock:
+                series = self.series.setdefault(values, self.make_series())
+        return series
+
+    def make_series(self):
+        raise NotImplementedError
+
+    def render(self) -> list:
+        lines = [
+            '# HELP {} {}'.format(self.name, escape_help(self.help_text)),
+            '# TYPE {} {}'.format(self.name, self.type_name),
+        ]
+        with self.lock:
+            series_items = sorted(self.series.items())
+        for values, series in series_items:
+            labels = list(zip(self.label_names, values))
+            for suffix, extra_labels, value in series.samples():
+                lines.append('{}{}{} {}'.format(
+                    self.name, suffix,
+                    format_labels(labels + extra_labels), format_value(value)
+                ))
+        return lines
+
+
+class CounterSeries:
+    def __init__(self):
+        self.value = 0
+        self.lock = Lock()
+
+    def inc(self, amount: float = 1) -> None:
+        with self.lock:
+            self.value += amount
+
+    def samples(self):
+        return [('', [], self.value)]
+
+
+class GaugeSeries:
+    def __init__(self):
+        self.value = 0
+        self.function = None
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def set_function(self, function) -> None:
+        # The value is then read from `function()` on every scrape.
+        self.function = function
+
+    def samples(self):
+        if self.function is None:
+            return [('', [], self.value)]
+        return [('', [], self.function())]
+
+
+class HistogramSeries:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.lock = Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def time(self):
+        return Timer(self)
+
+    def samples(self):
+        with self.lock:
+            counts = list(self.counts)
+            total = self.sum
+        samples = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), counts):
+            cumulative += count
+            samples.append(('_bucket', [('le', bound)], cumulative))
+        samples.append(('_sum', [], total))
+        samples.append(('_count', [], cumulative))
+        return samples
+
+
+class Timer:
+    # Context manager observing the seconds spent in its block.
+
+    def __init__(self, histogram: HistogramSeries):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+class Counter(Metric):
+    type_name = 'counter'
+
+    def make_series(self):
+        return CounterSeries()
+
+    def inc(self, amount: float = 1) -> None:
+        self.series[()].inc(amount)
+
+
+class Gauge(Metric):
+    type_name = 'gauge'
+
+    def make_series(self):
+        return GaugeSeries()
+
+    def set(self, value: float) -> None:
+        self.series[()].set(value)
+
+    def set_function(self, function) -> None:
+        self.series[()].set_function(function)
+
+
+class Histogram(Metric):
+    type_name = 'histogram'
+
+    def __init__(
+        self, name: str, help_text: str, label_names=(),
+        buckets=DEFAULT_BUCKETS
+    ):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help_text, label_names)
+
+    def make_series(self):
+        return HistogramSeries(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.series[()].observe(value)
+
+    def time(self):
+        return self.series[()].time()
+
+
+class MetricsRegistry:
+    # Every metric of the bot by name. Asking twice for the same name gives
+    # the same metric, so modules can declare the metrics they update.
+
+    def __init__(self):
+        self.metrics = {}
+        self.lock = Lock()
+
+    def counter(self, name: str, help_text: str, label_names=()) -> Counter:
+        return self.register(Counter, name, help_text, label_names)
+
+    def gauge(self, name: str, help_text: str, label_names=()) -> Gauge:
+        return self.register(Gauge, name, help_text, label_names)
+
+    def histogram(
+        self, name: str, help_text: str, label_names=(),
+        buckets=DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self.register(
+            Histogram, name, help_text, label_names, buckets=buckets
+        )
+
+    def register(self, metric_class, name, help_text, label_names, **kwargs):
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = metric_class(name, help_text, label_names, **kwargs)
+                self.metrics[name] = metric
+            elif not isinstance(metric, metric_class):
+                raise ValueError(
+                    "Metric '{}' is already registered as a {}".format(
+                        name, metric.type_name
+                    )
+                )
+            return metric
+
+    def render(self) -> str:
+        # Prometheus text exposition format.
+        with self.lock:
+            metrics = sorted(self.metrics.values(), key=lambda m: m.name)
+        lines = []
+        for metric in metrics:
+            lines += metric.render()
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class MetricsServer:
+    # Serves the registry at `/metrics` from a daemon thread. Scrapes only
+    # read the metrics, so they do not slow the polling cycle down.
+
+    def __init__(
+        self, port: int, host: str = '127.0.0.1', registry=REGISTRY
+    ):
+        self.registry = registry
+        self.server = ThreadingHTTPServer(
+            (host, port), make_handler(registry)
+        )
+        self.thread = Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def port(self) -> int:
+        return self.server.server_address[1]
+
+    def start(self) -> None:
+        self.thread.start()
+        logger.info('Serving metrics on port {}.'.format(self.port))
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def make_handler(registry: MetricsRegistry):
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logger.debug('Metrics request: ' + format % args)
+
+    return MetricsHandler
+
+
+def escape_help(text: str) -> str:
+    return text.replace('\\', '\\\\').replace('\n', '\\n')
+
+
+def format_labels(labels) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(
+        '{}="{}"'.format(name, escape_label(format_value(value)))
+        for name, value in labels
+    ) + '}'
+
+
+def escape_label(value: str) -> str:
+    return (
+        value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    )
+
+
+def format_value(value) -> str:
+    if isinstance(value, str):
+        return value
+    if value is None:
+        return 'NaN'
+    if value == math.inf:
+        return '+Inf'
+    if value == -math.inf:
+        return '-Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
@@ -0,0 +1,259 @@
+import logging
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+
+from rx import Observer
+from marshmallow import ValidationError
+
+from .serializers import DataPair
+
+
+logger = logging.getLogger('mystery_graph_bot')
+
+
+METRICS = ('liks', 'noms', 'lik_record', 'nom_record', 'clique_number')
+
+MAGIC = b'MGBRING1'
+HEADER = struct.Struct('<8sQQQQ')
+DOUBLE_SIZE = 8
+
+
+class Resolution:
+    def __init__(self, name: str, seconds: int, capacity: int):
+        # Samples are merged into buckets of `seconds` (0 keeps every
+        # sample), and only the last `capacity` buckets are kept.
+        self.name = name
+        self.seconds = seconds
+        self.capacity = capacity
+
+
+RAW = Resolution('raw', 0, 7 * 24 * 120)
+HOURLY = Resolution('hourly', 3600, 90 * 24)
+DAILY = Resolution('daily', 86400, 10 * 366)
+RESOLUTIONS = (RAW, HOURLY, DAILY)
+
+
+class RingBuffer:
+    # Fixed number of slots of `width` doubles each plus a timestamp, kept
+    # in an anonymous memory map, or in a file of fixed size when `path` is
+    # given, so memory and disk stay bounded however long the bot runs.
+    # Slots must be added in time order. The last slot can be rewritten in
+    # place, which keeps the running bucket of a downsampled series.
+
+    def __init__(self, capacity: int, width: int, path: str = None):
+        self.capacity = capacity
+        self.width = width
+        self.slot_size = width + 1
+        size = HEADER.size + capacity * self.slot_size * DOUBLE_SIZE
+        if path is None:
+            self.map = mmap.mmap(-1, size)
+        else:
+            self.map = self.open_file(path, size)
+        magic, capacity, width, self.head, self.count = HEADER.unpack_from(
+            self.map
+        )
+        if (magic, capacity, width) != (MAGIC, self.capacity, self.width):
+            self.head = self.count = 0
+            self.write_header()
+        self.slots = memoryview(self.map)[HEADER.size:].cast('d')
+
+    def open_file(self, path: str, size: int):
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size != size:
+                # Different layout; start over.
+                os.ftruncate(fd, 0)
+                os.ftruncate(fd, size)
+            return mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def write_header(self) -> None:
+        HEADER.pack_into(
+            self.map, 0, MAGIC, self.capacity, self.width, self.head,
+            self.count
+        )
+
+    def append(self, timestamp: float, values) -> None:
+        self.write_slot(self.head, timestamp, values)
+        self.head = (self.head + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+        self.write_header()
+
+    def replace_last(self, timestamp: float, values) -> None:
+        self.write_slot(
+            (self.head - 1) % self.capacity, timestamp, values
+        )
+
+    def write_slot(self, slot: int, timestamp: float, values) -> None:
+        start = slot * self.slot_size
+        self.slots[start] = timestamp
+        for offset, value in enumerate(values, start + 1):
+            self.slots[offset] = math.nan if value is None else value
+
+    def physical(self, index: int) -> int:
+        return (self.head - self.count + index) % self.capacity
+
+    def timestamp(self, index: int) -> float:
+        return self.slots[self.physical(index) * self.slot_size]
+
+    def get(self, index: int):
+        start = self.physical(index) * self.slot_size
+        return (
+            self.slots[start],
+            [None if math.isnan(value) else value
+             for value in self.slots[start + 1:start + self.slot_size]],
+        )
+
+    def last(self):
+        return self.get(self.count - 1) if self.count else None
+
+    def bisect(self, timestamp: float) -> int:
+        # Index of the first slot not older than `timestamp`.
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.timestamp(middle) < timestamp:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def range(self, start: float, end: float):
+        # Slots with `start <= timestamp < end`, oldest first.
+        for index in range(self.bisect(start), self.bisect(end)):
+            yield self.get(index)
+
+    def flush(self) -> None:
+        self.map.flush()
+
+
+class MetricsHistory:
+    # Time series of the crunched metrics at several resolutions. Raw keeps
+    # one sample per graph; coarser resolutions keep, for every bucket, the last,
+    # minimum and maximum value of every metric. The bucket in progress is
+    # stored as well, and updated until the next one starts.
+
+    def __init__(self, directory: str = None, resolutions=RESOLUTIONS):
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+        self.resolutions = {
+            resolution.name: resolution for resolution in resolutions
+        }
+        self.buffers = {}
+        for resolution in resolutions:
+            width = len(METRICS) * (1 if resolution.seconds == 0 else 3)
+            path = None
+            if directory is not None:
+                path = os.path.join(directory, resolution.name + '.ring')
+            self.buffers[resolution.name] = RingBuffer(
+                resolution.capacity, width, path
+            )
+        self.last_etag = None
+
+    def record(self, data: dict, timestamp: float = None) -> None:
+        if timestamp is None:
+            timestamp = time.time()
+        values = [data.get(metric) for metric in METRICS]
+        etag = data.get('etag')
+        same_graph = etag is not None and etag == self.last_etag
+        self.last_etag = etag
+        for name, resolution in self.resolutions.items():
+            buffer = self.buffers[name]
+            if resolution.seconds == 0:
+                last = buffer.last()
+                # Late results of the same graph, and clocks going back,
+                # rewrite the last sample, so samples stay in time order.
+                if last is not None and (same_graph or timestamp <= last[0]):
+                    buffer.replace_last(last[0], values)
+                else:
+                    buffer.append(timestamp, values)
+                continue
+            bucket = timestamp - timestamp % resolution.seconds
+            last = buffer.last()
+            # Clocks going back are merged into the last bucket, so buckets
+            # stay in time order.
+            if last is not None and last[0] >= bucket:
+                buffer.replace_last(last[0], merge_bucket(last[1], values))
+            else:
+                buffer.append(bucket, merge_bucket(None, values))
+
+    def query(
+        self, start: float = 0, end: float = math.inf,
+        resolution: str = 'raw'
+    ) -> list:
+        # Returns one dict per sample (or bucket) in `[start, end)`. Buckets
+        # have the last value of every metric under its name, and the
+        # extremes under `<metric>_min` and `<metric>_max`.
+        buffer = self.buffers[resolution]
+        seconds = self.resolutions[resolution].seconds
+        keys = METRICS if seconds == 0 else bucket_keys()
+        if seconds:
+            # A bucket that started before `start` still overlaps the range.
+            start -= start % seconds
+        # All the metrics are integers.
+        return [
+            dict(
+                zip(keys, (None if value is None else int(value)
+                           for value in values)),
+                time=timestamp
+            )
+            for timestamp, values in buffer.range(start, end)
+        ]
+
+    def flush(self) -> None:
+        for buffer in self.buffers.values():
+            buffer.flush()
+
+
+class MetricsRecorder(Observer):
+    def __init__(self, history: MetricsHistory):
+        self.history = history
+        # Late results are recorded from worker callbacks.
+        self.lock = threading.Lock()
+
+    def on_next(self, data):
+        try:
+            data_pair, _ = DataPair(strict=True).load(data)
+        except ValidationError:
+            logger.error('MetricsRecorder got unexpected data')
+            return
+        with self.lock:
+            self.history.record(data_pair['new'])
+
+    def on_error(self, error):
+        logger.error('MetricsRecorder got an error: {}'.format(error))
+
+    def on_completed(self):
+        with self.lock:
+            self.history.flush()
+
+
+def bucket_keys():
+    keys = []
+    for metric in METRICS:
+        keys += [metric, metric + '_min', metric + '_max']
+    return keys
+
+
+def merge_bucket(bucket, values) -> list:
+    # Bucket values are (last, min, max) for every metric.
+    merged = []
+    for index, value in enumerate(values):
+        if bucket is None:
+            last = low = high = None
+        else:
+            last, low, high = bucket[3 * index:3 * index + 3]
+        if value is not None:
+            last = value
+            low = value if low is None else min(low, value)
+            high = value if high is None else max(high, value)
+        merged += [last, low, high]
+    return merged
@@ -1,9 +1,14 @@
 import logging
 import json
+from collections import Counter
 from time import sleep
 from telegram.bot import Bot
+import requests
+from requests import Response
 
-from .errors import SchemaLoadError
+from .errors import BodyTooLargeError, SchemaLoadError
+from .graph_stream import LinkCounter, StreamingGraphParser
+from .http_client import GraphHttpClient
 from .util import load_data_with_schema_from_string
 from .serializers import Graph
 
@@ -17,7 +22,13 @@ class MysteryGraphBot:
         self.graph_visualization_url = config['graph_visualization_url']
         self.refresh_time = config['refresh_time']
         self.chat_whitelist = config['chat_whitelist']
+        self.stream_graph = config.get('stream_graph', False)
         self.graph_data = graph_data
+        self.http_client = GraphHttpClient(
+            connect_timeout=config.get('connect_timeout', 3.05),
+            read_timeout=config.get('read_timeout', 5.0),
+            max_body_size=config.get('max_graph_size'),
+        )
 
     def start(self) -> None:
         while True:
@@ -40,7 +51,9 @@ class MysteryGraphBot:
 
     def bare_poll(self, headers: dict) -> bool:
         try:
-            response = requests.get(self.graph_url, timeout=5, headers=headers)
+            response = self.http_client.get(
+                self.graph_url, headers=headers, stream=self.stream_graph
+            )
             return self.handle_http_graph_response(response)
         except requests.ConnectionError:
             msg = 'Could not connect to server containing the graph'
@@ -51,6 +64,8 @@ class MysteryGraphBot:
         except requests.TooManyRedirects:
             msg = 'Exceeded redirect limit while retrieving the graph'
             logger.error(msg)
+        except BodyTooLargeError as e:
+            logger.error(str(e))
         return False
 
     def handle_http_graph_response(self, response: Response) -> bool:
@@ -86,9 +101,41 @@ class MysteryGraphBot:
             logger.error(msg)
         return False
 
+    def update_data_with_response(self, response: Response) -> bool:
+        try:
+            etag = response.headers['ETag']
+            if self.stream_graph:
+                parser = StreamingGraphParser(LinkCounter())
+                counter = parser.parse(
+                    self.http_client.iter_content(response, 64 * 1024)
+                )
+                self.update_counts(etag, counter['lik'], counter['nom'])
+            else:
+                graph = load_data_with_schema_from_string(
+                    Graph(), response.text
+                )
+                self.update_data(etag, graph)
+            return True
+        except json.JSONDecodeError:
+            logger.error("Graph data is not a valid JSON. Ignoring it.")
+        except SchemaLoadError:
+            logger.error(
+                "Graph JSON object has an unexpected format. Ignoring it."
+            )
+        except KeyError:
+            logger.error(
+                "Expected ETag header in graph response. "
+                "Not implemented graph diffing without it yet."
+            )
+        except BodyTooLargeError as e:
+            logger.error(str(e))
+        return False
+
     def update_data(self, etag: str, graph: dict) -> None:
-        liks = sum(1 for link in graph['links'] if link['value'] == 'lik')
-        noms = sum(1 for link in graph['links'] if link['value'] == 'nom')
+        counts = Counter(link['value'] for link in graph['links'])
+        self.update_counts(etag, counts['lik'], counts['nom'])
+
+    def update_counts(self, etag: str, liks: int, noms: int) -> None:
         self.graph_data['etag'] = etag
         self.graph_data['liks'] = liks
         self.graph_data['noms'] = noms
@@ -0,0 +1,141 @@
+from threading import Lock, Timer
+import logging
+import time
+
+from rx import Observer
+from marshmallow import ValidationError
+
+from .metrics import REGISTRY
+from .serializers import DataPair
+
+
+logger = logging.getLogger('mystery_graph_bot')
+
+
+MAX_DELAY = 300
+
+COALESCED = REGISTRY.counter(
+    'mgb_coalesced_updates_total',
+    'Graph updates merged into the notification of a later one.'
+)
+
+
+class NotificationCoalescer(Observer):
+    # Holds data pairs back and merges the ones coming in a row into one,
+    # from the oldest old data to the newest new data, so a burst of edits
+    # is notified once with its net changes. The merged pair is passed to
+    # `on_flush` when no data pair came for `quiet_time` seconds, or
+    # `max_delay` seconds after the first one held, whatever comes first; a
+    # fixed window is a `quiet_time` equal to `max_delay`. `on_flush` is
+    # called from a timer thread.
+
+    def __init__(
+        self, on_flush, quiet_time: float, max_delay: float = MAX_DELAY,
+        clock=time.monotonic, timer_factory=Timer
+    ):
+        self.on_flush = on_flush
+        self.quiet_time = quiet_time
+        self.max_delay = max(max_delay, quiet_time)
+        self.clock = clock
+        self.timer_factory = timer_factory
+        self.pending = None
+        self.first_at = None
+        self.timer = None
+        # Tells timers apart, so a timer that fired while the pending data
+        # pair changed does not flush it early.
+        self.generation = 0
+        self.lock = Lock()
+
+    def on_next(self, data):
+        try:
+            data_pair, _ = DataPair(strict=True).load(data)
+        except ValidationError:
+            logger.error('NotificationCoalescer got unexpected data')
+            return
+        now = self.clock()
+        with self.lock:
+            if self.pending is None:
+                self.pending = data_pair
+                self.first_at = now
+            else:
+                self.pending = merge_data_pairs(self.pending, data_pair)
+                COALESCED.inc()
+            delay = min(self.quiet_time, self.first_at + self.max_delay - now)
+            self.start_timer(max(0, delay))
+
+    def on_error(self, error):
+        logger.error('NotificationCoalescer got an error: {}'.format(error))
+
+    def on_completed(self):
+        self.flush()
+
+    def start_timer(self, delay: float) -> None:
+        if self.timer is not None:
+            self.timer.cancel()
+        self.generation += 1
+        self.timer = self.timer_factory(
+            delay, self.on_timer, args=(self.generation,)
+        )
+        self.timer.daemon = True
+        self.timer.start()
+
+    def on_timer(self, generation: int) -> None:
+        with self.lock:
+            if generation != self.generation:
+                return
+        self.flush()
+
+    def take(self):
+        # Returns the pending data pair, if any, which is then no longer
+        # flushed by the timer.
+        with self.lock:
+            data_pair = self.pending
+            self.pending = None
+            self.first_at = None
+            self.generation += 1
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+        return data_pair
+
+    def flush(self) -> None:
+        data_pair = self.take()
+        if data_pair is None:
+            return
+        try:
+            self.on_flush(data_pair)
+        except Exception:
+            logger.exception('Could not notify coalesced changes')
+
+
+def merge_data_pairs(first: dict, second: dict) -> dict:
+    merged = {'new': second['new']}
+    if 'old' in first:
+        merged['old'] = first['old']
+    # Without the diff of every pair, the merged diff would be incomplete.
+    if 'diff' in first and 'diff' in second:
+        merged['diff'] = merge_diffs(first['diff'], second['diff'])
+    return merged
+
+
+def merge_diffs(first: dict, second: dict) -> dict:
+    # Link counts are added up; a link both added and removed in the window
+    # is counted in both.
+    affected_nodes = list(first['affected_nodes'])
+    seen = set(affected_nodes)
+    for node in second['affected_nodes']:
+        if node not in seen:
+            seen.add(node)
+            affected_nodes.append(node)
+    return {
+        'added': add_counts(first['added'], second['added']),
+        'removed': add_counts(first['removed'], second['removed']),
+        'affected_nodes': affected_nodes,
+    }
+
+
+def add_counts(first: dict, second: dict) -> dict:
+    counts = dict(first)
+    for relation, count in second.items():
+        counts[relation] = counts.get(relation, 0) + count
+    return counts
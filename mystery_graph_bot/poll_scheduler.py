@@ -0,0 +1,97 @@
+import logging
+import random
+
+
+logger = logging.getLogger('mystery_graph_bot')
+
+
+# Poll outcomes.
+CHANGED = 'changed'
+UNCHANGED = 'unchanged'
+FAILED = 'failed'
+
+# Circuit breaker states.
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class PollScheduler:
+    # Decides how long to wait before the next poll. The interval shrinks
+    # towards `min_interval` while the graph keeps changing and grows back
+    # towards `max_interval` while it does not. Failed polls back off
+    # exponentially from the current interval, up to `max_backoff`; after
+    # `failure_threshold` failures in a row the circuit opens and polling
+    # stops for `max_backoff`, after which a single probe poll closes it
+    # again or reopens it. Every delay gets some random jitter, so that
+    # restarts do not line up.
+
+    def __init__(
+        self, base_interval: float, min_interval: float = None,
+        max_interval: float = None, max_backoff: float = 600,
+        failure_threshold: int = 5, tighten_factor: float = 0.5,
+        relax_factor: float = 1.5, jitter: float = 0.1, rng=None
+    ):
+        self.base_interval = base_interval
+        self.min_interval = min(min_interval or base_interval, base_interval)
+        self.max_interval = max(max_interval or base_interval, base_interval)
+        self.max_backoff = max(max_backoff, self.max_interval)
+        self.failure_threshold = failure_threshold
+        self.tighten_factor = tighten_factor
+        self.relax_factor = relax_factor
+        self.jitter = jitter
+        self.rng = rng or random.Random()
+        self.interval = base_interval
+        self.consecutive_failures = 0
+        self.state = CLOSED
+
+    def record(self, outcome: str) -> None:
+        if outcome == FAILED:
+            self.record_failure()
+            return
+        if self.state != CLOSED:
+            logger.warning('Graph polling recovered. Closing circuit.')
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        if outcome == CHANGED:
+            self.interval = max(
+                self.min_interval, self.interval * self.tighten_factor
+            )
+        else:
+            self.interval = min(
+                self.max_interval, self.interval * self.relax_factor
+            )
+
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+        if self.state == HALF_OPEN or (
+            self.state == CLOSED
+            and self.consecutive_failures >= self.failure_threshold
+        ):
+            msg = (
+                'Graph polling failed {} times in a row. Opening circuit '
+                'for {} seconds.'
+            )
+            logger.warning(
+                msg.format(self.consecutive_failures, self.max_backoff)
+            )
+            self.state = OPEN
+
+    def next_delay(self) -> float:
+        if self.state == OPEN:
+            # The next poll is the probe.
+            self.state = HALF_OPEN
+            delay = self.add_jitter(self.max_backoff)
+        elif self.consecutive_failures:
+            backoff = min(
+                self.max_backoff,
+                self.interval * 2 ** self.consecutive_failures
+            )
+            # Equal jitter: at least half of the backoff is always waited.
+            delay = backoff / 2 + self.rng.uniform(0, backoff / 2)
+        else:
+            delay = self.add_jitter(self.interval)
+        return delay
+
+    def add_jitter(self, delay: float) -> float:
+        return delay * (1 + self.rng.uniform(-self.jitter, self.jitter))
@@ -0,0 +1,184 @@
+from collections import OrderedDict
+from threading import Lock
+import cProfile
+import logging
+import os
+import pstats
+import time
+
+from rx import Observer
+
+
+logger = logging.getLogger('mystery_graph_bot')
+
+
+PROFILE_SUFFIX = '.prof'
+
+# Held by the stage being profiled. Python 3.12 only allows one active
+# profiler in the whole process.
+PROFILE_LOCK = Lock()
+
+
+class CycleProfiler:
+    # Profiles the stages of every polling cycle with cProfile and keeps the
+    # profile only when the whole cycle took `threshold` seconds or more.
+    # Kept profiles are written to `directory`, which holds at most `keep`
+    # of them (the oldest are removed), and the `top` functions by
+    # cumulative time are logged. Stages may run in other threads; each one
+    # gets its own profiler, and they are merged when the cycle finishes.
+    # Only one stage is profiled at a time, though: stages overlapping it
+    # are only timed.
+
+    def __init__(
+        self, directory: str, threshold: float, name: str = 'graph',
+        keep: int = 20, top: int = 15, clock=time.perf_counter
+    ):
+        self.directory = directory
+        self.threshold = threshold
+        self.name = name
+        self.keep = keep
+        self.top = top
+        self.clock = clock
+        self.cycle_start = None
+        self.profiles = []
+        self.stage_times = OrderedDict()
+        self.lock = Lock()
+
+    def start_cycle(self) -> None:
+        with self.lock:
+            self.cycle_start = self.clock()
+            self.profiles = []
+            self.stage_times = OrderedDict()
+
+    def stage(self, name: str, function, *args):
+        # Calls `function(*args)`, profiled if a cycle is in progress.
+        if self.cycle_start is None:
+            return function(*args)
+        profile = start_profile()
+        start = self.clock()
+        try:
+            return function(*args)
+        finally:
+            elapsed = self.clock() - start
+            if profile is not None:
+                profile.disable()
+                PROFILE_LOCK.release()
+            with self.lock:
+                if profile is not None:
+                    self.profiles.append(profile)
+                self.stage_times[name] = (
+                    self.stage_times.get(name, 0) + elapsed
+                )
+
+    def wrap(self, name: str, function):
+        return lambda *args: self.stage(name, function, *args)
+
+    def finish_cycle(self):
+        # Returns the path of the saved profile, or None if the cycle was
+        # fast enough.
+        with self.lock:
+            if self.cycle_start is None:
+                return None
+            elapsed = self.clock() - self.cycle_start
+            profiles = self.profiles
+            stage_times = self.stage_times
+            self.cycle_start = None
+            self.profiles = []
+        if elapsed < self.threshold or not profiles:
+            return None
+        try:
+            path = self.save(profiles, elapsed)
+        except OSError as e:
+            logger.warning('Not able to save cycle profile: {}'.format(e))
+            path = None
+        self.log_summary(profiles, elapsed, stage_times, path)
+        return path
+
+    def save(self, profiles, elapsed: float) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, '{}-{}-{:.1f}s{}'.format(
+            time.strftime('%Y%m%d-%H%M%S'), self.name, elapsed,
+            PROFILE_SUFFIX
+        ))
+        make_stats(profiles).dump_stats(path)
+        self.rotate()
+        return path
+
+    def rotate(self) -> None:
+        paths = [
+            os.path.join(self.directory, file_name)
+            for file_name in os.listdir(self.directory)
+            if file_name.endswith(PROFILE_SUFFIX)
+        ]
+        paths.sort(key=os.path.getmtime)
+        for path in paths[:max(0, len(paths) - self.keep)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def log_summary(self, profiles, elapsed, stage_times, path) -> None:
+        lines = ['Slow cycle of {} took {:.3f} seconds ({}).'.format(
+            self.name, elapsed, ', '.join(
+                '{} {:.3f}s'.format(stage, seconds)
+                for stage, seconds in stage_times.items()
+            )
+        )]
+        if path is not None:
+            lines.append('Profile saved to {}'.format(path))
+        lines.append('Top {} functions by cumulative time:'.format(self.top))
+        lines += get_top_functions(make_stats(profiles), self.top)
+        logger.warning('\n'.join(lines))
+
+
+class ProfiledObserver(Observer):
+    # Runs `observer.on_next` as a stage of the cycles of `profiler`.
+
+    def __init__(self, observer, profiler: CycleProfiler, stage: str):
+        self.observer = observer
+        self.profiler = profiler
+        self.stage = stage
+
+    def on_next(self, data):
+        self.profiler.stage(self.stage, self.observer.on_next, data)
+
+    def on_error(self, error):
+        self.observer.on_error(error)
+
+    def on_completed(self):
+        self.observer.on_completed()
+
+
+def start_profile():
+    # Returns None when another stage, or another tool, is profiling.
+    if not PROFILE_LOCK.acquire(blocking=False):
+        return None
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+    except ValueError:
+        PROFILE_LOCK.release()
+        return None
+    return profile
+
+
+def make_stats(profiles) -> pstats.Stats:
+    stats = pstats.Stats(profiles[0])
+    for profile in profiles[1:]:
+        stats.add(profile)
+    return stats
+
+
+def get_top_functions(stats: pstats.Stats, top: int) -> list:
+    # One line per function: cumulative and own seconds, calls and name.
+    entries = sorted(
+        stats.stats.items(), key=lambda item: item[1][3], reverse=True
+    )
+    lines = []
+    for (file_name, line, function), entry in entries[:top]:
+        _, calls, own_time, cumulative_time, _ = entry
+        lines.append('  {:9.3f}s {:9.3f}s {:>8} {}:{}({})'.format(
+            cumulative_time, own_time, calls,
+            os.path.basename(file_name), line, function
+        ))
+    return lines
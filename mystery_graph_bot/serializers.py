@@ -1,5 +1,8 @@
-from marshmallow import Schema, fields
+from marshmallow import Schema, fields, validates_schema
 from marshmallow.exceptions import ValidationError
+from marshmallow.validate import OneOf
+
+from .state_log import FSYNC_INTERVAL, FSYNC_POLICIES
 
 class IntegerOrStrField(fields.Field):
     default_error_messages = {
@@ -21,25 +24,104 @@ class IntegerOrStrField(fields.Field):
             self.fail('invalid')
 
 
-class Config(Schema):
-    token = fields.Str(required=True) 
+class GraphSource(Schema):
+    # Settings of one of the graphs in `Config.graphs`. Settings left out
+    # are taken from the top level of the config.
+    name = fields.Str()
     data_file = fields.Str(required=True)
     graph_url = fields.Url(required=True)
     graph_visualization_url = fields.Str(required=True)
-    refresh_time = fields.Integer(required=True)
     chat_whitelist = fields.List(IntegerOrStrField, required=True)
-    log_file = fields.Str(required=True)
+    chat_templates = fields.Dict()
+    refresh_time = fields.Integer()
+    min_refresh_time = fields.Float(allow_none=True)
+    max_refresh_time = fields.Float(allow_none=True)
+    stream_graph = fields.Boolean()
+    fingerprint_edges = fields.Boolean()
 
 
-class DataPair(Schema):
-    new = fields.Nested(Data, required=True)
-    old = fields.Nested(Data, required=False)
+class Config(Schema):
+    token = fields.Str(required=True) 
+    # Either the single graph settings or `graphs` are required.
+    data_file = fields.Str()
+    graph_url = fields.Url()
+    graph_visualization_url = fields.Str()
+    graphs = fields.Nested(GraphSource, many=True)
+    refresh_time = fields.Integer(required=True)
+    min_refresh_time = fields.Float(missing=None, allow_none=True)
+    max_refresh_time = fields.Float(missing=None, allow_none=True)
+    max_backoff_time = fields.Float(missing=600.0)
+    failure_threshold = fields.Integer(missing=5)
+    chat_whitelist = fields.List(IntegerOrStrField)
+    log_file = fields.Str(required=True)
+    stream_graph = fields.Boolean(missing=False)
+    crunch_workers = fields.Integer(missing=0)
+    crunch_deadline = fields.Float(missing=10.0)
+    connect_timeout = fields.Float(missing=3.05)
+    read_timeout = fields.Float(missing=5.0)
+    max_graph_size = fields.Integer(missing=100 * 1024 * 1024)
+    chat_templates = fields.Dict(missing=dict)
+    sender_workers = fields.Integer(missing=8)
+    fingerprint_edges = fields.Boolean(missing=False)
+    save_snapshot = fields.Boolean(missing=True)
+    save_history = fields.Boolean(missing=True)
+    state_fsync = fields.Str(
+        missing=FSYNC_INTERVAL, validate=OneOf(FSYNC_POLICIES)
+    )
+    metrics_port = fields.Integer(missing=None, allow_none=True)
+    metrics_host = fields.Str(missing='127.0.0.1')
+    commands = fields.Boolean(missing=False)
+    subscriber_store = fields.Boolean(missing=False)
+    coalesce_window = fields.Float(missing=None, allow_none=True)
+    coalesce_max_delay = fields.Float(missing=300.0)
+    live_message = fields.Boolean(missing=False)
+    live_message_interval = fields.Float(missing=60.0)
+    attach_snapshot = fields.Boolean(missing=False)
+    snapshot_max_edges = fields.Integer(missing=20000)
+    layout_max_nodes = fields.Integer(missing=250)
+    profile_threshold = fields.Float(missing=None, allow_none=True)
+    profile_keep = fields.Integer(missing=20)
+    profile_top = fields.Integer(missing=15)
+
+    @validates_schema
+    def validate_graphs(self, data):
+        if data.get('graphs'):
+            return
+        missing_fields = [
+            field for field in (
+                'data_file', 'graph_url', 'graph_visualization_url',
+                'chat_whitelist'
+            )
+            if field not in data
+        ]
+        if missing_fields:
+            raise ValidationError(
+                'Missing data for required field.', missing_fields
+            )
 
 
 class Data(Schema):
     etag = fields.Str(required=True)
     liks = fields.Integer(required=True)
     noms = fields.Integer(required=True)
+    lik_record = fields.Integer(required=False)
+    nom_record = fields.Integer(required=False)
+    clique_number = fields.Integer(required=False, allow_none=True)
+    content_hash = fields.Str(required=False)
+    last_modified = fields.Str(required=False)
+    edge_fingerprint = fields.Str(required=False)
+
+
+class Diff(Schema):
+    added = fields.Dict(required=True)
+    removed = fields.Dict(required=True)
+    affected_nodes = fields.List(fields.Str(), required=True)
+
+
+class DataPair(Schema):
+    new = fields.Nested(Data, required=True)
+    old = fields.Nested(Data, required=False)
+    diff = fields.Nested(Diff, required=False)
 
 
 class GraphLink(Schema):
@@ -60,3 +142,6 @@ class Graph(Schema):
 class WrappedGraph(Schema):
     etag = fields.Str(required=True)
     graph = fields.Nested(Graph, required=True)
+    content_hash = fields.Str(required=False)
+    last_modified = fields.Str(required=False)
+    edge_fingerprint = fields.Str(required=False)
@@ -0,0 +1,207 @@
+from array import array
+from zlib import crc32
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+
+from .graph_snapshot import GraphSnapshot
+from .state_log import sync_directory
+
+
+logger = logging.getLogger('mystery_graph_bot')
+
+
+MAGIC = b'MGBSNAP1'
+PREAMBLE = struct.Struct('<8sQ')
+ALIGNMENT = 8
+
+# Name and type code of the columns stored for every snapshot.
+COLUMNS = (
+    ('sources', 'i'),
+    ('targets', 'i'),
+    ('relations', 'B'),
+    ('node_ids', 'q'),
+    ('name_offsets', 'Q'),
+    ('name_blob', 'B'),
+)
+
+
+class NodeNameTable:
+    # Read-only sequence of node names decoded on access from a blob of
+    # UTF-8 names and their offsets, so opening a snapshot does not create
+    # one string per node.
+
+    def __init__(self, offsets, blob):
+        self.offsets = offsets
+        self.blob = blob
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, position: int) -> str:
+        if position < 0:
+            position += len(self)
+        if not 0 <= position < len(self):
+            raise IndexError('Node position out of range')
+        start = self.offsets[position]
+        end = self.offsets[position + 1]
+        return str(self.blob[start:end], 'utf-8')
+
+    def __iter__(self):
+        for position in range(len(self)):
+            yield self[position]
+
+
+class SavedSnapshot:
+    def __init__(self, snapshot: GraphSnapshot, data: dict, max_clique):
+        self.snapshot = snapshot
+        # The crunched data of the snapshot, and the node ids of its maximum
+        # clique of noms (None if unknown).
+        self.data = data
+        self.max_clique = max_clique
+
+
+class SnapshotStore:
+    # Keeps the last crunched graph in a binary file that is memory mapped
+    # back on startup, so the first cycle after a restart can already be
+    # diffed and crunched incrementally. The file is
+    #
+    #     magic, header length, JSON header, aligned column bytes
+    #
+    # where the header has the crunched data, the maximum clique, the
+    # relation names, and the offset, type code, length and CRC32 of every
+    # column. Columns are in native byte order, so files written with the
+    # other one are ignored.
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def save(
+        self, snapshot: GraphSnapshot, data: dict, max_clique=None
+    ) -> None:
+        name_offsets, name_blob = encode_names(snapshot.node_names)
+        buffers = {
+            'sources': snapshot.sources,
+            'targets': snapshot.targets,
+            'relations': snapshot.relations,
+            'node_ids': snapshot.node_ids,
+            'name_offsets': name_offsets,
+            'name_blob': name_blob,
+        }
+        columns = list(COLUMNS)
+        edge_keys = getattr(snapshot, '_edge_keys', None)
+        if edge_keys is not None:
+            # The sorted keys of the diff, so it does not sort them again.
+            buffers['edge_keys'] = edge_keys
+            columns.append(('edge_keys', 'Q'))
+
+        header = {
+            'data': data,
+            'max_clique': (
+                sorted(max_clique) if max_clique is not None else None
+            ),
+            'relation_names': list(snapshot.relation_names),
+            'byteorder': sys.byteorder,
+            'columns': {},
+        }
+        offset = 0
+        for name, typecode in columns:
+            view = as_bytes(buffers[name], typecode)
+            header['columns'][name] = {
+                'offset': offset,
+                'typecode': typecode,
+                'size': len(view),
+                'crc': crc32(view),
+            }
+            offset = align(offset + len(view))
+
+        header_bytes = json.dumps(header).encode()
+        body_start = align(PREAMBLE.size + len(header_bytes))
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'wb') as snapshot_file:
+            snapshot_file.write(PREAMBLE.pack(MAGIC, len(header_bytes)))
+            snapshot_file.write(header_bytes)
+            for name, typecode in columns:
+                column = header['columns'][name]
+                snapshot_file.seek(body_start + column['offset'])
+                snapshot_file.write(as_bytes(buffers[name], typecode))
+            snapshot_file.flush()
+            os.fsync(snapshot_file.fileno())
+        # Replacing the file leaves any mapping of the old one intact.
+        os.replace(temp_path, self.path)
+        sync_directory(self.path)
+
+    def load(self):
+        # Returns a `SavedSnapshot` whose columns are views of the mapped
+        # file, or None if there is no valid snapshot.
+        try:
+            with open(self.path, 'rb') as snapshot_file:
+                if os.fstat(snapshot_file.fileno()).st_size == 0:
+                    return None
+                mapped = mmap.mmap(
+                    snapshot_file.fileno(), 0, access=mmap.ACCESS_READ
+                )
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.warning('Not able to open saved snapshot: {}'.format(e))
+            return None
+        try:
+            return self.parse(memoryview(mapped))
+        except (ValueError, KeyError, TypeError, struct.error) as e:
+            logger.warning('Saved snapshot is invalid: {}'.format(e))
+            return None
+
+    def parse(self, view: memoryview) -> SavedSnapshot:
+        magic, header_size = PREAMBLE.unpack_from(view)
+        if magic != MAGIC:
+            raise ValueError('Unknown snapshot format')
+        header_end = PREAMBLE.size + header_size
+        header = json.loads(str(view[PREAMBLE.size:header_end], 'utf-8'))
+        body_start = align(header_end)
+        if header['byteorder'] != sys.byteorder:
+            raise ValueError('Snapshot has a different byte order')
+
+        columns = {}
+        for name, column in header['columns'].items():
+            start = body_start + column['offset']
+            data = view[start:start + column['size']]
+            if len(data) != column['size'] or crc32(data) != column['crc']:
+                raise ValueError("Column '{}' is corrupt".format(name))
+            columns[name] = data.cast(column['typecode'])
+
+        snapshot = GraphSnapshot(
+            columns['sources'], columns['targets'], columns['relations'],
+            columns['node_ids'],
+            NodeNameTable(columns['name_offsets'], columns['name_blob']),
+            header['relation_names']
+        )
+        if 'edge_keys' in columns:
+            snapshot._edge_keys = columns['edge_keys']
+        return SavedSnapshot(snapshot, header['data'], header['max_clique'])
+
+
+def encode_names(names):
+    if isinstance(names, NodeNameTable):
+        return names.offsets, names.blob
+    offsets = array('Q', [0])
+    blob = bytearray()
+    for name in names:
+        blob += name.encode('utf-8')
+        offsets.append(len(blob))
+    return offsets, blob
+
+
+def as_bytes(buffer, typecode: str) -> memoryview:
+    view = memoryview(buffer)
+    if view.format != typecode:
+        # Columns built with other item types are converted on the way.
+        view = memoryview(array(typecode, buffer))
+    return view.cast('B')
+
+
+def align(offset: int) -> int:
+    return -(-offset // ALIGNMENT) * ALIGNMENT
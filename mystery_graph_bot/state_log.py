@@ -0,0 +1,200 @@
+from threading import Lock, Timer
+from zlib import crc32
+import json
+import logging
+import os
+
+
+logger = logging.getLogger('mystery_graph_bot')
+
+
+# When records are forced to disk.
+FSYNC_ALWAYS = 'always'
+FSYNC_INTERVAL = 'interval'
+FSYNC_NEVER = 'never'
+FSYNC_POLICIES = (FSYNC_ALWAYS, FSYNC_INTERVAL, FSYNC_NEVER)
+
+COMPACT_THRESHOLD = 1000
+
+
+class StateLog:
+    # Append-only log of JSON states, one record per line:
+    #
+    #     <crc32 of the JSON, 8 hex digits> <JSON>\n
+    #
+    # The latest valid record is the current state. A crash can only leave
+    # a torn record at the end, which fails its checksum (or lacks its line
+    # break) and is cut off on recovery. Appending a state equal to the
+    # latest one does nothing. With the `interval` fsync policy, appends
+    # within `fsync_interval` seconds share one fsync (group commit). Once
+    # the log holds `compact_threshold` records, it is atomically replaced
+    # by one with just the latest record.
+
+    def __init__(
+        self, path: str, fsync: str = FSYNC_INTERVAL,
+        fsync_interval: float = 1.0,
+        compact_threshold: int = COMPACT_THRESHOLD
+    ):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError("Unknown fsync policy '{}'".format(fsync))
+        self.path = path
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.compact_threshold = compact_threshold
+        self.file = None
+        self.record_count = 0
+        self.last_payload = None
+        self.sync_timer = None
+        self.recovered = False
+        self.lock = Lock()
+
+    def recover(self):
+        # Returns the latest state, or None if there is none.
+        with self.lock:
+            payload = self.read_latest()
+        if payload is None:
+            return None
+        return json.loads(payload)
+
+    def read_latest(self):
+        # Returns the payload of the latest record. Needs the lock.
+        self.close_file()
+        try:
+            with open(self.path, 'rb') as log_file:
+                content = log_file.read()
+        except FileNotFoundError:
+            content = b''
+        records, valid_end = self.parse(content)
+        if not records and content.strip():
+            state = self.parse_legacy(content)
+            if state is not None:
+                logger.info('Converting saved data to the state log.')
+                self.last_payload = self.encode(state)
+                self.rewrite()
+                self.recovered = True
+                return self.last_payload
+        if valid_end < len(content):
+            logger.warning(
+                'Dropping {} bytes of torn or corrupt records at the end '
+                'of {}.'.format(len(content) - valid_end, self.path)
+            )
+            with open(self.path, 'r+b') as log_file:
+                log_file.truncate(valid_end)
+                os.fsync(log_file.fileno())
+        self.record_count = len(records)
+        self.last_payload = records[-1] if records else None
+        self.recovered = True
+        return self.last_payload
+
+    def append(self, state: dict) -> bool:
+        # Returns whether a record was written.
+        payload = self.encode(state)
+        with self.lock:
+            # Never append to a log that was not checked first, it could end
+            # in a torn record.
+            if not self.recovered:
+                self.read_latest()
+            if payload == self.last_payload:
+                return False
+            self.last_payload = payload
+            if self.record_count + 1 >= self.compact_threshold:
+                self.rewrite()
+                return True
+            if self.file is None:
+                self.file = open(self.path, 'ab')
+            self.file.write(self.format_record(payload))
+            self.file.flush()
+            self.record_count += 1
+            if self.fsync == FSYNC_ALWAYS:
+                os.fsync(self.file.fileno())
+            elif self.fsync == FSYNC_INTERVAL and self.sync_timer is None:
+                self.sync_timer = Timer(self.fsync_interval, self.sync)
+                self.sync_timer.daemon = True
+                self.sync_timer.start()
+        return True
+
+    def sync(self) -> None:
+        with self.lock:
+            self.sync_timer = None
+            if self.file is not None:
+                os.fsync(self.file.fileno())
+
+    def close(self) -> None:
+        with self.lock:
+            self.close_file()
+
+    def close_file(self) -> None:
+        if self.sync_timer is not None:
+            self.sync_timer.cancel()
+            self.sync_timer = None
+        if self.file is not None:
+            if self.fsync != FSYNC_NEVER:
+                os.fsync(self.file.fileno())
+            self.file.close()
+            self.file = None
+
+    def rewrite(self) -> None:
+        # Compaction: replaces the log with one holding only the latest
+        # record, through a temporary file so a crash leaves either log.
+        self.close_file()
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'wb') as temp_file:
+            temp_file.write(self.format_record(self.last_payload))
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+        os.replace(temp_path, self.path)
+        sync_directory(self.path)
+        self.record_count = 1
+
+    def encode(self, state: dict) -> bytes:
+        return json.dumps(
+            state, sort_keys=True, separators=(',', ':')
+        ).encode()
+
+    def format_record(self, payload: bytes) -> bytes:
+        return b'%08x %s\n' % (crc32(payload), payload)
+
+    def parse(self, content: bytes):
+        # Returns the payloads of the valid records, and where they end.
+        records = []
+        position = 0
+        while position < len(content):
+            line_end = content.find(b'\n', position)
+            if line_end < 0:
+                break
+            line = content[position:line_end]
+            checksum, _, payload = line.partition(b' ')
+            try:
+                valid = int(checksum, 16) == crc32(payload)
+            except ValueError:
+                valid = False
+            if not valid:
+                break
+            records.append(payload)
+            position = line_end + 1
+        return records, position
+
+    def parse_legacy(self, content: bytes):
+        # Data files of older versions are a single JSON object.
+        try:
+            state = json.loads(content.decode())
+        except ValueError:
+            return None
+        return state if isinstance(state, dict) else None
+
+
+def sync_directory(path: str) -> None:
+    # Makes the rename of `path` durable. Not every platform can open
+    # directories.
+    try:
+        directory = os.open(
+            os.path.dirname(os.path.abspath(path)), os.O_RDONLY
+        )
+    except OSError:
+        return
+    try:
+        os.fsync(directory)
+    except OSError:
+        pass
+    finally:
+        os.close(directory)
@@ -0,0 +1,203 @@
+from threading import Lock
+import json
+import logging
+import sqlite3
+
+
+logger = logging.getLogger('mystery_graph_bot')
+
+
+SCHEMA_VERSION = 2
+
+# Chats with a `min_delta` of at most the delta of a changed relation, and
+# not muting it. `changed` is filled with the relations and their deltas.
+WANTED_QUERY = (
+    'WITH changed (kind, delta) AS (VALUES {}) '
+    'SELECT DISTINCT subscribers.chat_id FROM changed '
+    'JOIN subscribers ON subscribers.min_delta <= changed.delta '
+    'WHERE NOT EXISTS (SELECT 1 FROM mutes WHERE mutes.kind = changed.kind '
+    'AND mutes.chat_id = subscribers.chat_id)'
+)
+
+
+class Subscriber:
+    def __init__(self, chat_id, min_delta: int = 0, muted=()):
+        self.chat_id = chat_id
+        # Changes of less than `min_delta` in every relation, and changes of
+        # `muted` relations, are not notified.
+        self.min_delta = min_delta
+        self.muted = frozenset(muted)
+
+
+class SubscriberStore:
+    # Chats subscribed to the updates of a graph, with their preferences.
+    # They are kept in an SQLite database, indexed by `min_delta` and by
+    # muted relation (kind), so the chats wanting a change are looked up by
+    # SQLite; `subscribers` keeps them in memory for lookups by chat. A new
+    # database gets the chats of `seed_chats`, so the `chat_whitelist` of
+    # older configs carries over.
+
+    def __init__(self, path: str, seed_chats=()):
+        self.path = path
+        self.lock = Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        with self.lock, self.connection:
+            self.create(seed_chats)
+            rows = self.connection.execute(
+                'SELECT chat_id, min_delta, muted FROM subscribers'
+            ).fetchall()
+        self.subscribers = {}
+        for chat_id, min_delta, muted in rows:
+            chat_id = json.loads(chat_id)
+            self.subscribers[chat_id] = Subscriber(
+                chat_id, min_delta, json.loads(muted)
+            )
+
+    def create(self, seed_chats) -> None:
+        version, = self.connection.execute('PRAGMA user_version').fetchone()
+        if version >= SCHEMA_VERSION:
+            return
+        if version < 1:
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS subscribers ('
+                'chat_id TEXT PRIMARY KEY, '
+                'min_delta INTEGER NOT NULL DEFAULT 0, '
+                "muted TEXT NOT NULL DEFAULT '[]')"
+            )
+            self.connection.executemany(
+                'INSERT OR IGNORE INTO subscribers (chat_id) VALUES (?)',
+                [(json.dumps(normalize_chat_id(chat_id)),)
+                 for chat_id in seed_chats]
+            )
+        if version < 2:
+            self.connection.execute(
+                'CREATE INDEX IF NOT EXISTS subscribers_min_delta '
+                'ON subscribers (min_delta, chat_id)'
+            )
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS mutes ('
+                'kind TEXT NOT NULL, chat_id TEXT NOT NULL, '
+                'PRIMARY KEY (kind, chat_id)) WITHOUT ROWID'
+            )
+            self.connection.executemany(
+                'INSERT OR IGNORE INTO mutes (kind, chat_id) VALUES (?, ?)',
+                [(kind, chat_id) for chat_id, muted in self.connection.execute(
+                    'SELECT chat_id, muted FROM subscribers'
+                ).fetchall() for kind in json.loads(muted)]
+            )
+        self.connection.execute(
+            'PRAGMA user_version = {}'.format(SCHEMA_VERSION)
+        )
+
+    def __len__(self) -> int:
+        return len(self.subscribers)
+
+    def __contains__(self, chat_id) -> bool:
+        return normalize_chat_id(chat_id) in self.subscribers
+
+    def __iter__(self):
+        return iter(list(self.subscribers))
+
+    def get(self, chat_id):
+        return self.subscribers.get(normalize_chat_id(chat_id))
+
+    def subscribe(self, chat_id) -> bool:
+        # Returns whether the chat was not subscribed yet.
+        chat_id = normalize_chat_id(chat_id)
+        with self.lock:
+            with self.connection:
+                inserted = self.connection.execute(
+                    'INSERT OR IGNORE INTO subscribers (chat_id) VALUES (?)',
+                    (json.dumps(chat_id),)
+                ).rowcount
+            if not inserted:
+                return False
+            self.subscribers[chat_id] = Subscriber(chat_id)
+        logger.info('Chat {} subscribed.'.format(chat_id))
+        return True
+
+    def unsubscribe(self, chat_id) -> bool:
+        # Returns whether the chat was subscribed.
+        chat_id = normalize_chat_id(chat_id)
+        with self.lock:
+            if chat_id not in self.subscribers:
+                return False
+            with self.connection:
+                self.connection.execute(
+                    'DELETE FROM subscribers WHERE chat_id = ?',
+                    (json.dumps(chat_id),)
+                )
+                self.connection.execute(
+                    'DELETE FROM mutes WHERE chat_id = ?',
+                    (json.dumps(chat_id),)
+                )
+            del self.subscribers[chat_id]
+        logger.info('Chat {} unsubscribed.'.format(chat_id))
+        return True
+
+    def set_preferences(
+        self, chat_id, min_delta: int = None, muted=None
+    ) -> Subscriber:
+        # Subscribes the chat if needed.
+        chat_id = normalize_chat_id(chat_id)
+        with self.lock:
+            subscriber = self.subscribers.get(chat_id) or Subscriber(chat_id)
+            subscriber = Subscriber(
+                chat_id,
+                subscriber.min_delta if min_delta is None else min_delta,
+                subscriber.muted if muted is None else muted,
+            )
+            self.save(subscriber)
+        return subscriber
+
+    def save(self, subscriber: Subscriber) -> None:
+        # Needs the lock.
+        chat_id = json.dumps(subscriber.chat_id)
+        with self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO subscribers '
+                '(chat_id, min_delta, muted) VALUES (?, ?, ?)',
+                (chat_id, subscriber.min_delta,
+                 json.dumps(sorted(subscriber.muted)))
+            )
+            self.connection.execute(
+                'DELETE FROM mutes WHERE chat_id = ?', (chat_id,)
+            )
+            self.connection.executemany(
+                'INSERT INTO mutes (kind, chat_id) VALUES (?, ?)',
+                [(kind, chat_id) for kind in subscriber.muted]
+            )
+        self.subscribers[subscriber.chat_id] = subscriber
+
+    def get_wanted(self, deltas: dict) -> list:
+        # Chats wanting a change of `deltas[relation]` in every relation:
+        # those not muting one of the changed relations whose change is at
+        # least their `min_delta`. When nothing changed, every relation
+        # counts as changed.
+        changed = {
+            relation: abs(delta) for relation, delta in deltas.items()
+            if delta
+        } or {relation: 0 for relation in deltas}
+        if not changed:
+            return []
+        parameters = [
+            value for relation, delta in changed.items()
+            for value in (relation, delta)
+        ]
+        query = WANTED_QUERY.format(', '.join(['(?, ?)'] * len(changed)))
+        with self.lock:
+            rows = self.connection.execute(query, parameters).fetchall()
+        return [json.loads(chat_id) for chat_id, in rows]
+
+    def close(self) -> None:
+        with self.lock:
+            self.connection.close()
+
+
+def normalize_chat_id(chat_id):
+    # Chat ids may be configured as strings, but Telegram sends integers.
+    if isinstance(chat_id, str) and chat_id.lstrip('-').isdigit():
+        return int(chat_id)
+    return chat_id
@@ -0,0 +1,244 @@
+from concurrent.futures import ThreadPoolExecutor, wait
+from io import BytesIO
+from math import ceil
+from threading import Lock
+from typing import Union
+import logging
+import time
+
+from telegram.error import RetryAfter, TelegramError, Unauthorized
+
+from .metrics import REGISTRY
+
+
+logger = logging.getLogger('mystery_graph_bot')
+
+
+# Telegram allows about 30 messages per second overall, and about one per
+# second to the same chat.
+GLOBAL_RATE = 30
+CHAT_RATE = 1
+MAX_RETRIES = 3
+# Telegram answers 403 Forbidden (`Unauthorized`) to messages for chats that
+# blocked or removed the bot, and 400 with one of these to some others.
+GONE_CHAT_ERRORS = ('chat not found', 'blocked', 'kicked', 'deactivated')
+
+SEND_SECONDS = REGISTRY.histogram(
+    'mgb_telegram_send_seconds',
+    'Time of every sendMessage or editMessageText call.'
+)
+WAIT_SECONDS = REGISTRY.histogram(
+    'mgb_telegram_rate_limit_wait_seconds',
+    'Time messages waited for the rate limits.'
+)
+NOTIFICATIONS = REGISTRY.counter(
+    'mgb_notifications_total', 'Messages sent to chats, by result.',
+    ['result']
+)
+RETRIES = REGISTRY.counter(
+    'mgb_telegram_retries_total', 'Messages sent again after a 429.'
+)
+
+
+class TokenBucket:
+    # Thread safe token bucket. `reserve` takes a token right away, even if
+    # it is not there yet, and returns how long the caller has to wait for
+    # it; that keeps waiting callers in line without holding the lock.
+
+    def __init__(self, rate: float, capacity: float = 1, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.tokens = capacity
+        self.updated_at = clock()
+        self.lock = Lock()
+
+    def reserve(self) -> float:
+        with self.lock:
+            now = self.clock()
+            self.tokens = min(
+                self.capacity,
+                self.tokens + (now - self.updated_at) * self.rate
+            )
+            self.updated_at = now
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+
+class DeliveryReport:
+    def __init__(self, latencies: dict, errors: dict):
+        # Seconds from the start of the fan-out to the delivery of every
+        # chat that got its message, and the error of every chat that did
+        # not.
+        self.latencies = latencies
+        self.errors = errors
+
+    def percentile(self, percent: float):
+        values = sorted(self.latencies.values())
+        if not values:
+            return None
+        # Nearest rank.
+        rank = max(1, ceil(len(values) * percent / 100))
+        return values[rank - 1]
+
+    def get_summary(self) -> str:
+        total = len(self.latencies) + len(self.errors)
+        summary = 'Delivered {}/{} messages'.format(len(self.latencies), total)
+        if self.latencies:
+            summary += ', latency p50={:.3f}s p90={:.3f}s p99={:.3f}s'.format(
+                self.percentile(50), self.percentile(90), self.percentile(99)
+            )
+        return summary
+
+
+class TelegramSender:
+    # Sends bot messages under Telegram's rate limits. Every message waits
+    # for a token of its chat and then for a global one, and is sent again
+    # after the delay Telegram asks for when it answers 429 anyway.
+
+    def __init__(
+        self, bot, executor=None, global_rate: float = GLOBAL_RATE,
+        chat_rate: float = CHAT_RATE, max_retries: int = MAX_RETRIES,
+        clock=time.monotonic, sleep=time.sleep
+    ):
+        self.bot = bot
+        self.executor = executor or ThreadPoolExecutor(max_workers=8)
+        self.chat_rate = chat_rate
+        self.max_retries = max_retries
+        self.clock = clock
+        self.sleep = sleep
+        self.global_bucket = TokenBucket(global_rate, global_rate, clock)
+        self.chat_buckets = {}
+        self.chat_buckets_lock = Lock()
+
+    def send_message(self, chat_id: Union[str, int], **kwargs):
+        try:
+            message = self.send_with_retries(chat_id, **kwargs)
+        except Exception:
+            NOTIFICATIONS.labels('failed').inc()
+            raise
+        NOTIFICATIONS.labels('sent').inc()
+        return message
+
+    def edit_message(
+        self, chat_id: Union[str, int], message_id: int, **kwargs
+    ):
+        # Edits count against the same rate limits as new messages.
+        try:
+            message = self.send_with_retries(
+                chat_id, method=self.bot.editMessageText,
+                message_id=message_id, **kwargs
+            )
+        except Exception:
+            NOTIFICATIONS.labels('failed').inc()
+            raise
+        NOTIFICATIONS.labels('edited').inc()
+        return message
+
+    def send_document(
+        self, chat_id: Union[str, int], document, filename: str = None,
+        **kwargs
+    ):
+        # `document` is either the contents of a file to upload, or the id
+        # of a file already uploaded to Telegram.
+        def send(**send_kwargs):
+            if isinstance(document, bytes):
+                # Every attempt needs a file of its own to read.
+                send_kwargs.update(
+                    document=BytesIO(document), filename=filename
+                )
+            else:
+                send_kwargs.update(document=document)
+            return self.bot.sendDocument(**send_kwargs)
+
+        try:
+            message = self.send_with_retries(chat_id, method=send, **kwargs)
+        except Exception:
+            NOTIFICATIONS.labels('failed').inc()
+            raise
+        NOTIFICATIONS.labels('sent').inc()
+        return message
+
+    def send_with_retries(
+        self, chat_id: Union[str, int], method=None, **kwargs
+    ):
+        method = method or self.bot.sendMessage
+        self.wait_for(self.get_chat_bucket(chat_id))
+        self.wait_for(self.global_bucket)
+        retries = 0
+        while True:
+            try:
+                with SEND_SECONDS.time():
+                    return method(chat_id=chat_id, **kwargs)
+            except RetryAfter as e:
+                if retries >= self.max_retries:
+                    raise
+                retries += 1
+                RETRIES.inc()
+                logger.warning(
+                    'Telegram asked to wait {}s before sending to chat {} '
+                    '(retry {}/{})'.format(
+                        e.retry_after, chat_id, retries, self.max_retries
+                    )
+                )
+                self.sleep(e.retry_after)
+                self.wait_for(self.global_bucket)
+
+    def fan_out(self, chat_ids, function) -> DeliveryReport:
+        # Calls `function(chat_id)` for every chat concurrently and waits for
+        # all of them.
+        start = self.clock()
+
+        def timed(chat_id):
+            function(chat_id)
+            return self.clock() - start
+
+        futures = {
+            chat_id: self.executor.submit(timed, chat_id)
+            for chat_id in chat_ids
+        }
+        wait(futures.values())
+        latencies = {}
+        errors = {}
+        for chat_id, future in futures.items():
+            error = future.exception()
+            if error is None:
+                latencies[chat_id] = future.result()
+            else:
+                errors[chat_id] = error
+                logger.error('Could not notify chat {}: {}'.format(
+                    chat_id, error
+                ))
+        report = DeliveryReport(latencies, errors)
+        if futures:
+            logger.info(report.get_summary())
+        return report
+
+    def get_chat_bucket(self, chat_id: Union[str, int]) -> TokenBucket:
+        with self.chat_buckets_lock:
+            if chat_id not in self.chat_buckets:
+                self.chat_buckets[chat_id] = TokenBucket(
+                    self.chat_rate, 1, self.clock
+                )
+            return self.chat_buckets[chat_id]
+
+    def wait_for(self, bucket: TokenBucket) -> None:
+        delay = bucket.reserve()
+        WAIT_SECONDS.observe(delay)
+        if delay > 0:
+            self.sleep(delay)
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=False)
+
+
+def is_chat_gone(error: Exception) -> bool:
+    # Whether messages for the chat will never get through again.
+    if isinstance(error, Unauthorized):
+        return True
+    if not isinstance(error, TelegramError):
+        return False
+    message = str(error).lower()
+    return any(reason in message for reason in GONE_CHAT_ERRORS)
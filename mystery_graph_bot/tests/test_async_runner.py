@@ -0,0 +1,168 @@
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import MagicMock
+import asyncio
+import logging
+import os
+import threading
+import time
+
+from ..async_runner import AsyncGraphRunner
+from ..graph_notifier import GraphNotifier
+from ..profiling import CycleProfiler
+from ..telegram_sender import TelegramSender
+
+
+class DummyGraphData:
+
+    def __init__(self):
+        self.data = {'etag': 'a', 'liks': 1, 'noms': 1}
+
+    def __getitem__(self, index):
+        return self.data[index]
+
+
+class AsyncGraphRunnerTestCase(TestCase):
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.loop = asyncio.new_event_loop()
+        self.fetcher = MagicMock()
+        self.fetcher.poll_graph.return_value = {'etag': 'b', 'graph': None}
+        self.cruncher = MagicMock(return_value={
+            'etag': 'b', 'liks': 3, 'noms': 1,
+            'diff': {'added': {'lik': 2}, 'removed': {},
+                     'affected_nodes': []},
+        })
+        self.notifier = MagicMock()
+        self.saver = MagicMock()
+        self.runner = AsyncGraphRunner(
+            self.fetcher, self.cruncher, self.notifier, self.saver,
+            DummyGraphData(), refresh_time=0.05, loop=self.loop
+        )
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+        self.runner.shutdown()
+        self.loop.close()
+
+    def test_run_cycle(self):
+        self.loop.run_until_complete(self.runner.run_cycle())
+        self.cruncher.assert_called_once_with({'etag': 'b', 'graph': None})
+        data_pair = self.saver.on_next.call_args[0][0]
+        self.assertEqual(data_pair['old']['etag'], 'a')
+        self.assertEqual(data_pair['new']['liks'], 3)
+        self.assertEqual(data_pair['diff']['added'], {'lik': 2})
+        self.notifier.on_next.assert_called_once_with(data_pair)
+
+    def test_run_cycle_when_polling_fails(self):
+        self.fetcher.poll_graph.return_value = None
+        self.loop.run_until_complete(self.runner.run_cycle())
+        self.cruncher.assert_not_called()
+        self.saver.on_next.assert_not_called()
+
+    def use_graph_notifier(self, send_message):
+        bot = MagicMock()
+        bot.sendMessage.side_effect = send_message
+        sender = TelegramSender(
+            bot, ThreadPoolExecutor(3, thread_name_prefix='sender')
+        )
+        self.addCleanup(sender.shutdown)
+        self.runner.notifier = GraphNotifier(
+            bot, [1, 2, 3], 'http://my.graph.xd/', sender=sender
+        )
+
+    def test_chats_are_notified_by_the_sender(self):
+        barrier = threading.Barrier(3, timeout=5)
+        threads = []
+
+        def send_message(**kwargs):
+            threads.append(threading.current_thread().name)
+            barrier.wait()
+        self.use_graph_notifier(send_message)
+        # A single IO worker could not send to the three chats at once.
+        self.runner.io_executor.shutdown()
+        self.runner.io_executor = ThreadPoolExecutor(1)
+        self.loop.run_until_complete(self.runner.run_cycle())
+        self.assertFalse(barrier.broken)
+        self.assertEqual(len(threads), 3)
+        for name in threads:
+            self.assertTrue(name.startswith('sender'))
+
+    def test_failing_chat_does_not_stop_the_others(self):
+        def send_message(chat_id, **kwargs):
+            if chat_id == 1:
+                raise Exception('Forbidden')
+        self.use_graph_notifier(send_message)
+        self.runner.notifier.prune = MagicMock()
+        self.loop.run_until_complete(self.runner.run_cycle())
+        self.assertEqual(self.saver.on_next.call_count, 1)
+        errors, delivered = self.runner.notifier.prune.call_args[0]
+        self.assertEqual(list(errors), [1])
+        self.assertEqual(delivered, 2)
+
+    def test_polls_on_fixed_rate_clock(self):
+        starts = []
+
+        def poll_graph():
+            starts.append(time.monotonic())
+            time.sleep(0.02)
+        self.fetcher.poll_graph.side_effect = poll_graph
+        self.loop.run_until_complete(self.runner.run(cycles=4))
+        periods = [b - a for a, b in zip(starts, starts[1:])]
+        self.assertEqual(len(periods), 3)
+        for period in periods:
+            self.assertAlmostEqual(period, 0.05, delta=0.015)
+
+    def test_slow_cycle_does_not_shift_scheduled_ticks(self):
+        starts = []
+
+        def poll_graph():
+            starts.append(time.monotonic())
+            # Only the first cycle is slow, and it misses a tick.
+            if len(starts) == 1:
+                time.sleep(0.07)
+        self.fetcher.poll_graph.side_effect = poll_graph
+        self.runner.scheduler = MagicMock()
+        self.runner.scheduler.next_delay.return_value = 0.05
+        self.loop.run_until_complete(self.runner.run(cycles=4))
+        offsets = [start - starts[0] for start in starts]
+        for offset, tick in zip(offsets, [0, 0.1, 0.15, 0.2]):
+            self.assertAlmostEqual(offset, tick, delta=0.015)
+
+    def test_run_cycle_with_profiler(self):
+        with TemporaryDirectory() as directory:
+            profiler = CycleProfiler(directory, threshold=0)
+            self.runner.profiler = profiler
+            self.loop.run_until_complete(self.runner.run_cycle())
+            self.assertEqual(
+                list(profiler.stage_times),
+                ['fetch', 'crunch', 'notify', 'save']
+            )
+            self.assertEqual(len(os.listdir(directory)), 1)
+
+    def test_coalesced_notify_is_profiled_apart(self):
+        with TemporaryDirectory() as directory:
+            profiler = CycleProfiler(directory, threshold=0)
+            self.runner.profiler = profiler
+            profiler.start_cycle()
+            future = self.runner.schedule_notify({'new': {}})
+            self.loop.run_until_complete(
+                asyncio.wrap_future(future, loop=self.loop)
+            )
+            profiler.finish_cycle()
+            self.assertEqual(list(profiler.stage_times), ['coalesced_notify'])
+
+    def test_coalesced_changes_are_notified_once(self):
+        self.runner.shutdown()
+        self.runner = AsyncGraphRunner(
+            self.fetcher, self.cruncher, self.notifier, self.saver,
+            DummyGraphData(), refresh_time=0.01, loop=self.loop,
+            coalesce_window=60
+        )
+        self.loop.run_until_complete(self.runner.run(cycles=3))
+        self.assertEqual(self.saver.on_next.call_count, 3)
+        data_pair, = self.notifier.on_next.call_args[0]
+        self.notifier.on_next.assert_called_once_with(data_pair)
+        self.assertEqual(data_pair['diff']['added'], {'lik': 6})
@@ -0,0 +1,83 @@
+from unittest import TestCase
+import random
+
+from igraph import Graph as IGraph
+
+from ..clique_tracker import CliqueTracker
+
+
+def omega(edges, node_count):
+    igraph = IGraph(directed=False)
+    igraph.add_vertices(node_count)
+    igraph.add_edges(edges)
+    return igraph.omega()
+
+
+class CliqueTrackerTestCase(TestCase):
+
+    def assert_is_clique(self, tracker):
+        nodes = list(tracker.max_clique)
+        for i, u in enumerate(nodes):
+            for v in nodes[i + 1:]:
+                self.assertIn(v, tracker.adjacency[u])
+
+    def test_reset(self):
+        tracker = CliqueTracker()
+        tracker.reset([(0, 1), (1, 2), (2, 0), (2, 3), (3, 3), (0, 1)])
+        self.assertEqual(tracker.max_clique, {0, 1, 2})
+        tracker.reset([])
+        self.assertEqual(tracker.clique_number, 0)
+
+    def test_added_edge_grows_clique(self):
+        tracker = CliqueTracker()
+        tracker.reset([(0, 1), (1, 2), (2, 3), (3, 0), (0, 2)])
+        self.assertEqual(tracker.clique_number, 3)
+        tracker.update([(1, 3)], [])
+        self.assertEqual(tracker.max_clique, {0, 1, 2, 3})
+
+    def test_removed_edge_breaks_clique(self):
+        tracker = CliqueTracker()
+        tracker.reset([(0, 1), (1, 2), (2, 0), (3, 4)])
+        tracker.update([], [(0, 1)])
+        self.assertEqual(tracker.clique_number, 2)
+        self.assert_is_clique(tracker)
+        tracker.update([], [(1, 2), (2, 0), (3, 4)])
+        self.assertEqual(tracker.clique_number, 0)
+
+    def test_duplicated_edges_need_to_be_removed_twice(self):
+        tracker = CliqueTracker()
+        tracker.reset([(0, 1), (1, 0), (1, 2), (2, 0)])
+        tracker.update([], [(0, 1), (5, 6)])
+        self.assertEqual(tracker.clique_number, 3)
+        tracker.update([], [(0, 1)])
+        self.assertEqual(tracker.clique_number, 2)
+
+    def test_randomized_edits_match_full_omega(self):
+        rng = random.Random(1234)
+        for node_count, density in ((8, 0.5), (15, 0.3), (30, 0.2)):
+            pairs = [
+                (u, v) for u in range(node_count)
+                for v in range(u + 1, node_count)
+            ]
+            edges = set(rng.sample(pairs, int(len(pairs) * density)))
+            tracker = CliqueTracker()
+            tracker.reset(edges)
+            for _ in range(60):
+                removed = set(rng.sample(
+                    sorted(edges), min(len(edges), rng.randrange(4))
+                ))
+                added = set(rng.sample(
+                    [pair for pair in pairs if pair not in edges],
+                    rng.randrange(4)
+                ))
+                edges = (edges - removed) | added
+                tracker.update(
+                    [(v, u) if rng.random() < 0.5 else (u, v)
+                     for u, v in added],
+                    removed
+                )
+                self.assertEqual(
+                    max(tracker.clique_number, 1),
+                    omega(sorted(edges), node_count)
+                )
+                self.assert_is_clique(tracker)
@@ -0,0 +1,231 @@
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import TemporaryDirectory
+from threading import Event
+from unittest import TestCase
+from unittest.mock import MagicMock
+import logging
+import os
+
+from ..command_handler import HELP_TEXT, CommandHandler, ResultCache
+from ..subscriber_store import SubscriberStore
+
+
+DATA = {
+    'etag': 'a', 'liks': 10, 'noms': 4, 'lik_record': 3, 'nom_record': 2,
+    'clique_number': None,
+}
+
+
+def make_update(update_id, chat_id, text):
+    update = MagicMock()
+    update.update_id = update_id
+    update.message.chat_id = chat_id
+    update.message.text = text
+    return update
+
+
+class ResultCacheTestCase(TestCase):
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def test_replies(self):
+        cache = ResultCache()
+        self.assertIsNone(cache.get_reply('status'))
+        cache.update(DATA, updated_at=0)
+        self.assertEqual(cache.get_reply('status'), (
+            'Liks: 10\nNoms: 4\nClique number: unknown\n'
+            'Updated: 1970-01-01 00:00 UTC'
+        ))
+        self.assertEqual(cache.get_reply('records'), (
+            'Most liks received by a node: 3\nMost noms of a node: 2'
+        ))
+
+    def test_name_header(self):
+        cache = ResultCache('<b>')
+        cache.update(DATA)
+        self.assertTrue(
+            cache.get_reply('records').startswith('<b>&lt;b&gt;</b>\n')
+        )
+
+    def test_on_next(self):
+        cache = ResultCache()
+        cache.on_next({'new': dict(DATA, liks=11, clique_number=3)})
+        self.assertIn('Liks: 11', cache.get_reply('status'))
+        self.assertIn('Clique number: 3', cache.get_reply('status'))
+        cache.on_next({'wrong': 1})
+        self.assertIn('Liks: 11', cache.get_reply('status'))
+
+
+class CommandHandlerTestCase(TestCase):
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.bot = MagicMock()
+        self.sender = MagicMock()
+        self.sender.executor = ThreadPoolExecutor(max_workers=4)
+        self.cache = ResultCache()
+        self.cache.update(DATA)
+        self.handler = CommandHandler(
+            self.bot, [self.cache], [1, '2'], self.sender
+        )
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+        self.sender.executor.shutdown(wait=True)
+
+    def get_replies(self):
+        self.sender.executor.shutdown(wait=True)
+        return [
+            (args[0], kwargs['text'])
+            for args, kwargs in self.sender.send_message.call_args_list
+        ]
+
+    def test_poll(self):
+        self.bot.getUpdates.return_value = [
+            make_update(5, 1, '/status'),
+            make_update(6, 2, '/records@MysteryGraphBot'),
+        ]
+        self.handler.poll()
+        self.assertEqual(self.handler.offset, 7)
+        self.assertCountEqual(self.get_replies(), [
+            (1, self.cache.get_reply('status')),
+            (2, self.cache.get_reply('records')),
+        ])
+        self.bot.getUpdates.return_value = []
+        self.handler.poll()
+        self.assertEqual(
+            self.bot.getUpdates.call_args[1]['offset'], 7
+        )
+
+    def test_ignores_other_messages(self):
+        self.bot.getUpdates.return_value = [
+            make_update(1, 3, '/status'),
+            make_update(2, 1, 'status'),
+            make_update(3, 1, '/unknown'),
+            make_update(4, 1, None),
+        ]
+        self.handler.poll()
+        self.assertEqual(self.get_replies(), [])
+
+    def test_help(self):
+        self.handler.handle_update(make_update(1, 1, '/start'))
+        self.assertEqual(self.get_replies(), [(1, HELP_TEXT)])
+
+    def test_not_polled_yet(self):
+        self.handler.caches = [ResultCache()]
+        self.handler.handle_update(make_update(1, 1, '/status'))
+        self.assertEqual(
+            self.get_replies(),
+            [(1, 'The Mystery Graph has not been polled yet.')]
+        )
+
+    def test_several_graphs(self):
+        other_cache = ResultCache('other')
+        other_cache.update(DATA)
+        self.handler.caches.append(other_cache)
+        self.handler.handle_update(make_update(1, 1, '/records'))
+        (_, text), = self.get_replies()
+        self.assertEqual(text.count('Most noms of a node'), 2)
+        self.assertIn('<b>other</b>', text)
+
+    def test_burst_is_coalesced(self):
+        release = Event()
+
+        def send_message(chat_id, **kwargs):
+            release.wait(5)
+        self.sender.send_message.side_effect = send_message
+        for update_id in range(300):
+            self.handler.handle_update(make_update(update_id, 1, '/status'))
+        self.handler.handle_update(make_update(300, 2, '/status'))
+        release.set()
+        self.assertCountEqual(
+            [chat_id for chat_id, _ in self.get_replies()], [1, 2]
+        )
+        self.assertEqual(self.handler.pending, set())
+
+    def test_max_pending(self):
+        self.handler.max_pending = 1
+        release = Event()
+        self.sender.send_message.side_effect = (
+            lambda chat_id, **kwargs: release.wait(5)
+        )
+        self.handler.handle_update(make_update(1, 1, '/status'))
+        self.handler.handle_update(make_update(2, 2, '/status'))
+        release.set()
+        self.assertEqual(
+            [chat_id for chat_id, _ in self.get_replies()], [1]
+        )
+
+    def test_failed_reply_is_not_pending(self):
+        self.sender.send_message.side_effect = Exception('Forbidden')
+        self.handler.handle_update(make_update(1, 1, '/status'))
+        self.get_replies()
+        self.assertEqual(self.handler.pending, set())
+
+    def test_run_retries_after_errors(self):
+        calls = []
+
+        def get_updates(**kwargs):
+            calls.append(kwargs)
+            if len(calls) == 1:
+                raise Exception('Timed out')
+            self.handler.stop()
+            return []
+        self.bot.getUpdates.side_effect = get_updates
+        self.handler.stopped.wait = MagicMock()
+        self.handler.run()
+        self.assertEqual(len(calls), 2)
+        self.handler.stopped.wait.assert_called_once_with(2)
+
+
+class SubscriptionCommandsTestCase(TestCase):
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.directory = TemporaryDirectory()
+        self.store = SubscriberStore(
+            os.path.join(self.directory.name, 'graph.subscribers'),
+            seed_chats=[1]
+        )
+        self.sender = MagicMock()
+        self.sender.executor = ThreadPoolExecutor(max_workers=4)
+        self.handler = CommandHandler(
+            MagicMock(), [ResultCache()], None, self.sender,
+            stores=[self.store]
+        )
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+        self.sender.executor.shutdown(wait=True)
+        self.store.close()
+        self.directory.cleanup()
+
+    def send(self, chat_id, text):
+        self.handler.handle_update(make_update(1, chat_id, text))
+        self.sender.executor.shutdown(wait=True)
+        self.sender.executor = ThreadPoolExecutor(max_workers=4)
+        return self.sender.send_message.call_args[1]['text']
+
+    def test_subscribe_and_unsubscribe(self):
+        self.assertIn('Subscribed', self.send(3, '/subscribe'))
+        self.assertIn('already', self.send(3, '/subscribe'))
+        self.assertCountEqual(list(self.store), [1, 3])
+        self.assertIn('Unsubscribed', self.send(1, '/unsubscribe'))
+        self.assertIn('not subscribed', self.send(1, '/unsubscribe'))
+        self.assertCountEqual(list(self.store), [3])
+
+    def test_preferences(self):
+        self.assertIn('less than 4 links', self.send(1, '/mindelta 4'))
+        self.assertEqual(self.send(1, '/mindelta x'), 'Usage: /mindelta N')
+        self.assertIn('liks will not', self.send(1, '/mute liks'))
+        self.send(1, '/mute nom')
+        self.send(1, '/unmute nom')
+        self.assertEqual(self.store.get(1).min_delta, 4)
+        self.assertEqual(self.store.get(1).muted, {'lik'})
+
+    def test_help(self):
+        self.assertIn('/subscribe', self.send(5, '/help'))
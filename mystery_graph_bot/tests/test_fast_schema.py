@@ -0,0 +1,89 @@
+from unittest import TestCase
+
+from marshmallow import Schema, fields, validates
+
+from ..errors import SchemaLoadError
+from ..fast_schema import compile_checker, load_data_with_schema
+from ..serializers import Config, Graph, WrappedGraph
+
+
+def make_graph(link_count):
+    return {
+        'links': [
+            {'source': i, 'target': i + 1, 'value': 'lik'}
+            for i in range(link_count)
+        ],
+        'nodes': [
+            {'index': i, 'name': 'node{}'.format(i)}
+            for i in range(link_count + 1)
+        ],
+    }
+
+
+class OptionalFieldSchema(Schema):
+    name = fields.Str(required=True)
+    nickname = fields.Str(allow_none=True)
+
+
+class ValidatedSchema(Schema):
+    name = fields.Str(required=True)
+
+    @validates('name')
+    def validate_name(self, value):
+        pass
+
+
+class FastSchemaTestCase(TestCase):
+
+    def test_checker_accepts_exact_shapes(self):
+        check_graph = compile_checker(Graph)
+        check_wrapped_graph = compile_checker(WrappedGraph)
+        self.assertTrue(check_graph(make_graph(10)))
+        self.assertTrue(
+            check_wrapped_graph({'etag': 'deadbeef', 'graph': make_graph(3)})
+        )
+
+    def test_checker_rejects_anything_else(self):
+        check_graph = compile_checker(Graph)
+        wrong_graphs = [
+            [],
+            {'links': []},
+            {'links': [], 'nodes': [], 'extra': 1},
+            {'links': {}, 'nodes': []},
+            {'links': [{'source': '1', 'target': 2, 'value': 'lik'}],
+             'nodes': []},
+            {'links': [{'source': True, 'target': 2, 'value': 'lik'}],
+             'nodes': []},
+            {'links': [], 'nodes': [{'index': 1}]},
+        ]
+        for graph in wrong_graphs:
+            self.assertFalse(check_graph(graph), graph)
+
+    def test_optional_fields(self):
+        check = compile_checker(OptionalFieldSchema)
+        self.assertTrue(check({'name': 'a'}))
+        self.assertTrue(check({'name': 'a', 'nickname': None}))
+        self.assertTrue(check({'name': 'a', 'nickname': 'b'}))
+        self.assertFalse(check({'name': 'a', 'other': 'b'}))
+        self.assertFalse(check({'nickname': 'b'}))
+
+    def test_unsupported_schemas(self):
+        self.assertIsNone(compile_checker(Config))
+        self.assertIsNone(compile_checker(ValidatedSchema))
+
+    def test_load_falls_back_to_marshmallow(self):
+        graph = make_graph(2)
+        self.assertIs(load_data_with_schema(Graph(), graph), graph)
+        graph['links'][0]['source'] = '0'
+        loaded = load_data_with_schema(Graph(), graph)
+        self.assertEqual(loaded['links'][0]['source'], 0)
+
+    def test_load_errors_come_from_marshmallow(self):
+        graph = make_graph(2)
+        graph['links'][1]['target'] = 'xd'
+        with self.assertRaises(SchemaLoadError) as context:
+            load_data_with_schema(Graph(), graph)
+        self.assertEqual(
+            context.exception.errors,
+            {'links': {1: {'target': ['Not a valid integer.']}}}
+        )
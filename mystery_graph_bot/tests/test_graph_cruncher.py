@@ -0,0 +1,172 @@
+from unittest import TestCase
+from unittest.mock import MagicMock
+from concurrent.futures import Future, ProcessPoolExecutor
+import logging
+import random
+
+from ..clique_tracker import CliqueTracker
+from ..graph_cruncher import GraphCruncher, PooledGraphCruncher
+from ..graph_diff import GraphDiffer
+from ..graph_snapshot import GraphSnapshot
+
+
+RAW_GRAPH = {
+    'links': [
+        {'source': 1, 'target': 2, 'value': 'lik'},
+        {'source': 3, 'target': 2, 'value': 'lik'},
+        {'source': 1, 'target': 2, 'value': 'nom'},
+        {'source': 2, 'target': 3, 'value': 'nom'},
+        {'source': 3, 'target': 1, 'value': 'nom'},
+        {'source': 3, 'target': 4, 'value': 'nom'},
+    ],
+    'nodes': [
+        {'index': 1, 'name': 'node1'},
+        {'index': 2, 'name': 'node2'},
+        {'index': 3, 'name': 'node3'},
+        {'index': 4, 'name': 'node4'},
+    ],
+}
+
+EXPECTED_GRAPH_DATA = {
+    'etag': 'deadbeef',
+    'liks': 2,
+    'noms': 4,
+    'lik_record': 2,
+    'nom_record': 3,
+    'clique_number': 3,
+}
+
+
+class GraphCruncherTestCase(TestCase):
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def test_crunch_raw_graph(self):
+        cruncher = GraphCruncher()
+        self.assertEqual(
+            cruncher({'etag': 'deadbeef', 'graph': RAW_GRAPH}),
+            EXPECTED_GRAPH_DATA
+        )
+
+    def test_crunch_snapshot(self):
+        cruncher = GraphCruncher()
+        snapshot = GraphSnapshot.from_graph(RAW_GRAPH)
+        self.assertEqual(
+            cruncher({'etag': 'deadbeef', 'graph': snapshot}),
+            EXPECTED_GRAPH_DATA
+        )
+
+    def test_crunch_keeps_change_detection_fields(self):
+        cruncher = GraphCruncher()
+        for graph in (RAW_GRAPH, GraphSnapshot.from_graph(RAW_GRAPH)):
+            graph_data = cruncher({
+                'etag': 'deadbeef', 'graph': graph, 'content_hash': 'cafe',
+                'last_modified': 'Wed, 21 Oct 2015 07:28:00 GMT',
+            })
+            self.assertEqual(graph_data['content_hash'], 'cafe')
+            self.assertEqual(
+                graph_data['last_modified'], 'Wed, 21 Oct 2015 07:28:00 GMT'
+            )
+            self.assertNotIn('edge_fingerprint', graph_data)
+
+    def test_crunch_unexpected_data(self):
+        cruncher = GraphCruncher()
+        self.assertIsNone(cruncher({'etag': 'deadbeef', 'graph': {}}))
+
+    def test_incremental_clique_number_matches_omega(self):
+        rng = random.Random(99)
+        incremental_cruncher = GraphCruncher(
+            differ=GraphDiffer(), clique_tracker=CliqueTracker()
+        )
+        cruncher = GraphCruncher()
+        links = []
+        for _ in range(30):
+            for _ in range(rng.randrange(min(len(links), 3) + 1)):
+                links.pop(rng.randrange(len(links)))
+            for _ in range(rng.randrange(6)):
+                links.append({
+                    'source': rng.randrange(12),
+                    'target': rng.randrange(12),
+                    'value': rng.choice(['lik', 'nom', 'nom']),
+                })
+            raw_graph = {
+                'links': list(links),
+                'nodes': [
+                    {'index': i, 'name': str(i)} for i in range(12)
+                ],
+            }
+            rng.shuffle(raw_graph['links'])
+            wrapped_graph = {'etag': 'deadbeef', 'graph': raw_graph}
+            self.assertEqual(
+                incremental_cruncher(wrapped_graph)['clique_number'],
+                cruncher(wrapped_graph)['clique_number']
+            )
+
+
+class FutureExecutor:
+    # Executor whose jobs only finish when the test says so.
+
+    def __init__(self):
+        self.futures = []
+
+    def submit(self, function, *args):
+        future = Future()
+        future.set_running_or_notify_cancel()
+        self.futures.append((future, function, args))
+        return future
+
+    def finish(self, index=-1):
+        future, function, args = self.futures[index]
+        future.set_result(function(*args))
+
+
+class PooledGraphCruncherTestCase(TestCase):
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.wrapped_graph = {
+            'etag': 'deadbeef', 'graph': GraphSnapshot.from_graph(RAW_GRAPH)
+        }
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def test_crunch_in_process_pool(self):
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            cruncher = PooledGraphCruncher(executor, deadline=30)
+            self.assertEqual(cruncher(self.wrapped_graph), EXPECTED_GRAPH_DATA)
+
+    def test_late_clique_number(self):
+        executor = FutureExecutor()
+        cruncher = PooledGraphCruncher(executor, deadline=0.01)
+        late_results = MagicMock()
+        cruncher.late_results.subscribe(late_results)
+
+        graph_data = cruncher(self.wrapped_graph)
+        self.assertIsNone(graph_data['clique_number'])
+        self.assertEqual(graph_data['liks'], 2)
+        late_results.on_next.assert_not_called()
+
+        executor.finish()
+        late_results.on_next.assert_called_once_with({
+            'etag': 'deadbeef', 'clique_number': 3
+        })
+
+    def test_late_clique_number_abandoned_by_next_cycle(self):
+        executor = FutureExecutor()
+        cruncher = PooledGraphCruncher(executor, deadline=0.01)
+        late_results = MagicMock()
+        cruncher.late_results.subscribe(late_results)
+
+        cruncher(self.wrapped_graph)
+        cruncher(dict(self.wrapped_graph, etag='cafe'))
+        executor.finish(0)
+        late_results.on_next.assert_not_called()
+        executor.finish(1)
+        late_results.on_next.assert_called_once_with({
+            'etag': 'cafe', 'clique_number': 3
+        })
@@ -0,0 +1,93 @@
+from unittest import TestCase
+from collections import Counter
+import random
+
+from ..graph_diff import (
+    GraphDiffer, diff_snapshots, pack_edge, sorted_difference, unpack_edge
+)
+from ..graph_snapshot import GraphSnapshotBuilder
+
+
+def make_snapshot(edges, names=None):
+    builder = GraphSnapshotBuilder()
+    for source, target, value in edges:
+        builder.add_link(source, target, value)
+    for index, name in (names or {}).items():
+        builder.add_node(index, name)
+    return builder.build()
+
+
+class GraphDiffTestCase(TestCase):
+
+    def test_pack_edge(self):
+        key = pack_edge(123456, 654321, 7)
+        self.assertEqual(unpack_edge(key), (123456, 654321, 7))
+        self.assertLess(pack_edge(1, 9, 0), pack_edge(2, 0, 0))
+        self.assertLess(pack_edge(1, 1, 1), pack_edge(1, 2, 0))
+
+    def test_sorted_difference_is_a_multiset_difference(self):
+        rng = random.Random(42)
+        for _ in range(50):
+            old = sorted(rng.randrange(100) for _ in range(rng.randrange(300)))
+            new = sorted(rng.randrange(100) for _ in range(rng.randrange(300)))
+            removed, added = sorted_difference(old, new)
+            self.assertEqual(Counter(removed), Counter(old) - Counter(new))
+            self.assertEqual(Counter(added), Counter(new) - Counter(old))
+
+    def test_sorted_difference_with_long_equal_runs(self):
+        old = list(range(0, 300000, 2))
+        new = old[:1001] + [2001] + old[1001:150000 - 5]
+        removed, added = sorted_difference(old, new)
+        self.assertEqual(added, [2001])
+        self.assertEqual(removed, old[-5:])
+
+    def test_diff_snapshots(self):
+        old = make_snapshot(
+            [(1, 2, 'lik'), (2, 3, 'lik'), (3, 1, 'nom'), (1, 2, 'nom')],
+            {1: 'one', 2: 'two', 3: 'three'}
+        )
+        new = make_snapshot(
+            [(2, 3, 'lik'), (1, 2, 'nom'), (3, 4, 'lik'), (4, 3, 'nom'),
+             (3, 1, 'lik')],
+            {1: 'one', 2: 'two', 3: 'three', 4: 'four'}
+        )
+        diff = diff_snapshots(old, new)
+        self.assertEqual(sorted(diff.added_edges), [
+            (3, 1, 'lik'), (3, 4, 'lik'), (4, 3, 'nom'),
+        ])
+        self.assertEqual(sorted(diff.removed_edges), [
+            (1, 2, 'lik'), (3, 1, 'nom'),
+        ])
+        self.assertEqual(diff.to_dict(), {
+            'added': {'lik': 2, 'nom': 1},
+            'removed': {'lik': 1, 'nom': 1},
+            'affected_nodes': ['one', 'two', 'three', 'four'],
+        })
+
+    def test_diff_identical_snapshots(self):
+        edges = [(i, i + 1, 'nom') for i in range(1000)]
+        diff = diff_snapshots(make_snapshot(edges), make_snapshot(edges[::-1]))
+        self.assertFalse(diff)
+        self.assertEqual(diff.to_dict()['affected_nodes'], [])
+
+    def test_diff_with_relations_in_different_order(self):
+        old = make_snapshot([(1, 2, 'hug'), (1, 2, 'pat')])
+        new = make_snapshot([(1, 2, 'pat'), (2, 1, 'hug')])
+        diff = diff_snapshots(old, new)
+        self.assertEqual(diff.added_edges, [(2, 1, 'hug')])
+        self.assertEqual(diff.removed_edges, [(1, 2, 'hug')])
+
+    def test_diff_with_huge_node_indexes(self):
+        old = make_snapshot([(1, 2, 'lik'), (2 ** 40, 2, 'lik')])
+        new = make_snapshot([(1, 2, 'lik'), (-1, 2, 'nom')])
+        diff = diff_snapshots(old, new)
+        self.assertEqual(diff.added_edges, [(-1, 2, 'nom')])
+        self.assertEqual(diff.removed_edges, [(2 ** 40, 2, 'lik')])
+
+    def test_differ_keeps_last_snapshot(self):
+        differ = GraphDiffer()
+        self.assertIsNone(differ(make_snapshot([(1, 2, 'lik')])))
+        diff = differ(make_snapshot([(1, 2, 'lik'), (2, 1, 'lik')]))
+        self.assertEqual(diff.added, {'lik': 1})
+        diff = differ(make_snapshot([]))
+        self.assertEqual(diff.removed, {'lik': 2})
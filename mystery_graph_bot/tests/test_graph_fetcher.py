@@ -1,12 +1,30 @@
 from unittest import TestCase
 from unittest.mock import patch, MagicMock, PropertyMock, call
+import hashlib
+import json
 import logging
 
 import requests
 
 from .. import graph_fetcher
 from ..serializers import Data 
-from ..GraphFetcher import GraphFetcher
+from ..graph_fetcher import GraphFetcher
+from ..http_client import GraphHttpClient
+from ..poll_scheduler import CHANGED, FAILED, UNCHANGED
+
+
+GRAPH_JSON = """
+    {
+        "links": [
+            {"source": 1, "target": 2, "value": "lik"}
+        ],
+        "nodes": [
+            {"index": 1, "name": "node1"},
+            {"index": 2, "name": "node2"}
+        ]
+    }
+"""
+
 
 class DummyGraphData:
 
@@ -16,6 +34,7 @@ class DummyGraphData:
             'liks': None,
             'noms': None
         }
+        self.saves = 0
 
     def __getitem__(self, index):
         return self._data[index]
@@ -24,7 +43,7 @@ class DummyGraphData:
         self._data[index] = value
 
     def save(self):
-        pass
+        self.saves += 1
 
 
 class GraphFetcherTestCase(TestCase):
@@ -40,8 +59,257 @@ class GraphFetcherTestCase(TestCase):
     def tearDown(self):
         logging.disable(logging.NOTSET)
 
-    @patch()
-    def test_on_subscription(self):
-        def my_observer(mock_graph):
-            pass
-        self.graph_fetcher.
+    @patch.object(GraphFetcher, 'poll_graph')
+    def test_on_subscription(self, poll_graph_mock):
+        observer = MagicMock()
+        poll_graph_mock.return_value = {'etag': 'deadbeef', 'graph': {}}
+        self.graph_fetcher.on_subscription(observer)
+        observer.on_next.assert_called_once_with(poll_graph_mock.return_value)
+
+    @patch.object(GraphFetcher, 'poll_graph', return_value=None)
+    def test_on_subscription_when_polling_fails(self, poll_graph_mock):
+        observer = MagicMock()
+        self.graph_fetcher.on_subscription(observer)
+        observer.on_next.assert_not_called()
+
+    @patch.object(GraphHttpClient, 'get', return_value=MagicMock())
+    @patch.object(GraphFetcher, 'handle_http_graph_response')
+    def test_poll_graph(self, handle_http_graph_response_mock, get_mock):
+        self.graph_fetcher.graph_data['etag'] = 'deadbeef'
+        self.assertEqual(
+            self.graph_fetcher.poll_graph(),
+            handle_http_graph_response_mock.return_value
+        )
+        get_mock.assert_called_once_with(
+            'http://my.graph.xd/', headers={'If-None-Match': 'deadbeef'},
+            stream=True
+        )
+        get_mock.return_value.close.assert_called_once_with()
+
+    @patch.object(
+        GraphHttpClient, 'get', side_effect=requests.ConnectionError()
+    )
+    def test_poll_graph_connection_error(self, get_mock):
+        self.assertIsNone(self.graph_fetcher.poll_graph())
+
+    def make_response(self, body, headers: dict):
+        if isinstance(body, str):
+            body = body.encode()
+        response_mock = MagicMock()
+        response_mock.iter_content.return_value = iter([
+            body[:10], body[10:]
+        ])
+        response_mock.headers = headers
+        return response_mock
+
+    def test_parse_graph_from_response(self):
+        response_mock = self.make_response(GRAPH_JSON, {'ETag': 'deadbeef'})
+        result = self.graph_fetcher.parse_graph_from_response(response_mock)
+        self.assertEqual(result['etag'], 'deadbeef')
+        self.assertEqual(
+            result['content_hash'],
+            hashlib.sha256(GRAPH_JSON.encode()).hexdigest()
+        )
+        self.assertEqual(list(result['graph'].node_ids), [1, 2])
+        self.assertEqual(result['graph'].node_names, ['node1', 'node2'])
+        self.assertEqual(list(result['graph'].edges('lik')), [(0, 1)])
+
+    def test_parse_graph_from_streamed_response(self):
+        self.graph_fetcher.stream = True
+        response_mock = self.make_response(GRAPH_JSON, {'ETag': 'deadbeef'})
+        result = self.graph_fetcher.parse_graph_from_response(response_mock)
+        self.assertEqual(result['etag'], 'deadbeef')
+        self.assertEqual(
+            result['content_hash'],
+            hashlib.sha256(GRAPH_JSON.encode()).hexdigest()
+        )
+        self.assertEqual(list(result['graph'].node_ids), [1, 2])
+        self.assertEqual(list(result['graph'].edges('lik')), [(0, 1)])
+
+    def test_parse_graph_from_response_with_no_etag(self):
+        response_mock = self.make_response(
+            GRAPH_JSON, {'Last-Modified': 'Wed, 21 Oct 2015 07:28:00 GMT'}
+        )
+        result = self.graph_fetcher.parse_graph_from_response(response_mock)
+        self.assertEqual(result['etag'], result['content_hash'])
+        self.assertEqual(
+            result['last_modified'], 'Wed, 21 Oct 2015 07:28:00 GMT'
+        )
+
+    def test_parse_graph_from_response_with_wrong_json(self):
+        response_mock = self.make_response(
+            '{"lonks": 3}', {'ETag': 'deadbeef'}
+        )
+        self.assertIsNone(
+            self.graph_fetcher.parse_graph_from_response(response_mock)
+        )
+
+    def test_parse_graph_from_response_with_invalid_utf8(self):
+        body = GRAPH_JSON.encode().replace(b'node1', b'\xff\xfe')
+        for stream in (False, True):
+            with self.subTest(stream=stream):
+                self.graph_fetcher.stream = stream
+                response_mock = self.make_response(body, {'ETag': 'a'})
+                self.assertIsNone(
+                    self.graph_fetcher.parse_graph_from_response(
+                        response_mock
+                    )
+                )
+
+    def test_parse_graph_from_response_with_too_many_relations(self):
+        graph = {
+            'links': [
+                {'source': 1, 'target': 2, 'value': 'r{}'.format(i)}
+                for i in range(300)
+            ],
+            'nodes': [{'index': 1, 'name': 'a'}, {'index': 2, 'name': 'b'}],
+        }
+        for stream in (False, True):
+            with self.subTest(stream=stream):
+                self.graph_fetcher.stream = stream
+                response_mock = self.make_response(
+                    json.dumps(graph), {'ETag': 'a'}
+                )
+                self.assertIsNone(
+                    self.graph_fetcher.parse_graph_from_response(
+                        response_mock
+                    )
+                )
+
+    @patch.object(graph_fetcher, 'load_data_with_schema_from_string')
+    def test_parse_graph_from_response_with_same_content(self, load_mock):
+        self.graph_fetcher.graph_data['etag'] = 'deadbeef'
+        self.graph_fetcher.graph_data['content_hash'] = (
+            hashlib.sha256(GRAPH_JSON.encode()).hexdigest()
+        )
+        response_mock = self.make_response(GRAPH_JSON, {'ETag': 'cafe'})
+        self.assertIsNone(
+            self.graph_fetcher.parse_graph_from_response(response_mock)
+        )
+        load_mock.assert_not_called()
+        self.assertEqual(self.graph_fetcher.graph_data['etag'], 'cafe')
+
+    def test_parse_graph_from_response_with_same_edges(self):
+        self.graph_fetcher.fingerprint_edges = True
+        response_mock = self.make_response(GRAPH_JSON, {'ETag': 'a'})
+        result = self.graph_fetcher.parse_graph_from_response(response_mock)
+        self.graph_fetcher.graph_data['edge_fingerprint'] = (
+            result['edge_fingerprint']
+        )
+        reordered = json.dumps({
+            'nodes': [
+                {'index': 2, 'name': 'node2'},
+                {'index': 1, 'name': 'renamed'},
+            ],
+            'links': [{'source': 1, 'target': 2, 'value': 'lik'}],
+        })
+        response_mock = self.make_response(reordered, {'ETag': 'b'})
+        self.assertIsNone(
+            self.graph_fetcher.parse_graph_from_response(response_mock)
+        )
+
+    def test_same_edges_are_skipped_by_hash_next_time(self):
+        graph_data = self.graph_fetcher.graph_data
+        self.graph_fetcher.fingerprint_edges = True
+        response_mock = self.make_response(GRAPH_JSON, {'ETag': 'a'})
+        result = self.graph_fetcher.parse_graph_from_response(response_mock)
+        for key in ('etag', 'content_hash', 'edge_fingerprint'):
+            graph_data[key] = result[key]
+        reformatted = json.dumps(json.loads(GRAPH_JSON))
+        response_mock = self.make_response(reformatted, {'ETag': 'b'})
+        self.assertIsNone(
+            self.graph_fetcher.parse_graph_from_response(response_mock)
+        )
+        self.assertEqual(graph_data['etag'], 'b')
+        self.assertEqual(
+            graph_data['content_hash'],
+            hashlib.sha256(reformatted.encode()).hexdigest()
+        )
+        self.assertEqual(graph_data.saves, 1)
+        response_mock = self.make_response(reformatted, {'ETag': 'b'})
+        with patch.object(
+            graph_fetcher, 'load_data_with_schema_from_string'
+        ) as load_mock:
+            self.assertIsNone(
+                self.graph_fetcher.parse_graph_from_response(response_mock)
+            )
+        load_mock.assert_not_called()
+        self.assertEqual(graph_data.saves, 1)
+
+    def test_poll_graph_sends_validators(self):
+        graph_data = self.graph_fetcher.graph_data
+        graph_data['etag'] = 'deadbeef'
+        graph_data['last_modified'] = 'Wed, 21 Oct 2015 07:28:00 GMT'
+        with patch.object(GraphHttpClient, 'get') as get_mock:
+            self.graph_fetcher.poll_graph()
+        get_mock.assert_called_once_with('http://my.graph.xd/', headers={
+            'If-None-Match': 'deadbeef',
+            'If-Modified-Since': 'Wed, 21 Oct 2015 07:28:00 GMT',
+        }, stream=True)
+
+    def test_poll_graph_does_not_send_content_hash(self):
+        graph_data = self.graph_fetcher.graph_data
+        graph_data['etag'] = graph_data['content_hash'] = 'beef'
+        with patch.object(GraphHttpClient, 'get') as get_mock:
+            self.graph_fetcher.poll_graph()
+        get_mock.assert_called_once_with(
+            'http://my.graph.xd/', headers={}, stream=True
+        )
+
+    def test_poll_graph_records_outcome(self):
+        scheduler = self.graph_fetcher.scheduler = MagicMock()
+        response_mock = self.make_response(GRAPH_JSON, {'ETag': 'a'})
+        response_mock.status_code = 200
+        with patch.object(
+            GraphHttpClient, 'get', return_value=response_mock
+        ):
+            self.graph_fetcher.poll_graph()
+        response_mock.status_code = 304
+        with patch.object(
+            GraphHttpClient, 'get', return_value=response_mock
+        ):
+            self.graph_fetcher.poll_graph()
+        with patch.object(
+            GraphHttpClient, 'get', side_effect=requests.Timeout()
+        ):
+            self.graph_fetcher.poll_graph()
+        self.assertEqual(scheduler.record.call_args_list, [
+            call(CHANGED), call(UNCHANGED), call(FAILED),
+        ])
+
+    def test_poll_graph_counts_responses(self):
+        self.graph_fetcher.graph_url = 'http://counted.graph.xd/'
+        responses = graph_fetcher.RESPONSES.labels(
+            'http://counted.graph.xd/', 304
+        )
+        polls = graph_fetcher.POLLS.labels(
+            'http://counted.graph.xd/', UNCHANGED
+        )
+        response_mock = self.make_response('', {})
+        response_mock.status_code = 304
+        with patch.object(
+            GraphHttpClient, 'get', return_value=response_mock
+        ):
+            self.graph_fetcher.poll_graph()
+        self.assertEqual(responses.value, 1)
+        self.assertEqual(polls.value, 1)
+
+    def test_circuit_breaker_is_exported(self):
+        fetcher = GraphFetcher(
+            graph_data=DummyGraphData(),
+            graph_url='http://broken.graph.xd/', refresh_time=15
+        )
+        circuit_open = graph_fetcher.CIRCUIT_OPEN.labels(
+            'http://broken.graph.xd/'
+        )
+        failures = graph_fetcher.CONSECUTIVE_FAILURES.labels(
+            'http://broken.graph.xd/'
+        )
+        for _ in range(5):
+            fetcher.scheduler.record(FAILED)
+        self.assertEqual(circuit_open.samples(), [('', [], 1)])
+        self.assertEqual(failures.samples(), [('', [], 5)])
+        fetcher.scheduler.next_delay()
+        fetcher.scheduler.record(UNCHANGED)
+        self.assertEqual(circuit_open.samples(), [('', [], 0)])
+        self.assertEqual(failures.samples(), [('', [], 0)])
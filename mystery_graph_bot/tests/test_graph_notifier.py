@@ -0,0 +1,235 @@
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import patch, MagicMock, call
+import logging
+import os
+import threading
+
+from telegram.error import TimedOut, Unauthorized
+
+from ..graph_notifier import GraphNotifier
+from ..subscriber_store import SubscriberStore
+
+
+class GraphNotifierTestCase(TestCase):
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.bot = MagicMock()
+        self.notifier = GraphNotifier(
+            self.bot, [1234, 5678], 'http://my.graph.xd/visualization/'
+        )
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+        self.notifier.sender.shutdown()
+
+    def test_get_human_delta(self):
+        self.assertEqual(
+            self.notifier.get_human_delta(5, 5),
+            "5 more liks and 5 more noms"
+        )
+        self.assertEqual(self.notifier.get_human_delta(0, -5), "5 less liks")
+        self.assertEqual(self.notifier.get_human_delta(1, 0), "1 more nom")
+        self.assertEqual(
+            self.notifier.get_human_delta(0, 0), "no changes (?)"
+        )
+
+    def test_get_human_diff(self):
+        diff = {
+            'added': {'lik': 50, 'nom': 1},
+            'removed': {'lik': 45},
+            'affected_nodes': ['<b>', 'two'],
+        }
+        self.assertEqual(
+            self.notifier.get_human_diff(diff),
+            'In detail: 50 liks and 1 nom added, 45 liks removed.\n'
+            'Who changed: &lt;b&gt;, two.'
+        )
+
+    def test_get_human_diff_with_many_nodes(self):
+        diff = {
+            'added': {},
+            'removed': {'nom': 1},
+            'affected_nodes': [str(i) for i in range(15)],
+        }
+        self.assertEqual(
+            self.notifier.get_human_diff(diff),
+            'In detail: 1 nom removed.\n'
+            'Who changed: 0, 1, 2, 3, 4, 5, 6, 7, 8, 9 and 5 more.'
+        )
+
+    @patch.object(GraphNotifier, 'send_changes_to_chat')
+    def test_on_next(self, send_changes_to_chat_mock):
+        diff = {
+            'added': {'lik': 2}, 'removed': {}, 'affected_nodes': ['a'],
+        }
+        self.notifier.on_next({
+            'new': {'etag': 'b', 'liks': 8, 'noms': 6},
+            'old': {'etag': 'a', 'liks': 6, 'noms': 6},
+            'diff': diff,
+        })
+        self.assertCountEqual(send_changes_to_chat_mock.call_args_list, [
+            call(1234, 0, 2, diff), call(5678, 0, 2, diff),
+        ])
+
+    @patch.object(GraphNotifier, 'send_changes_to_chat')
+    def test_on_next_without_old_data(self, send_changes_to_chat_mock):
+        self.notifier.on_next({'new': {'etag': 'b', 'liks': 8, 'noms': 6}})
+        send_changes_to_chat_mock.assert_not_called()
+
+    def test_send_changes_to_chat(self):
+        self.notifier.send_changes_to_chat(1234, 5, 0)
+        expected_text = (
+            '<b>mystery</b>\n'
+            '&#160;&#160;&#160;&#160;&#160;&#160;&#160;&#160;'
+            '<b>asbolutely no way</b>\n'
+            'The Mystery Graph has just been updated! '
+            'Overall, now it has 5 more noms.\n'
+            'Check it out <a href="http://my.graph.xd/visualization/">'
+            'here</a>!'
+        )
+        self.bot.sendMessage.assert_called_once_with(
+            chat_id=1234, text=expected_text, parse_mode='HTML',
+        )
+
+    def test_send_changes_to_chat_with_short_template(self):
+        notifier = GraphNotifier(
+            self.bot, [1234, 5678], 'http://my.graph.xd/visualization/',
+            sender=self.notifier.sender, chat_templates={'5678': 'short'}
+        )
+        notifier.send_changes_to_chat(5678, 0, -1)
+        self.bot.sendMessage.assert_called_once_with(
+            chat_id=5678,
+            text=(
+                'The Mystery Graph has 1 less lik. '
+                '<a href="http://my.graph.xd/visualization/">Check it out</a>!'
+            ),
+            parse_mode='HTML',
+        )
+
+    def test_unknown_template(self):
+        with self.assertRaises(ValueError):
+            GraphNotifier(
+                self.bot, [1234], 'http://my.graph.xd/visualization/',
+                sender=self.notifier.sender, chat_templates={1234: 'long'}
+            )
+
+    @patch.object(GraphNotifier, 'render', return_value='text')
+    def test_payload_is_rendered_once_per_update(self, render_mock):
+        diff = {
+            'added': {'lik': 2}, 'removed': {}, 'affected_nodes': ['a'],
+        }
+        for chat_id in (1234, 5678):
+            self.notifier.send_changes_to_chat(chat_id, 0, 2, dict(diff))
+        render_mock.assert_called_once_with('full', 0, 2, diff)
+        self.assertEqual(self.bot.sendMessage.call_args_list, [
+            call(chat_id=1234, text='text', parse_mode='HTML'),
+            call(chat_id=5678, text='text', parse_mode='HTML'),
+        ])
+        self.notifier.send_changes_to_chat(1234, 0, 3, diff)
+        self.assertEqual(render_mock.call_count, 2)
+
+    def test_subscribers_get_the_changes_they_want(self):
+        with TemporaryDirectory() as directory:
+            store = SubscriberStore(os.path.join(directory, 'subscribers'))
+            self.notifier.subscriber_store = store
+            store.subscribe(1)
+            store.set_preferences(2, min_delta=5)
+            store.set_preferences(3, muted=['lik'])
+            self.assertCountEqual(self.notifier.get_chats(0, 2), [1])
+            self.assertCountEqual(self.notifier.get_chats(1, 6), [1, 2, 3])
+            diff = {
+                'added': {'tag': 9}, 'removed': {}, 'affected_nodes': [],
+            }
+            self.assertCountEqual(
+                self.notifier.get_chats(0, 0, diff), [1, 2, 3]
+            )
+            store.close()
+
+    def test_gone_chats_are_unsubscribed(self):
+        with TemporaryDirectory() as directory:
+            store = SubscriberStore(
+                os.path.join(directory, 'subscribers'), seed_chats=[1, 2, 3]
+            )
+            self.notifier.subscriber_store = store
+
+            def send_message(chat_id, **kwargs):
+                if chat_id == 2:
+                    raise Unauthorized()
+                if chat_id == 3:
+                    raise TimedOut()
+            self.bot.sendMessage.side_effect = send_message
+            self.notifier.on_next({
+                'new': {'etag': 'b', 'liks': 8, 'noms': 6},
+                'old': {'etag': 'a', 'liks': 6, 'noms': 6},
+            })
+            self.assertCountEqual(list(store), [1, 3])
+            store.close()
+
+    def test_nobody_is_unsubscribed_when_everything_fails(self):
+        with TemporaryDirectory() as directory:
+            store = SubscriberStore(
+                os.path.join(directory, 'subscribers'), seed_chats=[1, 2]
+            )
+            self.notifier.subscriber_store = store
+            self.notifier.prune({1: Unauthorized(), 2: Unauthorized()}, 0)
+            self.assertCountEqual(list(store), [1, 2])
+            store.close()
+
+    def test_snapshot_is_uploaded_once(self):
+        self.notifier.renderer = MagicMock()
+        self.notifier.renderer.get_svg.return_value = b'<svg/>'
+        self.bot.sendDocument.return_value.document.file_id = 'file'
+        self.notifier.on_next({
+            'new': {'etag': 'b', 'liks': 8, 'noms': 6},
+            'old': {'etag': 'a', 'liks': 6, 'noms': 6},
+        })
+        self.notifier.renderer.get_svg.assert_called_once_with('b')
+        documents = [
+            kwargs['document']
+            for _, kwargs in self.bot.sendDocument.call_args_list
+        ]
+        self.assertEqual(len(documents), 2)
+        self.assertEqual(documents[0].read(), b'<svg/>')
+        self.assertEqual(documents[1], 'file')
+        self.assertEqual(self.bot.sendMessage.call_count, 2)
+
+    def test_snapshot_upload_does_not_hold_up_the_next_graph(self):
+        self.notifier.renderer = MagicMock()
+        self.notifier.renderer.get_svg.return_value = b'<svg/>'
+        uploading = threading.Event()
+        uploaded = threading.Event()
+
+        def send_document(**kwargs):
+            if not isinstance(kwargs['document'], str):
+                uploading.set()
+                uploaded.wait(5)
+            message = MagicMock()
+            message.document.file_id = 'file'
+            return message
+        self.bot.sendDocument.side_effect = send_document
+        data = {
+            'new': {'etag': 'b', 'liks': 8, 'noms': 6},
+            'old': {'etag': 'a', 'liks': 6, 'noms': 6},
+        }
+        self.notifier.get_changes(data)
+        threads = [
+            threading.Thread(target=self.notifier.send_snapshot, args=(chat,))
+            for chat in (1, 2)
+        ]
+        threads[0].start()
+        self.assertTrue(uploading.wait(5))
+        threads[1].start()
+        # The next graph comes in while the first chat is still uploading.
+        self.assertTrue(self.notifier.snapshot_lock.acquire(timeout=1))
+        self.notifier.snapshot_lock.release()
+        uploaded.set()
+        for thread in threads:
+            thread.join(5)
+        documents = [
+            kwargs['document']
+            for _, kwargs in self.bot.sendDocument.call_args_list
+        ]
+        self.assertEqual(len(documents), 2)
+        self.assertEqual(documents[1], 'file')
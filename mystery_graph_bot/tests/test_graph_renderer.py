@@ -0,0 +1,156 @@
+from unittest import TestCase
+from unittest.mock import patch
+import logging
+import xml.etree.ElementTree as ElementTree
+
+from ..graph_diff import GraphDiffer
+from ..graph_renderer import GraphLayout, GraphRenderer
+from ..graph_snapshot import GraphSnapshot
+
+
+def make_snapshot(links, node_count):
+    return GraphSnapshot.from_graph({
+        'links': [
+            {'source': source, 'target': target, 'value': value}
+            for source, target, value in links
+        ],
+        'nodes': [
+            {'index': index, 'name': 'node{}'.format(index)}
+            for index in range(node_count)
+        ],
+    })
+
+
+def get_neighbours(layout, node_id):
+    node_ids = {slot: node_id for node_id, slot in layout.slots.items()}
+    return sorted(
+        node_ids[slot] for slot in layout.neighbours[layout.slots[node_id]]
+    )
+
+
+RING = [(index, (index + 1) % 20, 'lik') for index in range(20)]
+
+
+class GraphLayoutTestCase(TestCase):
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def test_first_layout(self):
+        layout = GraphLayout()
+        xs, ys = layout.update(make_snapshot(RING, 20))
+        self.assertEqual(len(xs), 20)
+        self.assertEqual(len(layout.positions), 20)
+        self.assertEqual(layout.unsettled, set())
+        # Linked nodes end up closer than the ring is wide.
+        distance = ((xs[0] - xs[1]) ** 2 + (ys[0] - ys[1]) ** 2) ** 0.5
+        width = max(max(xs) - min(xs), max(ys) - min(ys))
+        self.assertLess(distance, width / 2)
+
+    def test_only_changed_nodes_move(self):
+        layout = GraphLayout()
+        layout.update(make_snapshot(RING, 20))
+        before = dict(layout.positions)
+        links = RING + [(0, 20, 'nom')]
+        layout.update(make_snapshot(links, 21), changed_ids=[0, 20])
+        moved = {
+            node_id for node_id, position in before.items()
+            if layout.positions[node_id] != position
+        }
+        self.assertLessEqual(moved, {0})
+        self.assertIn(20, layout.positions)
+
+    def test_first_layout_is_spread_over_updates(self):
+        layout = GraphLayout(max_nodes=8)
+        snapshot = make_snapshot(RING, 20)
+        layout.update(snapshot)
+        self.assertEqual(len(layout.positions), 20)
+        self.assertEqual(len(layout.unsettled), 12)
+        layout.update(snapshot)
+        layout.update(snapshot)
+        self.assertEqual(layout.unsettled, set())
+
+    def test_neighbours_follow_the_diff(self):
+        differ = GraphDiffer()
+        layout = GraphLayout()
+        snapshot = make_snapshot(RING, 20)
+        layout.update(snapshot, diff=differ(snapshot))
+        links = RING[2:] + [(0, 20, 'nom'), (20, 21, 'lik')]
+        snapshot = make_snapshot(links, 22)
+        diff = differ(snapshot)
+        with patch.object(
+            layout, 'build_neighbours', wraps=layout.build_neighbours
+        ) as build_neighbours_mock:
+            layout.update(snapshot, diff.affected_nodes, diff)
+        build_neighbours_mock.assert_not_called()
+        self.assertEqual(get_neighbours(layout, 1), [])
+        self.assertEqual(get_neighbours(layout, 0), [19, 20])
+        self.assertEqual(get_neighbours(layout, 20), [0, 21])
+        self.assertEqual(get_neighbours(layout, 21), [20])
+
+    def test_unknown_diff_builds_neighbours_again(self):
+        layout = GraphLayout()
+        layout.update(make_snapshot(RING, 20))
+        differ = GraphDiffer()
+        differ(make_snapshot(RING[:5], 20))
+        snapshot = make_snapshot(RING[:6], 20)
+        layout.update(snapshot, diff=differ(snapshot))
+        self.assertEqual(layout.edge_count, 6)
+        self.assertEqual(get_neighbours(layout, 0), [1])
+        self.assertEqual(get_neighbours(layout, 19), [])
+
+    def test_removed_nodes_are_forgotten(self):
+        layout = GraphLayout()
+        layout.update(make_snapshot(RING, 20))
+        layout.update(make_snapshot(RING[:5], 6))
+        self.assertEqual(set(layout.positions), set(range(6)))
+
+
+class GraphRendererTestCase(TestCase):
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.differ = GraphDiffer()
+        self.renderer = GraphRenderer()
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def update(self, etag, snapshot):
+        self.renderer.update(etag, snapshot, self.differ(snapshot))
+
+    def test_svg(self):
+        self.update('a', make_snapshot(RING + [(1, 3, 'nom')], 20))
+        svg = self.renderer.get_svg('a')
+        root = ElementTree.fromstring(svg)
+        paths = root.findall('{http://www.w3.org/2000/svg}path')
+        # Liks, noms and nodes.
+        self.assertEqual(len(paths), 3)
+        self.assertEqual(paths[0].get('d').count('M'), 20)
+        self.assertEqual(paths[1].get('d').count('M'), 1)
+        self.assertEqual(paths[2].get('d').count('M'), 20)
+
+    def test_changed_nodes_are_highlighted(self):
+        self.update('a', make_snapshot(RING, 20))
+        self.update('b', make_snapshot(RING + [(4, 9, 'nom')], 20))
+        root = ElementTree.fromstring(self.renderer.get_svg('b'))
+        paths = root.findall('{http://www.w3.org/2000/svg}path')
+        self.assertEqual(paths[-1].get('d').count('M'), 2)
+
+    def test_svg_is_cached_per_etag(self):
+        self.update('a', make_snapshot(RING, 20))
+        svg = self.renderer.get_svg('a')
+        self.update('b', make_snapshot(RING[:10], 20))
+        self.assertIs(self.renderer.get_svg('a'), svg)
+        self.assertIsNot(self.renderer.get_svg('b'), svg)
+        self.assertIsNone(self.renderer.get_svg('c'))
+
+    def test_max_edges(self):
+        self.renderer.max_edges = 5
+        self.update('a', make_snapshot(RING, 20))
+        root = ElementTree.fromstring(self.renderer.get_svg('a'))
+        paths = root.findall('{http://www.w3.org/2000/svg}path')
+        self.assertEqual(paths[0].get('d').count('M'), 5)
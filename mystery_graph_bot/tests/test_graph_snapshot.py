@@ -0,0 +1,64 @@
+from unittest import TestCase
+
+from ..graph_snapshot import GraphSnapshot, GraphSnapshotBuilder
+
+
+RAW_GRAPH = {
+    'links': [
+        {'source': 10, 'target': 20, 'value': 'lik'},
+        {'source': 30, 'target': 20, 'value': 'lik'},
+        {'source': 20, 'target': 30, 'value': 'nom'},
+        {'source': 30, 'target': 10, 'value': 'nom'},
+        {'source': 30, 'target': 40, 'value': 'hug'},
+    ],
+    'nodes': [
+        {'index': 10, 'name': 'node10'},
+        {'index': 20, 'name': 'node20'},
+        {'index': 30, 'name': 'node30'},
+        {'index': 50, 'name': 'node50'},
+    ],
+}
+
+
+class GraphSnapshotTestCase(TestCase):
+
+    def setUp(self):
+        self.snapshot = GraphSnapshot.from_graph(RAW_GRAPH)
+
+    def test_node_table(self):
+        self.assertEqual(list(self.snapshot.node_ids), [10, 20, 30, 40, 50])
+        self.assertEqual(
+            self.snapshot.node_names,
+            ['node10', 'node20', 'node30', '', 'node50']
+        )
+        self.assertEqual(self.snapshot.node_count, 5)
+
+    def test_columns_are_compact(self):
+        self.assertEqual(self.snapshot.sources.typecode, 'i')
+        self.assertEqual(self.snapshot.targets.typecode, 'i')
+        self.assertEqual(self.snapshot.relations.typecode, 'B')
+        self.assertEqual(self.snapshot.edge_count, 5)
+
+    def test_count(self):
+        self.assertEqual(self.snapshot.count('lik'), 2)
+        self.assertEqual(self.snapshot.count('nom'), 2)
+        self.assertEqual(self.snapshot.count('hug'), 1)
+        self.assertEqual(self.snapshot.count('xd'), 0)
+
+    def test_edges(self):
+        self.assertEqual(list(self.snapshot.edges('lik')), [(0, 1), (2, 1)])
+        self.assertEqual(list(self.snapshot.edges('nom')), [(1, 2), (2, 0)])
+        self.assertEqual(list(self.snapshot.edges('xd')), [])
+
+    def test_degrees(self):
+        self.assertEqual(list(self.snapshot.indegree('lik')), [0, 2, 0, 0, 0])
+        self.assertEqual(list(self.snapshot.degree('nom')), [1, 1, 2, 0, 0])
+        self.assertEqual(self.snapshot.max_indegree('lik'), 2)
+        self.assertEqual(self.snapshot.max_degree('nom'), 2)
+        self.assertEqual(self.snapshot.max_indegree('xd'), 0)
+
+    def test_too_many_relations(self):
+        builder = GraphSnapshotBuilder()
+        with self.assertRaises(ValueError):
+            for value in range(300):
+                builder.add_link(0, 1, str(value))
@@ -0,0 +1,90 @@
+from unittest import TestCase
+import json
+
+from ..errors import SchemaLoadError
+from ..graph_snapshot import GraphSnapshotBuilder
+from ..graph_stream import LinkCounter, MultiSink, StreamingGraphParser
+
+
+GRAPH_JSON = json.dumps({
+    'links': [
+        {'source': 1, 'target': 2, 'value': 'lik'},
+        {'source': 2, 'target': 3, 'value': 'nom'},
+        {'source': 3, 'target': 1, 'value': 'nom'},
+    ],
+    'nodes': [
+        {'index': 1, 'name': 'node1'},
+        {'index': 2, 'name': 'node2'},
+        {'index': 3, 'name': 'node3'},
+    ],
+    'directed': True,
+})
+
+
+def chunked(text, size):
+    data = text.encode('utf-8')
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+class StreamingGraphParserTestCase(TestCase):
+
+    def test_parse_in_chunks_of_any_size(self):
+        for size in (1, 2, 3, 7, 64, len(GRAPH_JSON)):
+            counter = LinkCounter()
+            StreamingGraphParser(counter).parse(chunked(GRAPH_JSON, size))
+            self.assertEqual(counter.counts, {'lik': 1, 'nom': 2})
+
+    def test_numbers_split_across_chunks(self):
+        text = '{"nodes": [], "links": [], "count": 12345}'
+        chunks = [text[:-3].encode(), text[-3:-1].encode(), b'}']
+        counter = StreamingGraphParser(LinkCounter()).parse(chunks)
+        self.assertEqual(counter.counts, {})
+
+    def test_multibyte_characters_split_across_chunks(self):
+        text = '{"links": [], "nodes": [{"index": 0, "name": "ñandú"}]}'
+        names = []
+
+        class NameSink(LinkCounter):
+            def add_node(self, index, name):
+                names.append(name)
+
+        StreamingGraphParser(NameSink()).parse(chunked(text, 1))
+        self.assertEqual(names, ['ñandú'])
+
+    def test_fan_out_to_several_sinks(self):
+        counter = LinkCounter()
+        builder = GraphSnapshotBuilder()
+        StreamingGraphParser(MultiSink(counter, builder)).parse(
+            chunked(GRAPH_JSON, 5)
+        )
+        self.assertEqual(counter['lik'], 1)
+        self.assertEqual(counter['nom'], 2)
+        self.assertEqual(list(builder.node_ids), [1, 2, 3])
+
+    def test_coercible_items_follow_schema_rules(self):
+        text = (
+            '{"links": [{"source": "1", "target": 2, "value": "lik", '
+            '"weight": 3}], "nodes": []}'
+        )
+        builder = StreamingGraphParser(GraphSnapshotBuilder()).parse(
+            chunked(text, 4)
+        )
+        self.assertEqual(list(builder.build().edges('lik')), [(0, 1)])
+
+    def test_invalid_json(self):
+        for text in ('{', '{"links": [}', '{"links": []} xd', '[]'):
+            with self.assertRaises(json.JSONDecodeError):
+                StreamingGraphParser(LinkCounter()).parse(chunked(text, 2))
+
+    def test_wrong_format(self):
+        text = (
+            '{"links": [{"source": 1, "target": 2, "value": "lik"}, '
+            '{"source": "x", "target": 2, "value": "lik"}]}'
+        )
+        with self.assertRaises(SchemaLoadError) as context:
+            StreamingGraphParser(LinkCounter()).parse(chunked(text, 3))
+        errors = context.exception.errors
+        self.assertIn('source', errors['links'][1])
+        self.assertEqual(
+            errors['nodes'], ['Missing data for required field.']
+        )
@@ -0,0 +1,135 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+from unittest import TestCase
+from unittest.mock import patch
+import gzip
+import logging
+
+from ..errors import BodyTooLargeError
+from ..http_client import GraphHttpClient
+
+
+BODY = b'{"links": [], "nodes": []}' * 100
+
+
+class GraphHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        body = BODY
+        compressed = 'gzip' in self.headers.get('Accept-Encoding', '')
+        if compressed:
+            body = gzip.compress(body)
+        self.send_response(200)
+        if self.path != '/chunked':
+            self.send_header('Content-Length', str(len(body)))
+        else:
+            self.send_header('Transfer-Encoding', 'chunked')
+            body = b'%x\r\n%s\r\n0\r\n\r\n' % (len(body), body)
+        if compressed:
+            self.send_header('Content-Encoding', 'gzip')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestGraphHttpClient(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), GraphHandler)
+        cls.url = 'http://127.0.0.1:{}/'.format(cls.server.server_port)
+        Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.client = GraphHttpClient()
+
+    def tearDown(self):
+        self.client.close()
+
+    def test_get_reuses_connection(self):
+        for _ in range(3):
+            response = self.client.get(self.url)
+            self.assertEqual(response.content, BODY)
+            response.close()
+        self.assertEqual(self.client.stats['requests'], 3)
+        self.assertEqual(self.client.stats['new_connections'], 1)
+        self.assertEqual(self.client.stats['reused_connections'], 2)
+
+    def test_connection_opened_by_another_thread_meanwhile(self):
+        self.client.get(self.url).close()
+        session_get = self.client.session.get
+        responses = []
+
+        def get(*args, **kwargs):
+            response = session_get(*args, **kwargs)
+            if responses:
+                return response
+            # The connection was reused, and another thread opens one
+            # before it is counted.
+            responses.append(None)
+            thread = Thread(target=lambda: responses.append(
+                self.client.get(self.url, stream=True)
+            ))
+            thread.start()
+            thread.join(5)
+            return response
+        with patch.object(self.client.session, 'get', side_effect=get):
+            self.client.get(self.url).close()
+        responses[1].close()
+        self.assertEqual(self.client.stats['requests'], 3)
+        self.assertEqual(self.client.stats['new_connections'], 2)
+        self.assertEqual(self.client.stats['reused_connections'], 1)
+
+    def test_get_counts_compressed_bytes(self):
+        self.client.get(self.url).close()
+        self.assertEqual(self.client.stats['bytes_decoded'], len(BODY))
+        self.assertEqual(
+            self.client.stats['bytes_on_wire'], len(gzip.compress(BODY))
+        )
+
+    def test_get_streamed(self):
+        response = self.client.get(self.url, stream=True)
+        try:
+            content = b''.join(self.client.iter_content(response, 100))
+        finally:
+            response.close()
+        self.assertEqual(content, BODY)
+        self.assertEqual(self.client.stats['bytes_decoded'], len(BODY))
+
+    def test_get_too_large_by_content_length(self):
+        self.client.max_body_size = 10
+        with self.assertRaises(BodyTooLargeError):
+            self.client.get(self.url)
+        self.assertEqual(self.client.stats['bytes_decoded'], 0)
+
+    def test_get_too_large_while_decoding(self):
+        self.client.max_body_size = len(BODY) - 1
+        with self.assertRaises(BodyTooLargeError):
+            self.client.get(self.url + 'chunked')
+
+    def test_stats_from_many_threads(self):
+        self.client.close()
+        self.client = GraphHttpClient(pool_maxsize=8)
+
+        def get_many():
+            for _ in range(10):
+                self.client.get(self.url).close()
+        threads = [Thread(target=get_many) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+        stats = self.client.stats
+        self.assertEqual(stats['requests'], 80)
+        self.assertEqual(
+            stats['new_connections'] + stats['reused_connections'], 80
+        )
+        self.assertEqual(stats['bytes_decoded'], 80 * len(BODY))
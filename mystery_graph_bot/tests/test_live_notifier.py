@@ -0,0 +1,156 @@
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import MagicMock
+import logging
+import os
+
+from telegram.error import BadRequest, Unauthorized
+
+from ..live_notifier import LiveGraphNotifier, LiveMessageStore
+from ..subscriber_store import SubscriberStore
+from ..telegram_sender import TelegramSender
+
+
+def make_data_pair(old_liks, new_liks):
+    return {
+        'new': {'etag': str(new_liks), 'liks': new_liks, 'noms': 2},
+        'old': {'etag': str(old_liks), 'liks': old_liks, 'noms': 2},
+    }
+
+
+class FakeTimer:
+
+    def __init__(self, timers, delay, function):
+        self.timers = timers
+        self.delay = delay
+        self.function = function
+
+    def start(self):
+        self.timers.append(self)
+
+    def cancel(self):
+        pass
+
+
+class LiveMessageStoreTestCase(TestCase):
+
+    def test_message_ids_are_saved(self):
+        with TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'graph.live')
+            store = LiveMessageStore(path)
+            store.set(1, 10)
+            store.set('@x', 11)
+            store.set('-5', 12)
+            store.delete('@x')
+            store.close()
+            store = LiveMessageStore(path)
+            self.assertEqual(store.get('1'), 10)
+            self.assertIsNone(store.get('@x'))
+            self.assertEqual(store.get(-5), 12)
+            store.close()
+
+
+class LiveGraphNotifierTestCase(TestCase):
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.directory = TemporaryDirectory()
+        self.bot = MagicMock()
+        self.bot.sendMessage.side_effect = [
+            MagicMock(message_id=100 + index) for index in range(10)
+        ]
+        self.now = 0.0
+        self.timers = []
+        self.message_store = LiveMessageStore(
+            os.path.join(self.directory.name, 'graph.live')
+        )
+        self.notifier = LiveGraphNotifier(
+            self.bot, [1, 2], 'http://my.graph.xd/', self.message_store,
+            sender=TelegramSender(self.bot, global_rate=1e9, chat_rate=1e9),
+            interval=60, clock=lambda: self.now,
+            timer_factory=lambda delay, function: FakeTimer(
+                self.timers, delay, function
+            )
+        )
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+        self.notifier.close()
+        self.notifier.sender.shutdown()
+        self.directory.cleanup()
+
+    def get_edits(self):
+        return [
+            (kwargs['chat_id'], kwargs['message_id'], kwargs['text'])
+            for _, kwargs in self.bot.editMessageText.call_args_list
+        ]
+
+    def test_first_change_sends_live_messages(self):
+        self.notifier.on_next(make_data_pair(1, 3))
+        self.assertEqual(self.bot.sendMessage.call_count, 2)
+        self.assertCountEqual(
+            [self.message_store.get(1), self.message_store.get(2)],
+            [100, 101]
+        )
+        text = self.bot.sendMessage.call_args[1]['text']
+        self.assertIn('Liks: 3\nNoms: 2\nLast change: 2 more liks', text)
+
+    def test_changes_are_edited_and_throttled(self):
+        self.message_store.set(1, 7)
+        self.message_store.set(2, 8)
+        self.notifier.on_next(make_data_pair(1, 3))
+        self.assertCountEqual(
+            [(chat_id, message_id) for chat_id, message_id, _
+             in self.get_edits()],
+            [(1, 7), (2, 8)]
+        )
+        self.now = 10
+        self.notifier.on_next(make_data_pair(3, 4))
+        self.now = 20
+        self.notifier.on_next(make_data_pair(4, 6))
+        self.assertEqual(len(self.get_edits()), 2)
+        timer, = self.timers
+        self.assertEqual(timer.delay, 50)
+        self.now = 60
+        timer.function()
+        edits = self.get_edits()[2:]
+        self.assertCountEqual(
+            [chat_id for chat_id, _, _ in edits], [1, 2]
+        )
+        self.assertIn('Liks: 6', edits[0][2])
+        self.bot.sendMessage.assert_not_called()
+
+    def test_lost_message_is_sent_again(self):
+        self.message_store.set(1, 7)
+        self.message_store.set(2, 8)
+        self.bot.editMessageText.side_effect = [
+            BadRequest('Message to edit not found'),
+            BadRequest('Message is not modified'),
+        ]
+        self.notifier.chats = [1]
+        self.notifier.on_next(make_data_pair(1, 3))
+        self.assertEqual(self.message_store.get(1), 100)
+        self.notifier.chats = [2]
+        self.notifier.on_next(make_data_pair(1, 3))
+        self.assertEqual(self.message_store.get(2), 8)
+        self.assertEqual(self.bot.sendMessage.call_count, 1)
+
+    def test_gone_chats_are_forgotten(self):
+        subscriber_store = SubscriberStore(
+            os.path.join(self.directory.name, 'graph.subscribers'),
+            seed_chats=[1, 2]
+        )
+        self.notifier.subscriber_store = subscriber_store
+        self.message_store.set(1, 7)
+        self.message_store.set(2, 8)
+        self.bot.editMessageText.side_effect = (
+            lambda chat_id, **kwargs: self.raise_for(chat_id)
+        )
+        self.notifier.on_next(make_data_pair(1, 3))
+        self.assertEqual(list(subscriber_store), [1])
+        self.assertIsNone(self.message_store.get(2))
+        subscriber_store.close()
+
+    def raise_for(self, chat_id):
+        if chat_id == 2:
+            raise Unauthorized()
@@ -0,0 +1,238 @@
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import patch, MagicMock
+import logging
+import os
+
+from rx.subjects import Subject
+
+from .. import graph_fetcher, main
+from ..clique_tracker import CliqueTracker
+from ..graph_cruncher import GraphCruncher, PooledGraphCruncher
+from ..graph_diff import GraphDiffer
+from ..graph_fetcher import GraphFetcher
+from ..graph_saver import GraphSaver
+from ..graph_snapshot import GraphSnapshotBuilder
+from ..snapshot_file import SnapshotStore
+
+
+class DummyGraphData:
+
+    def __init__(self):
+        self.data = {
+            'etag': None,
+            'liks': None,
+            'noms': None
+        }
+        self.saved = []
+
+    def __getitem__(self, index):
+        return self.data[index]
+
+    def save(self):
+        self.saved.append(self.data)
+
+
+def make_wrapped_graph(etag, edges):
+    builder = GraphSnapshotBuilder()
+    for source, target, value in edges:
+        builder.add_link(source, target, value)
+    return {'etag': etag, 'graph': builder.build()}
+
+
+class MainTestCase(TestCase):
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def get_config(self):
+        return {
+            'token': '666:asdf',
+            'data_file': 'mystery_graph_bot.dat',
+            'graph_url': 'http://my.graph.xd/',
+            'graph_visualization_url': 'http://my.graph.xd/visualization/',
+            'refresh_time': 15,
+            'chat_whitelist': [1234, 5678],
+            'log_file': 'mystery_graph_bot.log',
+            'save_snapshot': False,
+            'save_history': False,
+        }
+
+    def test_make_data_pair(self):
+        graph_data = DummyGraphData()
+        new_data = {'etag': 'b', 'liks': 1, 'noms': 2, 'diff': {}}
+        self.assertEqual(
+            main.make_data_pair(graph_data, new_data),
+            {'new': {'etag': 'b', 'liks': 1, 'noms': 2}, 'diff': {}}
+        )
+        graph_data.data = {'etag': 'a', 'liks': 0, 'noms': 0}
+        self.assertEqual(
+            main.make_data_pair(graph_data, new_data)['old'],
+            graph_data.data
+        )
+
+    def test_make_cruncher(self):
+        config = self.get_config()
+        self.assertIs(type(main.make_cruncher(config)), GraphCruncher)
+        config['crunch_workers'] = 2
+        cruncher = main.make_cruncher(config)
+        self.assertIsInstance(cruncher, PooledGraphCruncher)
+        self.assertEqual(cruncher.deadline, 10.0)
+        cruncher.executor.shutdown()
+
+    def get_multi_graph_config(self):
+        config = self.get_config()
+        for field in (
+            'data_file', 'graph_url', 'graph_visualization_url',
+            'chat_whitelist'
+        ):
+            del config[field]
+        config['graphs'] = [
+            {
+                'data_file': 'a.dat', 'graph_url': 'http://a.graph.xd/',
+                'graph_visualization_url': 'http://a.graph.xd/vis/',
+                'chat_whitelist': [1234],
+            },
+            {
+                'data_file': 'b.dat', 'graph_url': 'http://b.graph.xd/',
+                'graph_visualization_url': 'http://b.graph.xd/vis/',
+                'chat_whitelist': [5678], 'refresh_time': 60,
+            },
+        ]
+        return config
+
+    def test_get_graph_sources(self):
+        config = self.get_config()
+        self.assertEqual(main.get_graph_sources(config), [config])
+        sources = main.get_graph_sources(self.get_multi_graph_config())
+        self.assertEqual(
+            [source['graph_url'] for source in sources],
+            ['http://a.graph.xd/', 'http://b.graph.xd/']
+        )
+        self.assertEqual(
+            [source['refresh_time'] for source in sources], [15, 60]
+        )
+        self.assertEqual(sources[0]['token'], '666:asdf')
+        self.assertNotIn('graphs', sources[0])
+
+    def test_run_rejects_several_graphs(self):
+        with self.assertRaises(ValueError):
+            main.run(self.get_multi_graph_config(), do_once=True)
+
+    @patch.object(main, 'make_bot')
+    @patch.object(GraphFetcher, 'poll_graph', autospec=True)
+    def test_run_async_with_several_graphs(self, poll_graph_mock, bot_mock):
+        poll_graph_mock.return_value = None
+        main.run_async(self.get_multi_graph_config(), do_once=True)
+        fetchers = [args[0] for args, _ in poll_graph_mock.call_args_list]
+        self.assertEqual(
+            sorted(fetcher.graph_url for fetcher in fetchers),
+            ['http://a.graph.xd/', 'http://b.graph.xd/']
+        )
+        self.assertIs(fetchers[0].http_client, fetchers[1].http_client)
+        self.assertIsNot(fetchers[0].scheduler, fetchers[1].scheduler)
+        self.assertEqual(bot_mock.call_args[0][0]['token'], '666:asdf')
+        bot_mock.assert_called_once()
+
+    def test_bot_connection_pool_fits_the_sender(self):
+        def get_pool_size(bot):
+            return bot._request._con_pool.connection_pool_kw['maxsize']
+
+        config = self.get_config()
+        self.assertEqual(get_pool_size(main.make_bot(config)), 10)
+        config['sender_workers'] = 20
+        bot = main.make_bot(config)
+        self.assertEqual(get_pool_size(bot), 22)
+        sender = main.make_sender(config, bot)
+        self.assertEqual(sender.executor._max_workers, 20)
+        sender.shutdown()
+
+    def test_snapshot_is_resumed_after_etag_rotation(self):
+        with TemporaryDirectory() as directory:
+            store = SnapshotStore(os.path.join(directory, 'graph.snapshot'))
+            wrapped_graph = make_wrapped_graph('a', [(1, 2, 'nom')])
+            wrapped_graph['content_hash'] = 'deadbeef'
+            graph_data = DummyGraphData()
+            graph_data.data = GraphCruncher(
+                clique_tracker=CliqueTracker(), snapshot_store=store
+            )(wrapped_graph)
+            # The server rotated the ETag of the unchanged graph.
+            graph_data.data['etag'] = 'b'
+            resumed = GraphCruncher(differ=GraphDiffer(), snapshot_store=store)
+            main.restore_cruncher(resumed, graph_data)
+            self.assertIsNotNone(resumed.differ.last_snapshot)
+            # Data saved by older versions is only matched by its ETag.
+            del graph_data.data['content_hash']
+            resumed = GraphCruncher(differ=GraphDiffer(), snapshot_store=store)
+            main.restore_cruncher(resumed, graph_data)
+            self.assertIsNone(resumed.differ.last_snapshot)
+
+    def test_make_late_data_pairs(self):
+        graph_data = DummyGraphData()
+        graph_data.data = {'etag': 'b', 'liks': 1, 'noms': 2}
+        late_results = Subject()
+        observer = MagicMock()
+        main.make_late_data_pairs(graph_data, late_results).subscribe(observer)
+        late_results.on_next({'etag': 'a', 'clique_number': 4})
+        late_results.on_next({'etag': 'b', 'clique_number': 5})
+        observer.on_next.assert_called_once_with({
+            'new': {'etag': 'b', 'liks': 1, 'noms': 2, 'clique_number': 5}
+        })
+
+    def test_late_data_pairs_are_recorded_and_saved(self):
+        graph_data = DummyGraphData()
+        graph_data.data = {'etag': 'b', 'liks': 1, 'noms': 2}
+        cruncher = MagicMock(spec=PooledGraphCruncher)
+        cruncher.late_results = Subject()
+        recorder = MagicMock()
+        saver = MagicMock()
+        main.subscribe_late_data_pairs(
+            graph_data, cruncher, [recorder, None, saver]
+        )
+        cruncher.late_results.on_next({'etag': 'b', 'clique_number': 5})
+        data_pair = {
+            'new': {'etag': 'b', 'liks': 1, 'noms': 2, 'clique_number': 5}
+        }
+        recorder.on_next.assert_called_once_with(data_pair)
+        saver.on_next.assert_called_once_with(data_pair)
+
+    @patch.object(graph_fetcher, 'sleep')
+    @patch.object(GraphFetcher, 'poll_graph', autospec=True)
+    def test_pipeline_notifies_diff_and_saves(
+        self, poll_graph_mock, sleep_mock
+    ):
+        wrapped_graphs = [
+            make_wrapped_graph('a', [(1, 2, 'lik'), (2, 3, 'nom')]),
+            make_wrapped_graph(
+                'b', [(1, 2, 'lik'), (3, 1, 'lik'), (2, 1, 'lik')]
+            ),
+        ]
+
+        def poll_graph_side_effect(fetcher):
+            if len(wrapped_graphs) == 1:
+                fetcher.do_once = True
+            return wrapped_graphs.pop(0)
+        poll_graph_mock.side_effect = poll_graph_side_effect
+
+        graph_data = DummyGraphData()
+        notifier = MagicMock()
+        data_pairs = main.make_pipeline(self.get_config(), graph_data)
+        data_pairs.subscribe(notifier)
+        data_pairs.subscribe(GraphSaver(graph_data))
+        data_pairs.connect()
+
+        first_pair, second_pair = [
+            args[0] for args, _ in notifier.on_next.call_args_list
+        ]
+        self.assertNotIn('old', first_pair)
+        self.assertEqual(second_pair['old']['liks'], 1)
+        self.assertEqual(second_pair['new']['liks'], 3)
+        self.assertEqual(second_pair['diff'], {
+            'added': {'lik': 2},
+            'removed': {'nom': 1},
+            'affected_nodes': ['1', '2', '3'],
+        })
+        self.assertEqual(graph_data.saved[-1]['etag'], 'b')
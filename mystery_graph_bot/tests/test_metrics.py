@@ -0,0 +1,112 @@
+from unittest import TestCase
+from urllib.error import HTTPError
+from urllib.request import urlopen
+import logging
+
+from ..metrics import MetricsRegistry, MetricsServer
+
+
+class MetricsRegistryTestCase(TestCase):
+
+    def setUp(self):
+        self.registry = MetricsRegistry()
+
+    def test_counter(self):
+        counter = self.registry.counter('requests_total', 'Requests.')
+        counter.inc()
+        counter.inc(2)
+        self.assertEqual(self.registry.render(), (
+            '# HELP requests_total Requests.\n'
+            '# TYPE requests_total counter\n'
+            'requests_total 3\n'
+        ))
+
+    def test_labels(self):
+        counter = self.registry.counter(
+            'responses_total', 'Responses.', ['graph', 'status']
+        )
+        counter.labels('http://a', 304).inc()
+        counter.labels('http://a', 200).inc(5)
+        counter.labels('http://a', 304).inc()
+        lines = self.registry.render().splitlines()
+        self.assertEqual(lines[2:], [
+            'responses_total{graph="http://a",status="200"} 5',
+            'responses_total{graph="http://a",status="304"} 2',
+        ])
+        with self.assertRaises(ValueError):
+            counter.labels('http://a')
+
+    def test_gauge(self):
+        gauge = self.registry.gauge('interval_seconds', 'Interval.', ['g'])
+        gauge.labels('a').set(1.5)
+        gauge.labels('b').set_function(lambda: 30.0)
+        self.assertEqual(self.registry.render().splitlines()[2:], [
+            'interval_seconds{g="a"} 1.5',
+            'interval_seconds{g="b"} 30',
+        ])
+
+    def test_histogram(self):
+        histogram = self.registry.histogram(
+            'fetch_seconds', 'Fetch time.', buckets=[1, 0.1]
+        )
+        histogram.observe(0.05)
+        histogram.observe(0.1)
+        histogram.observe(0.5)
+        histogram.observe(3)
+        self.assertEqual(self.registry.render().splitlines()[2:], [
+            'fetch_seconds_bucket{le="0.1"} 2',
+            'fetch_seconds_bucket{le="1"} 3',
+            'fetch_seconds_bucket{le="+Inf"} 4',
+            'fetch_seconds_sum 3.65',
+            'fetch_seconds_count 4',
+        ])
+
+    def test_histogram_time(self):
+        histogram = self.registry.histogram('block_seconds', 'Block.')
+        with histogram.time():
+            pass
+        self.assertIn('block_seconds_count 1', self.registry.render())
+
+    def test_escaping(self):
+        counter = self.registry.counter('a_total', 'Back\\slash\nline', ['l'])
+        counter.labels('"quoted"').inc()
+        self.assertEqual(self.registry.render().splitlines(), [
+            '# HELP a_total Back\\\\slash\\nline',
+            '# TYPE a_total counter',
+            'a_total{l="\\"quoted\\""} 1',
+        ])
+
+    def test_same_name(self):
+        counter = self.registry.counter('a_total', 'A.')
+        self.assertIs(self.registry.counter('a_total', 'A.'), counter)
+        with self.assertRaises(ValueError):
+            self.registry.gauge('a_total', 'A.')
+
+
+class MetricsServerTestCase(TestCase):
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.registry = MetricsRegistry()
+        self.server = MetricsServer(0, registry=self.registry)
+        self.server.start()
+        self.url = 'http://127.0.0.1:{}'.format(self.server.port)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+        self.server.close()
+
+    def test_scrape(self):
+        self.registry.counter('polls_total', 'Polls.').inc()
+        with urlopen(self.url + '/metrics') as response:
+            self.assertEqual(response.status, 200)
+            self.assertTrue(
+                response.headers['Content-Type'].startswith('text/plain')
+            )
+            body = response.read().decode()
+        self.assertIn('polls_total 1\n', body)
+
+    def test_not_found(self):
+        with self.assertRaises(HTTPError) as context:
+            urlopen(self.url + '/other')
+        self.assertEqual(context.exception.code, 404)
@@ -0,0 +1,200 @@
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+import logging
+
+from ..metrics_history import (
+    MetricsHistory, MetricsRecorder, Resolution, RingBuffer
+)
+
+
+START = 1700000000 - 1700000000 % 86400
+
+
+def make_data(liks, noms=0, clique_number=None):
+    return {
+        'liks': liks,
+        'noms': noms,
+        'lik_record': liks,
+        'nom_record': noms,
+        'clique_number': clique_number,
+    }
+
+
+class RingBufferTestCase(TestCase):
+
+    def test_keeps_last_slots(self):
+        ring = RingBuffer(3, 1)
+        for timestamp in range(5):
+            ring.append(timestamp, [timestamp * 10])
+        self.assertEqual(len(ring), 3)
+        self.assertEqual(
+            list(ring.range(0, 10)), [(2, [20]), (3, [30]), (4, [40])]
+        )
+        self.assertEqual(ring.last(), (4, [40]))
+
+    def test_range(self):
+        ring = RingBuffer(10, 1)
+        for timestamp in range(8):
+            ring.append(timestamp, [None])
+        self.assertEqual(
+            [timestamp for timestamp, _ in ring.range(2.5, 5)], [3, 4]
+        )
+        self.assertEqual(list(ring.range(20, 30)), [])
+
+    def test_replace_last(self):
+        ring = RingBuffer(2, 2)
+        ring.append(1, [1, 2])
+        ring.replace_last(1, [3, None])
+        self.assertEqual(ring.last(), (1, [3, None]))
+        self.assertEqual(len(ring), 1)
+
+    def test_empty(self):
+        ring = RingBuffer(2, 2)
+        self.assertIsNone(ring.last())
+        self.assertEqual(list(ring.range(0, 10)), [])
+
+
+class MetricsHistoryTestCase(TestCase):
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.directory = TemporaryDirectory()
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+        self.directory.cleanup()
+
+    def test_raw_query(self):
+        history = MetricsHistory()
+        for minute in range(10):
+            history.record(make_data(minute), START + minute * 60)
+        samples = history.query(START + 120, START + 300)
+        self.assertEqual([sample['liks'] for sample in samples], [2, 3, 4])
+        self.assertEqual(samples[0]['time'], START + 120)
+        self.assertEqual(samples[0]['clique_number'], None)
+        self.assertIsInstance(samples[0]['noms'], int)
+
+    def test_buckets(self):
+        history = MetricsHistory()
+        for liks in (5, 2, 7, 4):
+            history.record(make_data(liks), START + liks * 60)
+        history.record(make_data(1, clique_number=3), START + 3600)
+        buckets = history.query(resolution='hourly')
+        self.assertEqual(len(buckets), 2)
+        self.assertEqual(buckets[0]['time'], START)
+        self.assertEqual(buckets[0]['liks'], 4)
+        self.assertEqual(buckets[0]['liks_min'], 2)
+        self.assertEqual(buckets[0]['liks_max'], 7)
+        self.assertEqual(buckets[0]['clique_number_max'], None)
+        self.assertEqual(buckets[1]['liks'], 1)
+        self.assertEqual(buckets[1]['clique_number'], 3)
+        days = history.query(resolution='daily')
+        self.assertEqual(len(days), 1)
+        self.assertEqual(days[0]['liks_min'], 1)
+        self.assertEqual(days[0]['liks_max'], 7)
+
+    def test_query_includes_overlapping_bucket(self):
+        history = MetricsHistory()
+        history.record(make_data(1), START + 60)
+        buckets = history.query(START + 1800, resolution='hourly')
+        self.assertEqual(len(buckets), 1)
+
+    def test_missing_value_keeps_last(self):
+        history = MetricsHistory()
+        history.record(make_data(1, clique_number=4), START)
+        history.record(make_data(2), START + 60)
+        bucket = history.query(resolution='hourly')[0]
+        self.assertEqual(bucket['clique_number'], 4)
+        self.assertEqual(bucket['liks'], 2)
+
+    def test_clock_going_back(self):
+        history = MetricsHistory()
+        history.record(make_data(1), START + 7200)
+        history.record(make_data(2), START)
+        buckets = history.query(resolution='hourly')
+        self.assertEqual(len(buckets), 1)
+        self.assertEqual(buckets[0]['time'], START + 7200)
+        self.assertEqual(buckets[0]['liks_max'], 2)
+
+    def test_late_result_replaces_the_raw_sample(self):
+        history = MetricsHistory()
+        history.record(dict(make_data(1), etag='a'), START)
+        history.record(
+            dict(make_data(1, clique_number=3), etag='a'), START + 30
+        )
+        history.record(dict(make_data(2), etag='b'), START + 60)
+        samples = history.query()
+        self.assertEqual(
+            [(sample['time'], sample['clique_number']) for sample in samples],
+            [(START, 3), (START + 60, None)]
+        )
+
+    def test_clock_going_back_keeps_raw_samples_in_order(self):
+        history = MetricsHistory()
+        history.record(make_data(1), START + 120)
+        history.record(make_data(2), START)
+        history.record(make_data(3), START + 180)
+        samples = history.query()
+        self.assertEqual(
+            [(sample['time'], sample['liks']) for sample in samples],
+            [(START + 120, 2), (START + 180, 3)]
+        )
+        self.assertEqual(len(history.query(START + 120, START + 121)), 1)
+
+    def test_bounded(self):
+        history = MetricsHistory(resolutions=[
+            Resolution('raw', 0, 4), Resolution('hourly', 3600, 2),
+        ])
+        for hour in range(10):
+            history.record(make_data(hour), START + hour * 3600)
+        self.assertEqual(
+            [sample['liks'] for sample in history.query()], [6, 7, 8, 9]
+        )
+        self.assertEqual(
+            [bucket['liks'] for bucket in history.query(resolution='hourly')],
+            [8, 9]
+        )
+
+    def test_persistence(self):
+        history = MetricsHistory(self.directory.name)
+        history.record(make_data(1), START)
+        history.record(make_data(2), START + 60)
+        history.flush()
+        reopened = MetricsHistory(self.directory.name)
+        self.assertEqual(
+            [sample['liks'] for sample in reopened.query()], [1, 2]
+        )
+        reopened.record(make_data(3), START + 120)
+        bucket = reopened.query(resolution='hourly')[0]
+        self.assertEqual((bucket['liks_min'], bucket['liks_max']), (1, 3))
+
+    def test_other_layout_starts_over(self):
+        MetricsHistory(self.directory.name).record(make_data(1), START)
+        history = MetricsHistory(self.directory.name, resolutions=[
+            Resolution('raw', 0, 5),
+        ])
+        self.assertEqual(history.query(), [])
+
+
+class MetricsRecorderTestCase(TestCase):
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def test_on_next(self):
+        history = MetricsHistory()
+        recorder = MetricsRecorder(history)
+        new = dict(make_data(3, 4, 2), etag='a', graph={})
+        recorder.on_next({'new': new})
+        samples = history.query()
+        self.assertEqual(len(samples), 1)
+        self.assertEqual(samples[0]['noms'], 4)
+        self.assertEqual(samples[0]['clique_number'], 2)
+
+    def test_on_next_with_unexpected_data(self):
+        history = MetricsHistory()
+        MetricsRecorder(history).on_next({'wrong': 1})
+        self.assertEqual(history.query(), [])
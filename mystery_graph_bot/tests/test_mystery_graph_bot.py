@@ -6,6 +6,7 @@ import requests
 
 from .. import mystery_graph_bot
 from ..serializers import Data 
+from ..http_client import GraphHttpClient
 from ..mystery_graph_bot import MysteryGraphBot
 
 
@@ -180,7 +181,7 @@ class MysteryGraphBotTestCase(TestCase):
             'If-None-Match': 'deadbeef'
         })
 
-    @patch.object(requests, 'get', return_value=MagicMock())
+    @patch.object(GraphHttpClient, 'get', return_value=MagicMock())
     @patch.object(
         MysteryGraphBot,'handle_http_graph_response', return_value=True
     )
@@ -188,13 +189,15 @@ class MysteryGraphBotTestCase(TestCase):
         bot = MysteryGraphBot(DummyGraphData(), self.get_config())
         self.assertTrue(bot.bare_poll({'My-Header': 'Yay'}))
         get_mock.assert_called_once_with(
-            bot.graph_url, timeout=5, headers={'My-Header': 'Yay'}
+            bot.graph_url, headers={'My-Header': 'Yay'}, stream=False
         )
         handle_http_graph_response_mock.assert_called_once_with(
             get_mock.return_value
         )
 
-    @patch.object(requests, 'get', side_effect=requests.ConnectionError())
+    @patch.object(
+        GraphHttpClient, 'get', side_effect=requests.ConnectionError()
+    )
     @patch.object(MysteryGraphBot,'handle_http_graph_response')
     def test_bare_poll_connection_error(
             self, handle_http_graph_response_mock, get_mock
@@ -202,11 +205,13 @@ class MysteryGraphBotTestCase(TestCase):
         bot = MysteryGraphBot(DummyGraphData(), self.get_config())
         self.assertFalse(bot.bare_poll({'My-Header': 'Yay'}))
         get_mock.assert_called_once_with(
-            bot.graph_url, timeout=5, headers={'My-Header': 'Yay'}
+            bot.graph_url, headers={'My-Header': 'Yay'}, stream=False
         )
         handle_http_graph_response_mock.assert_not_called()
 
-    @patch.object(requests, 'get', side_effect=requests.Timeout())
+    @patch.object(
+        GraphHttpClient, 'get', side_effect=requests.Timeout()
+    )
     @patch.object(MysteryGraphBot,'handle_http_graph_response')
     def test_bare_poll_timeout(
         self, handle_http_graph_response_mock, get_mock
@@ -214,11 +219,13 @@ class MysteryGraphBotTestCase(TestCase):
         bot = MysteryGraphBot(DummyGraphData(), self.get_config())
         self.assertFalse(bot.bare_poll({'My-Header': 'Yay'}))
         get_mock.assert_called_once_with(
-            bot.graph_url, timeout=5, headers={'My-Header': 'Yay'}
+            bot.graph_url, headers={'My-Header': 'Yay'}, stream=False
         )
         handle_http_graph_response_mock.assert_not_called()
 
-    @patch.object(requests, 'get', side_effect=requests.TooManyRedirects())
+    @patch.object(
+        GraphHttpClient, 'get', side_effect=requests.TooManyRedirects()
+    )
     @patch.object(MysteryGraphBot,'handle_http_graph_response')
     def test_bare_poll_too_many_redirects(
         self, handle_http_graph_response_mock, get_mock
@@ -226,7 +233,7 @@ class MysteryGraphBotTestCase(TestCase):
         bot = MysteryGraphBot(DummyGraphData(), self.get_config())
         self.assertFalse(bot.bare_poll({'My-Header': 'Yay'}))
         get_mock.assert_called_once_with(
-            bot.graph_url, timeout=5, headers={'My-Header': 'Yay'}
+            bot.graph_url, headers={'My-Header': 'Yay'}, stream=False
         )
         handle_http_graph_response_mock.assert_not_called()
 
@@ -286,6 +293,21 @@ class MysteryGraphBotTestCase(TestCase):
             ]
         })
 
+    @patch.object(MysteryGraphBot, 'update_counts')
+    def test_update_data_with_streamed_response(self, update_counts_mock):
+        response_mock = MagicMock()
+        response_mock.iter_content.return_value = iter([
+            b'{"links": [{"source": 1, "target": 2, "value": "lik"}, ',
+            b'{"source": 2, "target": 1, "value": "nom"}, ',
+            b'{"source": 1, "target": 2, "value": "nom"}], "nodes": []}',
+        ])
+        response_mock.headers = {'ETag': 'deadbeef'}
+        config = self.get_config()
+        config['stream_graph'] = True
+        bot = MysteryGraphBot(DummyGraphData(), config)
+        self.assertTrue(bot.update_data_with_response(response_mock))
+        update_counts_mock.assert_called_once_with('deadbeef', 1, 2)
+
     @patch.object(MysteryGraphBot, 'update_data')
     def test_update_data_with_response_with_invalid_json(
             self, update_data_mock
@@ -0,0 +1,112 @@
+from unittest import TestCase
+from unittest.mock import MagicMock
+import logging
+
+from ..notification_coalescer import NotificationCoalescer, merge_data_pairs
+
+
+def make_data_pair(old_liks, new_liks, added=None, nodes=()):
+    data_pair = {
+        'new': {'etag': str(new_liks), 'liks': new_liks, 'noms': 0},
+        'old': {'etag': str(old_liks), 'liks': old_liks, 'noms': 0},
+    }
+    if added is not None:
+        data_pair['diff'] = {
+            'added': {'lik': added}, 'removed': {},
+            'affected_nodes': list(nodes),
+        }
+    return data_pair
+
+
+class FakeTimer:
+    # Started timers are kept, and fired by the test.
+
+    def __init__(self, timers, delay, function, args):
+        self.timers = timers
+        self.delay = delay
+        self.function = function
+        self.args = args
+        self.cancelled = False
+
+    def start(self):
+        self.timers.append(self)
+
+    def cancel(self):
+        self.cancelled = True
+
+    def fire(self):
+        self.function(*self.args)
+
+
+class NotificationCoalescerTestCase(TestCase):
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.now = 0.0
+        self.timers = []
+        self.on_flush = MagicMock()
+        self.coalescer = NotificationCoalescer(
+            self.on_flush, quiet_time=10, max_delay=25,
+            clock=lambda: self.now,
+            timer_factory=lambda delay, function, args: FakeTimer(
+                self.timers, delay, function, args
+            )
+        )
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def test_burst_is_merged(self):
+        self.coalescer.on_next(make_data_pair(1, 3, 2, ['a']))
+        self.now = 5
+        self.coalescer.on_next(make_data_pair(3, 4, 1, ['b', 'a']))
+        self.assertEqual([timer.delay for timer in self.timers], [10, 10])
+        self.assertTrue(self.timers[0].cancelled)
+        self.timers[0].fire()
+        self.on_flush.assert_not_called()
+        self.timers[1].fire()
+        self.on_flush.assert_called_once_with({
+            'new': {'etag': '4', 'liks': 4, 'noms': 0},
+            'old': {'etag': '1', 'liks': 1, 'noms': 0},
+            'diff': {
+                'added': {'lik': 3}, 'removed': {},
+                'affected_nodes': ['a', 'b'],
+            },
+        })
+
+    def test_max_delay(self):
+        for now in (0, 8, 16, 24):
+            self.now = now
+            self.coalescer.on_next(make_data_pair(now, now + 1))
+        self.assertEqual(
+            [timer.delay for timer in self.timers], [10, 10, 9, 1]
+        )
+
+    def test_on_completed_flushes(self):
+        self.coalescer.on_completed()
+        self.on_flush.assert_not_called()
+        self.coalescer.on_next(make_data_pair(1, 2))
+        self.coalescer.on_completed()
+        self.assertEqual(self.on_flush.call_count, 1)
+        self.timers[0].fire()
+        self.assertEqual(self.on_flush.call_count, 1)
+
+    def test_unexpected_data(self):
+        self.coalescer.on_next({'wrong': 1})
+        self.assertEqual(self.timers, [])
+
+    def test_merge_without_old_data_or_diff(self):
+        first = make_data_pair(1, 2, 1)
+        del first['old']
+        merged = merge_data_pairs(first, make_data_pair(2, 3))
+        self.assertEqual(merged, {'new': make_data_pair(2, 3)['new']})
+
+    def test_real_timer(self):
+        coalescer = NotificationCoalescer(
+            self.on_flush, quiet_time=0.01, max_delay=1
+        )
+        flushed = []
+        self.on_flush.side_effect = flushed.append
+        coalescer.on_next(make_data_pair(1, 2))
+        coalescer.timer.join(5)
+        self.assertEqual(len(flushed), 1)
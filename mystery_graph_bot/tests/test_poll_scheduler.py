@@ -0,0 +1,84 @@
+from unittest import TestCase
+from unittest.mock import MagicMock
+import logging
+
+from ..poll_scheduler import (
+    CHANGED, CLOSED, FAILED, HALF_OPEN, OPEN, UNCHANGED, PollScheduler
+)
+
+
+class PollSchedulerTestCase(TestCase):
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        # Without jitter, and with the backoff jitter always picking the
+        # longest delay.
+        self.rng = MagicMock()
+        self.rng.uniform.side_effect = (
+            lambda low, high: high if low == 0 else 0
+        )
+        self.scheduler = PollScheduler(
+            10, min_interval=2, max_interval=30, max_backoff=100,
+            failure_threshold=3, rng=self.rng
+        )
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def test_tightens_while_changing(self):
+        delays = []
+        for _ in range(4):
+            self.scheduler.record(CHANGED)
+            delays.append(self.scheduler.next_delay())
+        self.assertEqual(delays, [5, 2.5, 2, 2])
+
+    def test_relaxes_while_quiet(self):
+        delays = []
+        for _ in range(4):
+            self.scheduler.record(UNCHANGED)
+            delays.append(self.scheduler.next_delay())
+        self.assertEqual(delays, [15, 22.5, 30, 30])
+
+    def test_backs_off_on_failures(self):
+        self.scheduler.record(FAILED)
+        self.assertEqual(self.scheduler.next_delay(), 20)
+        self.scheduler.record(FAILED)
+        self.assertEqual(self.scheduler.next_delay(), 40)
+        self.scheduler.record(UNCHANGED)
+        self.assertEqual(self.scheduler.next_delay(), 15)
+
+    def test_backoff_jitter(self):
+        self.scheduler.rng = MagicMock()
+        self.scheduler.rng.uniform.return_value = 0
+        self.scheduler.record(FAILED)
+        self.assertEqual(self.scheduler.next_delay(), 10)
+
+    def test_circuit_breaker(self):
+        for _ in range(3):
+            self.scheduler.record(FAILED)
+        self.assertEqual(self.scheduler.state, OPEN)
+        self.assertEqual(self.scheduler.next_delay(), 100)
+        self.assertEqual(self.scheduler.state, HALF_OPEN)
+        self.scheduler.record(FAILED)
+        self.assertEqual(self.scheduler.state, OPEN)
+        self.assertEqual(self.scheduler.next_delay(), 100)
+        self.scheduler.record(CHANGED)
+        self.assertEqual(self.scheduler.state, CLOSED)
+        self.assertEqual(self.scheduler.interval, 5)
+        self.assertEqual(self.scheduler.consecutive_failures, 0)
+
+    def test_circuit_changes_are_logged(self):
+        logging.disable(logging.NOTSET)
+        with self.assertLogs('mystery_graph_bot', logging.WARNING) as logs:
+            for _ in range(3):
+                self.scheduler.record(FAILED)
+            self.scheduler.next_delay()
+            self.scheduler.record(UNCHANGED)
+        self.assertEqual(len(logs.records), 2)
+        self.assertIn('Opening circuit', logs.output[0])
+        self.assertIn('Closing circuit', logs.output[1])
+
+    def test_jitter(self):
+        scheduler = PollScheduler(10, jitter=0.1)
+        for _ in range(100):
+            self.assertTrue(9 <= scheduler.next_delay() <= 11)
@@ -0,0 +1,134 @@
+from tempfile import TemporaryDirectory
+from threading import Thread
+from unittest import TestCase
+from unittest.mock import MagicMock
+import logging
+import os
+import pstats
+
+from ..profiling import CycleProfiler, ProfiledObserver
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def busy(clock, seconds):
+    clock.now += seconds
+    return sum(range(100))
+
+
+class CycleProfilerTestCase(TestCase):
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.directory = TemporaryDirectory()
+        self.clock = FakeClock()
+        self.profiler = CycleProfiler(
+            self.directory.name, threshold=1.0, name='test', keep=2,
+            clock=self.clock
+        )
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+        self.directory.cleanup()
+
+    def run_cycle(self, seconds):
+        self.profiler.start_cycle()
+        self.profiler.stage('fetch', busy, self.clock, seconds / 2)
+        self.profiler.wrap('crunch', busy)(self.clock, seconds / 2)
+        return self.profiler.finish_cycle()
+
+    def test_fast_cycle_is_not_kept(self):
+        self.assertIsNone(self.run_cycle(0.5))
+        self.assertEqual(os.listdir(self.directory.name), [])
+
+    def test_slow_cycle_is_kept(self):
+        path = self.run_cycle(2.0)
+        self.assertTrue(path.startswith(self.directory.name))
+        self.assertIn('-test-2.0s', path)
+        stats = pstats.Stats(path)
+        functions = {function for _, _, function in stats.stats}
+        self.assertIn('busy', functions)
+        self.assertEqual(self.profiler.stage_times['fetch'], 1.0)
+        self.assertEqual(self.profiler.stage_times['crunch'], 1.0)
+
+    def test_summary_is_logged(self):
+        logging.disable(logging.NOTSET)
+        with self.assertLogs('mystery_graph_bot', logging.WARNING) as logs:
+            self.run_cycle(2.0)
+        summary = logs.output[0]
+        self.assertIn('fetch 1.000s, crunch 1.000s', summary)
+        self.assertIn('busy', summary)
+
+    def test_old_profiles_are_removed(self):
+        paths = []
+        for seconds in (2, 3, 4):
+            paths.append(self.run_cycle(seconds))
+            # Different modification times.
+            os.utime(paths[-1], (seconds, seconds))
+        self.run_cycle(5)
+        self.assertEqual(len(os.listdir(self.directory.name)), 2)
+        self.assertFalse(os.path.exists(paths[0]))
+
+    def test_stage_outside_cycle(self):
+        self.assertEqual(self.profiler.stage('fetch', lambda: 3), 3)
+        self.assertIsNone(self.profiler.finish_cycle())
+
+    def test_stages_in_other_threads(self):
+        self.profiler.start_cycle()
+        for _ in range(3):
+            thread = Thread(
+                target=self.profiler.stage,
+                args=('notify', busy, self.clock, 1.0)
+            )
+            thread.start()
+            thread.join()
+        path = self.profiler.finish_cycle()
+        stats = pstats.Stats(path)
+        calls = [
+            entry[1] for (_, _, function), entry in stats.stats.items()
+            if function == 'busy'
+        ]
+        self.assertEqual(calls, [3])
+
+    def test_overlapping_stage_is_only_timed(self):
+        results = []
+
+        def notify():
+            # Runs while the crunch stage is being profiled.
+            thread = Thread(target=lambda: results.append(
+                self.profiler.stage('notify', busy, self.clock, 1.0)
+            ))
+            thread.start()
+            thread.join()
+        self.profiler.start_cycle()
+        self.profiler.stage('crunch', notify)
+        self.assertEqual(results, [4950])
+        self.assertIsNotNone(self.profiler.finish_cycle())
+        self.assertEqual(
+            list(self.profiler.stage_times), ['notify', 'crunch']
+        )
+        self.assertEqual(self.profiler.stage_times['notify'], 1.0)
+
+    def test_failing_stage_is_still_recorded(self):
+        self.profiler.start_cycle()
+        with self.assertRaises(ZeroDivisionError):
+            self.profiler.stage('crunch', lambda: 1 / 0)
+        self.assertIn('crunch', self.profiler.stage_times)
+
+
+class ProfiledObserverTestCase(TestCase):
+
+    def test_on_next(self):
+        observer = MagicMock()
+        profiler = MagicMock()
+        ProfiledObserver(observer, profiler, 'save').on_next({'new': {}})
+        profiler.stage.assert_called_once_with(
+            'save', observer.on_next, {'new': {}}
+        )
@@ -0,0 +1,104 @@
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+import logging
+import os
+
+from ..clique_tracker import CliqueTracker
+from ..graph_cruncher import GraphCruncher
+from ..graph_diff import GraphDiffer, diff_snapshots, edge_keys
+from ..graph_snapshot import GraphSnapshotBuilder
+from ..snapshot_file import SnapshotStore
+
+
+def make_snapshot(edges, names=None):
+    builder = GraphSnapshotBuilder()
+    for source, target, value in edges:
+        builder.add_link(source, target, value)
+    for index, name in (names or {}).items():
+        builder.add_node(index, name)
+    return builder.build()
+
+
+EDGES = [(1, 2, 'nom'), (2, 3, 'nom'), (3, 1, 'nom'), (4, 1, 'lik'),
+         (40000000000, 4, 'hug')]
+
+
+class SnapshotStoreTestCase(TestCase):
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.directory = TemporaryDirectory()
+        self.store = SnapshotStore(
+            os.path.join(self.directory.name, 'graph.dat.snapshot')
+        )
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+        self.directory.cleanup()
+
+    def test_save_and_load(self):
+        snapshot = make_snapshot(EDGES, {1: 'ñandú', 4: 'four'})
+        self.store.save(snapshot, {'etag': 'a', 'liks': 1}, {3, 1, 2})
+        saved = self.store.load()
+        self.assertEqual(saved.data, {'etag': 'a', 'liks': 1})
+        self.assertEqual(saved.max_clique, [1, 2, 3])
+        loaded = saved.snapshot
+        self.assertEqual(list(loaded.sources), list(snapshot.sources))
+        self.assertEqual(list(loaded.targets), list(snapshot.targets))
+        self.assertEqual(list(loaded.relations), list(snapshot.relations))
+        self.assertEqual(list(loaded.node_ids), list(snapshot.node_ids))
+        self.assertEqual(list(loaded.node_names), snapshot.node_names)
+        self.assertEqual(loaded.node_names[-1], snapshot.node_names[-1])
+        self.assertEqual(loaded.relation_names, snapshot.relation_names)
+        self.assertEqual(loaded.count('nom'), 3)
+        self.assertEqual(loaded.max_indegree('lik'), 1)
+
+    def test_load_is_zero_copy(self):
+        self.store.save(make_snapshot(EDGES), {'etag': 'a'})
+        loaded = self.store.load().snapshot
+        self.assertIsInstance(loaded.sources, memoryview)
+        self.assertIsInstance(loaded.node_ids, memoryview)
+
+    def test_edge_keys_are_kept(self):
+        snapshot = make_snapshot(EDGES[:4])
+        keys = edge_keys(snapshot)
+        self.store.save(snapshot, {'etag': 'a'})
+        loaded = self.store.load().snapshot
+        self.assertEqual(list(loaded._edge_keys), list(keys))
+        new = make_snapshot(EDGES[1:4] + [(5, 1, 'lik')])
+        diff = diff_snapshots(loaded, new)
+        self.assertEqual(diff.added, {'lik': 1})
+        self.assertEqual(diff.removed, {'nom': 1})
+
+    def test_load_without_file(self):
+        self.assertIsNone(self.store.load())
+
+    def test_load_corrupt_file(self):
+        self.store.save(make_snapshot(EDGES), {'etag': 'a'})
+        with open(self.store.path, 'r+b') as snapshot_file:
+            snapshot_file.seek(-3, os.SEEK_END)
+            snapshot_file.write(b'xyz')
+        self.assertIsNone(self.store.load())
+
+    def test_load_other_format(self):
+        with open(self.store.path, 'wb') as snapshot_file:
+            snapshot_file.write(b'{"etag": "a"}')
+        self.assertIsNone(self.store.load())
+
+    def test_cruncher_resumes_from_snapshot(self):
+        first = make_snapshot(EDGES[:4])
+        second = make_snapshot(EDGES[:4] + [(4, 2, 'nom'), (4, 3, 'nom'),
+                                            (4, 1, 'nom')])
+        cruncher = GraphCruncher(
+            differ=GraphDiffer(), clique_tracker=CliqueTracker(),
+            snapshot_store=self.store
+        )
+        cruncher({'etag': 'a', 'graph': first})
+
+        resumed = GraphCruncher(
+            differ=GraphDiffer(), clique_tracker=CliqueTracker()
+        )
+        resumed.restore(self.store.load())
+        graph_data = resumed({'etag': 'b', 'graph': second})
+        self.assertEqual(graph_data['clique_number'], 4)
+        self.assertEqual(graph_data['diff']['added'], {'nom': 3})
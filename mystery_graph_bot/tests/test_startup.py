@@ -0,0 +1,80 @@
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+import json
+import os
+import subprocess
+import sys
+
+
+REPO_ROOT = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+)
+ENTRY_SCRIPT = os.path.join(REPO_ROOT, 'mystery_graph_bot.py')
+
+HEAVY_DEPENDENCIES = ('telegram', 'igraph', 'rx', 'requests')
+
+# Generous, so slow machines do not fail; a regression to eager imports
+# shows up in the imported modules anyway.
+STARTUP_BUDGET = 5.0
+
+CONFIG = {
+    'token': '666:asdf',
+    'data_file': 'mystery_graph.dat',
+    'graph_url': 'http://my.graph.xd/',
+    'graph_visualization_url': 'http://my.graph.xd/',
+    'refresh_time': 15,
+    'chat_whitelist': [1],
+    'log_file': 'mystery_graph_bot.log',
+}
+
+
+def get_imports(stderr: str) -> dict:
+    # Cumulative microseconds of every module in `-X importtime` output.
+    imports = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if cumulative.strip().isdigit():
+            imports[name.strip()] = int(cumulative)
+    return imports
+
+
+class StartupTestCase(TestCase):
+
+    def run_python(self, args, cwd=REPO_ROOT):
+        return subprocess.run(
+            [sys.executable, '-X', 'importtime'] + args, cwd=cwd,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            universal_newlines=True, timeout=60
+        )
+
+    def assert_light(self, imports):
+        for name in imports:
+            self.assertNotIn(name.split('.')[0], HEAVY_DEPENDENCIES)
+
+    def test_main_import_is_light(self):
+        result = self.run_python(['-c', 'import mystery_graph_bot.main'])
+        self.assertEqual(result.returncode, 0, result.stderr)
+        imports = get_imports(result.stderr)
+        self.assertIn('mystery_graph_bot.main', imports)
+        self.assert_light(imports)
+
+    def test_check_config_startup_time(self):
+        with TemporaryDirectory() as directory:
+            with open(os.path.join(directory, 'mystery_graph_bot.conf'),
+                      'w') as config_file:
+                json.dump(CONFIG, config_file)
+            result = self.run_python(
+                [ENTRY_SCRIPT, '--check-config'], cwd=directory
+            )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertIn('is valid', result.stdout)
+        imports = get_imports(result.stderr)
+        self.assert_light(imports)
+        startup_time = sum(
+            microseconds for name, microseconds in imports.items()
+            if name.startswith('mystery_graph_bot')
+            and name.count('.') <= 1
+        ) / 1e6
+        self.assertLess(startup_time, STARTUP_BUDGET)
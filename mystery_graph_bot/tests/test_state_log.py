@@ -0,0 +1,105 @@
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+import json
+import logging
+import os
+
+from ..state_log import FSYNC_ALWAYS, FSYNC_NEVER, StateLog
+
+
+class StateLogTestCase(TestCase):
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.directory = TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'state.dat')
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+        self.directory.cleanup()
+
+    def make_log(self, **kwargs):
+        state_log = StateLog(self.path, **kwargs)
+        self.addCleanup(state_log.close)
+        return state_log
+
+    def read_lines(self):
+        with open(self.path, 'rb') as log_file:
+            return log_file.read().splitlines()
+
+    def test_recover_without_file(self):
+        self.assertIsNone(self.make_log().recover())
+
+    def test_append_and_recover(self):
+        state_log = self.make_log(fsync=FSYNC_ALWAYS)
+        self.assertTrue(state_log.append({'etag': 'a', 'liks': 1}))
+        self.assertTrue(state_log.append({'etag': 'b', 'liks': 2}))
+        state_log.close()
+        self.assertEqual(
+            self.make_log().recover(), {'etag': 'b', 'liks': 2}
+        )
+        self.assertEqual(len(self.read_lines()), 2)
+
+    def test_append_unchanged_state(self):
+        state_log = self.make_log()
+        state_log.append({'etag': 'a', 'liks': 1})
+        self.assertFalse(state_log.append({'liks': 1, 'etag': 'a'}))
+        state_log.close()
+        self.assertEqual(len(self.read_lines()), 1)
+
+    def test_recover_drops_torn_record(self):
+        state_log = self.make_log()
+        state_log.append({'etag': 'a'})
+        state_log.append({'etag': 'b'})
+        state_log.close()
+        size = os.path.getsize(self.path)
+        with open(self.path, 'r+b') as log_file:
+            log_file.truncate(size - 4)
+        state_log = self.make_log()
+        self.assertEqual(state_log.recover(), {'etag': 'a'})
+        state_log.append({'etag': 'c'})
+        state_log.close()
+        self.assertEqual(self.make_log().recover(), {'etag': 'c'})
+
+    def test_recover_drops_corrupt_record(self):
+        state_log = self.make_log()
+        state_log.append({'etag': 'a'})
+        state_log.append({'etag': 'b'})
+        state_log.close()
+        with open(self.path, 'rb') as log_file:
+            content = log_file.read()
+        with open(self.path, 'wb') as log_file:
+            log_file.write(content.replace(b'"b"', b'"x"'))
+        self.assertEqual(self.make_log().recover(), {'etag': 'a'})
+
+    def test_append_checks_log_first(self):
+        with open(self.path, 'wb') as log_file:
+            log_file.write(b'0000000')
+        state_log = self.make_log()
+        state_log.append({'etag': 'a'})
+        state_log.close()
+        self.assertEqual(self.make_log().recover(), {'etag': 'a'})
+
+    def test_compaction(self):
+        state_log = self.make_log(fsync=FSYNC_NEVER, compact_threshold=3)
+        for liks in range(7):
+            state_log.append({'liks': liks})
+        state_log.close()
+        self.assertLess(len(self.read_lines()), 3)
+        self.assertEqual(self.make_log().recover(), {'liks': 6})
+        self.assertFalse(os.path.exists(self.path + '.tmp'))
+
+    def test_recover_legacy_json(self):
+        with open(self.path, 'w') as data_file:
+            json.dump({'etag': 'a', 'liks': 1, 'noms': 2}, data_file)
+        self.assertEqual(
+            self.make_log().recover(), {'etag': 'a', 'liks': 1, 'noms': 2}
+        )
+        self.assertEqual(len(self.read_lines()), 1)
+        self.assertEqual(
+            self.make_log().recover(), {'etag': 'a', 'liks': 1, 'noms': 2}
+        )
+
+    def test_unknown_fsync_policy(self):
+        with self.assertRaises(ValueError):
+            StateLog(self.path, fsync='sometimes')
@@ -0,0 +1,112 @@
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+import logging
+import os
+import sqlite3
+import time
+
+from ..subscriber_store import SubscriberStore
+
+
+class SubscriberStoreTestCase(TestCase):
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.directory = TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'graph.subscribers')
+        self.store = SubscriberStore(self.path, seed_chats=[1, '-2', '@x'])
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+        self.store.close()
+        self.directory.cleanup()
+
+    def reopen(self, seed_chats=()):
+        self.store.close()
+        self.store = SubscriberStore(self.path, seed_chats)
+
+    def test_seed_chats(self):
+        self.assertCountEqual(list(self.store), [1, -2, '@x'])
+        self.assertIn('1', self.store)
+        self.store.unsubscribe(1)
+        # Seed chats are only added to a new store.
+        self.reopen(seed_chats=[1, 5])
+        self.assertCountEqual(list(self.store), [-2, '@x'])
+
+    def test_subscribe_and_unsubscribe(self):
+        self.assertTrue(self.store.subscribe(3))
+        self.assertFalse(self.store.subscribe('3'))
+        self.assertTrue(self.store.unsubscribe(1))
+        self.assertFalse(self.store.unsubscribe(1))
+        self.reopen()
+        self.assertCountEqual(list(self.store), [-2, '@x', 3])
+
+    def test_preferences_are_saved(self):
+        self.store.set_preferences(1, min_delta=4, muted=['nom'])
+        self.store.set_preferences(7, muted=['lik'])
+        self.reopen()
+        self.assertEqual(self.store.get(1).min_delta, 4)
+        self.assertEqual(self.store.get(1).muted, {'nom'})
+        self.assertEqual(self.store.get(7).min_delta, 0)
+        self.assertEqual(self.store.get(7).muted, {'lik'})
+
+    def test_get_wanted(self):
+        self.store.set_preferences(1, min_delta=3)
+        self.store.set_preferences(-2, muted=['lik'])
+        self.assertCountEqual(
+            self.store.get_wanted({'lik': -2, 'nom': 0}), ['@x']
+        )
+        self.assertCountEqual(
+            self.store.get_wanted({'lik': 3, 'nom': 0}), [1, '@x']
+        )
+        self.assertCountEqual(
+            self.store.get_wanted({'lik': 3, 'nom': 1}), [1, -2, '@x']
+        )
+        self.assertCountEqual(
+            self.store.get_wanted({'lik': 0, 'nom': 0}), [-2, '@x']
+        )
+
+    def test_mutes_follow_changes(self):
+        self.store.set_preferences(1, min_delta=3, muted=['nom'])
+        self.store.set_preferences('@x', muted=['lik', 'nom'])
+        self.store.set_preferences(1, min_delta=0, muted=[])
+        self.store.unsubscribe('@x')
+        self.assertEqual(
+            self.store.connection.execute('SELECT * FROM mutes').fetchall(),
+            []
+        )
+        self.assertCountEqual(self.store.get_wanted({'nom': 1}), [1, -2])
+
+    def test_first_version_is_upgraded(self):
+        self.store.close()
+        os.remove(self.path)
+        connection = sqlite3.connect(self.path)
+        with connection:
+            connection.execute(
+                'CREATE TABLE subscribers (chat_id TEXT PRIMARY KEY, '
+                'min_delta INTEGER NOT NULL DEFAULT 0, '
+                "muted TEXT NOT NULL DEFAULT '[]')"
+            )
+            connection.execute(
+                'INSERT INTO subscribers VALUES (?, ?, ?)',
+                ('1', 2, '["lik"]')
+            )
+            connection.execute('PRAGMA user_version = 1')
+        connection.close()
+        self.store = SubscriberStore(self.path, seed_chats=[5])
+        self.assertEqual(list(self.store), [1])
+        self.assertEqual(self.store.get_wanted({'lik': 3}), [])
+        self.assertEqual(self.store.get_wanted({'nom': 3}), [1])
+
+    def test_many_subscribers(self):
+        self.store.connection.executemany(
+            'INSERT INTO subscribers (chat_id, min_delta) VALUES (?, ?)',
+            [(str(chat_id), chat_id % 100) for chat_id in range(10, 100010)]
+        )
+        self.store.connection.commit()
+        self.reopen()
+        start_time = time.perf_counter()
+        wanted = self.store.get_wanted({'lik': 9, 'nom': 0})
+        elapsed = time.perf_counter() - start_time
+        self.assertEqual(len(wanted), 10000 + 3)
+        self.assertLess(elapsed, 1.0)
@@ -0,0 +1,134 @@
+from unittest import TestCase
+from unittest.mock import MagicMock
+import logging
+import threading
+
+from telegram.error import BadRequest, RetryAfter, TimedOut, Unauthorized
+
+from ..telegram_sender import (
+    DeliveryReport, TelegramSender, TokenBucket, is_chat_gone
+)
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+        self.lock = threading.Lock()
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        with self.lock:
+            self.now += seconds
+
+
+class TokenBucketTestCase(TestCase):
+
+    def test_reserve(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=2, capacity=2, clock=clock)
+        self.assertEqual(bucket.reserve(), 0)
+        self.assertEqual(bucket.reserve(), 0)
+        self.assertEqual(bucket.reserve(), 0.5)
+        self.assertEqual(bucket.reserve(), 1.0)
+        clock.now = 1.0
+        self.assertEqual(bucket.reserve(), 0.5)
+
+    def test_reserve_does_not_overfill(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=1, capacity=1, clock=clock)
+        clock.now = 100.0
+        self.assertEqual(bucket.reserve(), 0)
+        self.assertEqual(bucket.reserve(), 1.0)
+
+
+class DeliveryReportTestCase(TestCase):
+
+    def test_percentile(self):
+        report = DeliveryReport(
+            {chat_id: chat_id / 10 for chat_id in range(1, 11)}, {}
+        )
+        self.assertEqual(report.percentile(50), 0.5)
+        self.assertEqual(report.percentile(90), 0.9)
+        self.assertEqual(report.percentile(99), 1.0)
+        self.assertIsNone(DeliveryReport({}, {}).percentile(50))
+
+
+class TelegramSenderTestCase(TestCase):
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.bot = MagicMock()
+        self.clock = FakeClock()
+        self.sender = TelegramSender(
+            self.bot, global_rate=30, chat_rate=1,
+            clock=self.clock, sleep=self.clock.sleep
+        )
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+        self.sender.shutdown()
+
+    def test_send_message_waits_for_chat_limit(self):
+        self.sender.send_message(1, text='a')
+        self.assertEqual(self.clock.now, 0)
+        self.sender.send_message(2, text='b')
+        self.assertEqual(self.clock.now, 0)
+        self.sender.send_message(1, text='c')
+        self.assertEqual(self.clock.now, 1.0)
+        self.assertEqual(self.bot.sendMessage.call_count, 3)
+
+    def test_send_message_waits_for_global_limit(self):
+        for chat_id in range(31):
+            self.sender.send_message(chat_id, text='a')
+        self.assertAlmostEqual(self.clock.now, 1 / 30)
+
+    def test_send_message_retries_after(self):
+        self.bot.sendMessage.side_effect = [RetryAfter(7), 'sent']
+        self.assertEqual(self.sender.send_message(1, text='a'), 'sent')
+        self.assertEqual(self.bot.sendMessage.call_count, 2)
+        self.assertEqual(self.clock.now, 7)
+
+    def test_send_message_gives_up_retrying(self):
+        self.bot.sendMessage.side_effect = RetryAfter(1)
+        with self.assertRaises(RetryAfter):
+            self.sender.send_message(1, text='a')
+        self.assertEqual(self.bot.sendMessage.call_count, 4)
+
+    def test_edit_message(self):
+        self.bot.editMessageText.side_effect = [RetryAfter(2), 'edited']
+        self.sender.send_message(1, text='a')
+        self.assertEqual(
+            self.sender.edit_message(1, 10, text='b'), 'edited'
+        )
+        self.bot.editMessageText.assert_called_with(
+            chat_id=1, message_id=10, text='b'
+        )
+        # One second for the chat limit, two for the retry.
+        self.assertEqual(self.clock.now, 3)
+
+    def test_fan_out_is_concurrent(self):
+        barrier = threading.Barrier(3, timeout=5)
+        report = self.sender.fan_out([1, 2, 3], lambda chat_id: barrier.wait())
+        self.assertFalse(barrier.broken)
+        self.assertEqual(sorted(report.latencies), [1, 2, 3])
+
+    def test_fan_out_collects_errors(self):
+        def send(chat_id):
+            if chat_id == 2:
+                raise Unauthorized()
+            self.sender.send_message(chat_id, text='a')
+
+        report = self.sender.fan_out([1, 2, 3], send)
+        self.assertEqual(sorted(report.latencies), [1, 3])
+        self.assertIsInstance(report.errors[2], Unauthorized)
+        self.assertEqual(self.bot.sendMessage.call_count, 2)
+
+    def test_is_chat_gone(self):
+        self.assertTrue(is_chat_gone(Unauthorized()))
+        self.assertTrue(is_chat_gone(BadRequest('Chat not found')))
+        self.assertFalse(is_chat_gone(BadRequest('Message is too long')))
+        self.assertFalse(is_chat_gone(TimedOut()))
+        self.assertFalse(is_chat_gone(Exception('chat not found')))
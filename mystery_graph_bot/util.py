@@ -1,22 +1,16 @@
 import json
 
-from .errors import SchemaLoadError
+from .fast_schema import load_data_with_schema
 
 
 def load_data_with_schema_from_json_path(schema, path):
     with open(path) as file:
         json_dict = json.load(file)
-    result = schema.load(json_dict)
-    if result.errors:
-        raise SchemaLoadError(type(schema), result.errors)
-    return result.data
+    return load_data_with_schema(schema, json_dict)
 
 def load_data_with_schema_from_string(schema, string):
     json_dict = json.loads(string)
-    result = schema.load(json_dict)
-    if result.errors:
-        raise SchemaLoadError(type(schema), result.errors)
-    return result.data
+    return load_data_with_schema(schema, json_dict)
 
 def path_to_string(path):
     def item_to_str(item):